@@ -0,0 +1,280 @@
+"""Fast loading of measurement data files and overview files for analysis.
+
+Text data files ('.dat') consist of '#' comment lines, a line with the
+column names and space-separated values, possibly with further comment
+lines in between. They are memory-mapped and parsed by pandas' C parser;
+ISO timestamps are converted in bulk to 'datetime64[us]'. Binary data
+directories ('.chunks', see 'data_writer.BinaryColumnSink') are read
+chunk by chunk with numpy.
+
+:usage:
+metadata, data = load_data_file('/data/contacts_I-7--I-8_001.dat')
+print(metadata['settings']['nplc'], data['Current'].mean())
+"""
+import json
+import mmap
+import os
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+COMMENT_CHAR = '#'
+SEPARATOR = ' '
+BINARY_SUFFIX = '.chunks'
+
+# Column header lines written by the registered measurements:
+LAYOUTS = {
+    ('datetime', 'random1', 'random3'): ['DummyMeasurement'],
+    ('Voltage', 'Current'): ['SMU2Probe'],
+    ('Datetime', 'Voltage', 'Current'): ['SMU2ProbeIvt'],
+    ('Datetime', 'Voltage', 'Current', 'T1', 'T2', 'T3'): ['SMUTempSweepIV', 'SMU2ProbeIvTBlue'],
+    ('Datetime', 'Voltage', 'Current', 'GateVoltage', 'GateCurrent',
+     'TemperatureA', 'TemperatureB', 'TemperatureC'): ['SETSGD'],
+    ('Datetime', 'Real', 'Imaginary', 'Amplitude', 'Theta', 'Sensitivity'): ['SRS830Measure'],
+    ('Datetime', 'Real', 'Imaginary', 'Amplitude', 'Theta', 'Sensitivity',
+     'T1', 'T2', 'T3'): ['SRS830RvTBlue'],
+    ('Datetime', 'Field', 'Real', 'Imaginary', 'Amplitude', 'Theta', 'Sensitivity',
+     'T1', 'T2', 'T3'): ['SRS830UvTBlue'],
+    ('Datetime',) + tuple('{}{}'.format(quantity, sample)
+                          for sample in range(1, 6)
+                          for quantity in ('Voltage', 'Current', 'Conductance')):
+        ['Ald2ProbeMultipleSETMonitor'],
+}
+
+_NUMBER = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|[-+]?(?:nan|inf)'
+# "maximum voltage 0.1 V", "nplc 1", "sweep rate 1.0 K/min"
+_KEY_VALUE = re.compile(r'^(?P<key>[A-Za-z][^\d]*?)\s+(?P<value>{})(?:\s+(?P<unit>\S+))?$'.format(_NUMBER))
+# "1000.0 Hz", "9 Time constant", "1e-06 A-max"
+_VALUE_KEY = re.compile(r'^(?P<value>{})\s+(?P<key>\S.*)$'.format(_NUMBER))
+_SECTION = re.compile(r'^Sample\s+\d+$')
+_ISO_TIMESTAMP = re.compile(r'^\d{4}-\d\d-\d\dT\d\d:\d\d')
+
+
+def _number(text: str) -> float:
+    value = float(text)
+    return int(value) if value.is_integer() and re.fullmatch(r'[-+]?\d+', text) else value
+
+
+def parse_header(comment_lines: List[str], column_names: List[str]) -> Dict[str, Any]:
+    """Turn the comment lines of a data file into a metadata dictionary.
+
+    :param comment_lines: Comment lines without the leading comment character
+    :param column_names: Names from the column header line
+    :return: Dictionary with the keys
+             'started' (timestamp of the first comment or None),
+             'settings' (numeric settings, keyed by their description),
+             'units' (units of the settings, where given),
+             'notes' (comment lines that are no setting),
+             'comments' (all comment lines of the header),
+             'columns' and 'measurements' (candidate measurement class names)
+    """
+    metadata = {'started': None, 'settings': {}, 'units': {}, 'notes': [],
+                'comments': list(comment_lines), 'columns': list(column_names),
+                'measurements': LAYOUTS.get(tuple(column_names), [])}
+    section = ''
+
+    for line in comment_lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        if metadata['started'] is None and _ISO_TIMESTAMP.match(line):
+            try:
+                metadata['started'] = datetime.fromisoformat(line)
+                continue
+            except ValueError:
+                pass
+
+        if _SECTION.match(line):
+            section = line + '/'
+            continue
+
+        match = _KEY_VALUE.match(line)
+        if match is not None:
+            key = section + match.group('key').strip()
+            metadata['settings'][key] = _number(match.group('value'))
+            if match.group('unit'):
+                metadata['units'][key] = match.group('unit')
+            continue
+
+        match = _VALUE_KEY.match(line)
+        if match is not None:
+            metadata['settings'][section + match.group('key').strip()] = _number(match.group('value'))
+            continue
+
+        metadata['notes'].append(section + line)
+
+    return metadata
+
+
+def _read_header(file_path: str) -> Tuple[List[str], List[str], int, List[str]]:
+    """Return the leading comment lines, the column names, the number of header lines
+    and the comment lines between the data rows."""
+    with open(file_path, 'rb') as file_handle:
+        if os.fstat(file_handle.fileno()).st_size == 0:
+            return [], [], 0, []
+        with mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            comments = []  # type: List[str]
+            offset = 0
+            comment_char = COMMENT_CHAR.encode()
+            while mapped[offset:offset + 1] == comment_char:
+                end = mapped.find(b'\n', offset)
+                end = len(mapped) if end < 0 else end
+                comments.append(mapped[offset + 1:end].decode(errors='replace').strip())
+                offset = end + 1
+
+            end = mapped.find(b'\n', offset)
+            end = len(mapped) if end < 0 else end
+            column_names = mapped[offset:end].decode(errors='replace').split()
+
+            inline_comments = []  # type: List[str]
+            start = mapped.find(b'\n' + comment_char, end)
+            while start >= 0:
+                end = mapped.find(b'\n', start + 1)
+                end = len(mapped) if end < 0 else end
+                inline_comments.append(mapped[start + 2:end].decode(errors='replace').strip())
+                start = mapped.find(b'\n' + comment_char, end)
+
+    return comments, column_names, len(comments) + 1, inline_comments
+
+
+def _convert_timestamps(data: pd.DataFrame) -> None:
+    """Convert columns of ISO timestamp strings to datetime64 in place."""
+    for name in data.columns:
+        column = data[name]
+        if column.dtype != object or len(column) == 0:
+            continue
+        first = column.iloc[0]
+        if isinstance(first, str) and _ISO_TIMESTAMP.match(first):
+            try:
+                data[name] = column.values.astype('datetime64[us]')
+            except ValueError:
+                pass
+
+
+def load_text_file(file_path: str) -> Tuple[Dict[str, Any], pd.DataFrame]:
+    """Load a '.dat' data file; see 'load_data_file()'."""
+    comments, column_names, header_lines, inline_comments = _read_header(file_path)
+
+    if not column_names:
+        data = pd.DataFrame()
+    else:
+        data = pd.read_csv(file_path, sep=SEPARATOR, header=None, names=column_names,
+                           skiprows=header_lines, comment=COMMENT_CHAR,
+                           memory_map=True, engine='c', skip_blank_lines=True)
+        _convert_timestamps(data)
+
+    metadata = parse_header(comments, column_names)
+    # Comments between the data rows, e.g. "error while collecting data":
+    metadata['inline_comments'] = inline_comments
+    return metadata, data
+
+
+def load_binary_directory(directory: str) -> Tuple[Dict[str, Any], pd.DataFrame]:
+    """Load a '.chunks' data directory; see 'load_data_file()'."""
+    with open(os.path.join(directory, 'header.json')) as header_file:
+        header = json.load(header_file)
+
+    chunk_names = sorted(name for name in os.listdir(directory)
+                         if name.startswith('chunk_') and name.endswith('.npz'))
+    chunks = []
+    for name in chunk_names:
+        with np.load(os.path.join(directory, name)) as chunk:
+            chunks.append({column: chunk[column] for column in chunk.files})
+
+    columns = header['columns']
+    data = pd.DataFrame({column: np.concatenate([chunk[column] for chunk in chunks])
+                         if chunks else np.array([])
+                         for column in columns})
+
+    metadata = parse_header(header['comments'], columns)
+    return metadata, data
+
+
+def load_data_file(path: str) -> Tuple[Dict[str, Any], pd.DataFrame]:
+    """Load a measurement data file written by one of the measurement classes.
+
+    :param path: Path of a '.dat' file or of a '.chunks' directory
+    :return: The metadata from the header (see 'parse_header()') and the data
+             with timestamps as datetime64 columns
+    """
+    if os.path.isdir(path) or path.endswith(BINARY_SUFFIX):
+        return load_binary_directory(path)
+    return load_text_file(path)
+
+
+def load_overview(file_path: str) -> Tuple[List[str], pd.DataFrame]:
+    """Load an overview file (see 'overview.Overview').
+
+    :return: The comment lines and the overview table
+    """
+    comments, _, header_lines, _ = _read_header(file_path)
+    data = pd.read_csv(file_path, sep=SEPARATOR, skiprows=header_lines - 1,
+                       comment=COMMENT_CHAR, quotechar='"', memory_map=True)
+    _convert_timestamps(data)
+    return comments, data
+
+
+def load_text_file_line_by_line(file_path: str) -> Tuple[List[str], List[str], List[List[Any]]]:
+    """Straightforward reference parser, used as a baseline in the benchmark below."""
+    comments, column_names, rows = [], [], []  # type: List[str], List[str], List[List[Any]]
+    with open(file_path) as file_handle:
+        for line in file_handle:
+            if line.startswith(COMMENT_CHAR):
+                comments.append(line[1:].strip())
+            elif not column_names:
+                column_names = line.split()
+            elif line.strip():
+                row = []
+                for value in line.split():
+                    try:
+                        row.append(float(value))
+                    except ValueError:
+                        row.append(datetime.fromisoformat(value))
+                rows.append(row)
+    return comments, column_names, rows
+
+
+if __name__ == '__main__':
+    # Benchmark against a line-by-line parse on a generated file.
+    import sys
+    import tempfile
+    from datetime import timedelta
+    from time import perf_counter
+
+    target_size = int(float(sys.argv[1]) * 1e6) if len(sys.argv) > 1 else 100 * 10 ** 6
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, 'contacts_I-7--I-8_001.dat')
+        start = datetime(2026, 1, 1)
+        with open(file_path, 'w') as file_handle:
+            file_handle.write('# {}\n# benchmark\n# maximum voltage 0.1 V\n'
+                              '# current limit 1e-06 A\n# nplc 1\n'.format(start.isoformat()))
+            file_handle.write('Datetime Voltage Current T1 T2 T3\n')
+            block = 10000
+            index = 0
+            while file_handle.tell() < target_size:
+                values = np.random.normal(size=(block, 5))
+                lines = ['{} {} {} {} {} {}\n'.format(
+                    (start + timedelta(seconds=(index + row) / 10)).isoformat(), *values[row])
+                    for row in range(block)]
+                file_handle.write(''.join(lines))
+                index += block
+
+        size = os.path.getsize(file_path) / 1e6
+
+        begin = perf_counter()
+        metadata, data = load_data_file(file_path)
+        vectorized = perf_counter() - begin
+
+        begin = perf_counter()
+        load_text_file_line_by_line(file_path)
+        line_by_line = perf_counter() - begin
+
+        print('{:.0f} MB, {} rows'.format(size, len(data)))
+        print('vectorized:   {:6.2f} s ({:.0f} MB/s)'.format(vectorized, size / vectorized))
+        print('line by line: {:6.2f} s ({:.0f} MB/s)'.format(line_by_line, size / line_by_line))
+        print('metadata:', metadata['settings'], metadata['measurements'])
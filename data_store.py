@@ -0,0 +1,193 @@
+"""Growable columnar storage for live measurement data."""
+from datetime import datetime
+from typing import Dict, List, Mapping, Sequence, Union
+
+import numpy as np
+
+from measurement.measurement import (AbstractValue, BooleanValue, DatetimeValue,
+                                     FloatValue, IntegerValue)
+
+
+class DataStore:
+    """Append-only column store which is typed by a measurement's 'outputs()'.
+
+    Every column is a preallocated numpy array whose capacity doubles when it
+    is exhausted, so appending a data point costs amortised O(1) regardless of
+    how many points have been recorded. Columns of 'DatetimeValue' outputs are
+    stored as native 'datetime64[us]'.
+
+    Readers get views of the filled part of a column via 'column()'. Views do
+    not copy; a view taken before the store grows keeps pointing at the old
+    buffer and therefore still shows the data as it was at that moment.
+
+    Attributes:
+        _columns: Column buffers by output name (full capacity)
+        _length: Number of filled rows
+    """
+
+    INITIAL_CAPACITY = 1024
+
+    # Fill values for rows in which a column did not receive a value:
+    MISSING = {np.dtype('float64'): np.nan,
+               np.dtype('datetime64[us]'): np.datetime64('NaT'),
+               np.dtype('int64'): 0,
+               np.dtype('bool'): False,
+               np.dtype('object'): None}
+
+    def __init__(self, outputs: Mapping[str, AbstractValue],
+                 initial_capacity: int = INITIAL_CAPACITY) -> None:
+        """
+        :param outputs: The dictionary returned by a measurement's 'outputs()'
+        :param initial_capacity: Number of rows to allocate before the first growth
+        """
+        self._capacity = max(1, initial_capacity)
+        self._length = 0
+        self._columns = dict()  # type: Dict[str, np.ndarray]
+
+        for name, value in outputs.items():
+            self._add_column(name, self.dtype_for(value))
+
+    @staticmethod
+    def dtype_for(value: AbstractValue) -> np.dtype:
+        """Return the numpy dtype used to store an output of type 'value'."""
+        if isinstance(value, DatetimeValue):
+            return np.dtype('datetime64[us]')
+        elif isinstance(value, BooleanValue):
+            return np.dtype('bool')
+        elif isinstance(value, IntegerValue):
+            return np.dtype('int64')
+        elif isinstance(value, FloatValue):
+            return np.dtype('float64')
+        else:
+            return np.dtype('object')
+
+    @staticmethod
+    def _dtype_for_python_value(value) -> np.dtype:
+        """Guess a column dtype for a value of a column that is not in 'outputs()'."""
+        if isinstance(value, (datetime, np.datetime64)):
+            return np.dtype('datetime64[us]')
+        elif isinstance(value, (int, float, np.number)) and not isinstance(value, bool):
+            return np.dtype('float64')
+        else:
+            return np.dtype('object')
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def column_names(self) -> List[str]:
+        return list(self._columns.keys())
+
+    def dtype(self, name: str) -> np.dtype:
+        return self._columns[name].dtype
+
+    def column(self, name: str) -> np.ndarray:
+        """Return a zero-copy view of the filled part of a column."""
+        return self._columns[name][:self._length]
+
+    def columns(self, names: Sequence[str]) -> List[np.ndarray]:
+        """Return zero-copy views of several columns."""
+        return [self.column(name) for name in names]
+
+    def append(self, row: Mapping[str, Union[int, float, bool, str, datetime]]) -> None:
+        """Append one data point as emitted by 'SignalInterface.emit_data()'.
+
+        Columns missing from 'row' are filled with NaN/NaT. Keys which are
+        not yet columns get a new column.
+        """
+        self._add_unknown_columns(row)
+        self._reserve(self._length + 1)
+
+        index = self._length
+        for name, column in self._columns.items():
+            if name in row:
+                column[index] = self._convert(row[name], column.dtype)
+            else:
+                column[index] = self.MISSING[column.dtype]
+
+        self._length += 1
+
+    def extend(self, columns: Mapping[str, Sequence]) -> None:
+        """Append a batch of data points as emitted by 'SignalInterface.emit_data_batch()'.
+
+        :param columns: Equally long columns (lists or numpy arrays) by output name.
+                        'None' entries and missing columns are filled with NaN/NaT.
+        """
+        lengths = {len(values) for values in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError('Columns of a batch differ in length: {}'.format(
+                {name: len(values) for name, values in columns.items()}))
+        if not lengths or lengths == {0}:
+            return
+
+        number_of_rows = lengths.pop()
+        self._add_unknown_columns({name: self._first_value(values)
+                                   for name, values in columns.items()})
+        self._reserve(self._length + number_of_rows)
+
+        start, end = self._length, self._length + number_of_rows
+        for name, column in self._columns.items():
+            if name in columns:
+                column[start:end] = self._convert_many(columns[name], column.dtype)
+            else:
+                column[start:end] = self.MISSING[column.dtype]
+
+        self._length = end
+
+    @staticmethod
+    def _first_value(values: Sequence):
+        for value in values:
+            if value is not None:
+                return value
+        return None
+
+    @staticmethod
+    def _convert_many(values: Sequence, dtype: np.dtype) -> np.ndarray:
+        if dtype == np.dtype('object'):
+            converted = np.empty(len(values), dtype=object)
+            converted[:] = list(values)
+            return converted
+        if dtype == np.dtype('int64') or dtype == np.dtype('bool'):
+            missing = DataStore.MISSING[dtype]
+            values = [missing if value is None else value for value in values]
+        return np.asarray(values, dtype=dtype)
+
+    def _add_unknown_columns(self, row: Mapping) -> None:
+        for name, value in row.items():
+            if name not in self._columns:
+                self._add_column(name, self._dtype_for_python_value(value))
+
+    def _add_column(self, name: str, dtype: np.dtype) -> None:
+        column = np.empty(self._capacity, dtype=dtype)
+        column[:self._length] = self.MISSING[dtype]
+        self._columns[name] = column
+
+    def _reserve(self, length: int) -> None:
+        """Make sure there is room for 'length' rows, doubling the capacity if not."""
+        if length <= self._capacity:
+            return
+
+        capacity = self._capacity
+        while capacity < length:
+            capacity *= 2
+
+        for name, column in self._columns.items():
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self._length] = column[:self._length]
+            self._columns[name] = grown
+
+        self._capacity = capacity
+
+    @staticmethod
+    def _convert(value, dtype: np.dtype):
+        if value is None:
+            return DataStore.MISSING[dtype]
+        if dtype == np.dtype('datetime64[us]'):
+            return np.datetime64(value, 'us')
+        return value
+
+    def to_dataframe(self):
+        """Return a copy of the store as a pandas DataFrame."""
+        import pandas as pd
+
+        return pd.DataFrame({name: self.column(name).copy() for name in self._columns})
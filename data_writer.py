@@ -0,0 +1,401 @@
+"""Buffered writing of measurement data files on a background thread."""
+import atexit
+import json
+import os
+from collections import deque
+from datetime import datetime
+from threading import Event, Thread
+from time import monotonic
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+def format_value(value: Any) -> str:
+    """Format a value for a text data file: 'datetime' in ISO format, everything else with 'str()'."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def rows_of(columns: Sequence[Any]) -> List[tuple]:
+    """Turn equally long columns into rows; a column which is a single value is repeated in every row.
+
+    numpy arrays are converted to Python values first, so they are formatted like single values.
+    """
+    length = max((len(column) for column in columns if _is_column(column)), default=0)
+    lists = [column.tolist() if isinstance(column, np.ndarray) else
+             column if _is_column(column) else
+             [column] * length
+             for column in columns]
+    return list(zip(*lists))
+
+
+def _is_column(value: Any) -> bool:
+    return isinstance(value, (list, tuple, np.ndarray))
+
+
+class TextSink:
+    """Writes the legacy space-separated '.dat' text format."""
+
+    SEPARATOR = ' '
+
+    def __init__(self, file_path: str) -> None:
+        self._file = open(file_path, 'w')
+
+    def write_text(self, text: str) -> int:
+        self._file.write(text)
+        return len(text)
+
+    def write_row(self, values: Sequence[Any]) -> int:
+        return self.write_text(self.SEPARATOR.join(map(format_value, values)) + '\n')
+
+    def write_rows(self, rows: Sequence[Sequence[Any]]) -> int:
+        return self.write_text(''.join(self.SEPARATOR.join(map(format_value, values)) + '\n' for values in rows))
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def sync(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        try:
+            self.sync()
+        finally:
+            self._file.close()
+
+
+class BinaryColumnSink:
+    """Writes data as compressed binary columns into a directory of chunks.
+
+    The directory contains 'header.json' with the comment lines, column names
+    and dtypes, and numbered 'chunk_NNNNNN.npz' files with one array per
+    column ('numpy.savez_compressed'). Timestamps are stored as
+    'datetime64[us]'. Every file is replaced atomically, so the directory is
+    readable at any time. A chunk is compressed once, when it is full or the
+    sink is closed; until then every flush rewrites it uncompressed
+    ('numpy.savez'), which costs one copy of at most 'chunk_rows' rows.
+
+    The dtype of a column follows its first value. A later value which does
+    not fit widens the column instead of failing: a bool column with other
+    values becomes a float column, any other mismatch turns the column into
+    text from that chunk on. 'None' is stored as 'nan' in float columns.
+
+    The sink understands the text written by the header code of the
+    measurements: lines starting with '#' are kept as comments, the first
+    other line holds the column names.
+    """
+
+    HEADER_FILE_NAME = 'header.json'
+    CHUNK_FILE_NAME = 'chunk_{:06d}.npz'
+    COMMENT_CHAR = '#'
+
+    def __init__(self, directory: str, chunk_rows: int = 16384) -> None:
+        """
+        :param directory: Directory to create for the chunk files
+        :param chunk_rows: Number of rows per chunk file
+        """
+        os.makedirs(directory)
+        self._directory = directory
+        self._chunk_rows = chunk_rows
+
+        self._comments = []  # type: List[str]
+        self._column_names = None  # type: Optional[List[str]]
+        self._dtypes = None  # type: Optional[List[np.dtype]]
+        self._dtype_strings = []  # type: List[str]
+        self._pending_text = ''
+
+        self._rows = []  # type: List[Sequence[Any]]
+        self._chunk_index = 0
+        self._rows_written = 0
+        self._dirty = False
+
+    def write_text(self, text: str) -> int:
+        self._pending_text += text
+        *lines, self._pending_text = self._pending_text.split('\n')
+        for line in lines:
+            self._handle_line(line)
+        return len(text)
+
+    def _handle_line(self, line: str) -> None:
+        if line.startswith(self.COMMENT_CHAR):
+            # Comments after the first data row are kept with their position:
+            comment = line[len(self.COMMENT_CHAR):].strip()
+            if self._rows_written or self._rows:
+                comment = '[row {}] {}'.format(self._rows_written + len(self._rows), comment)
+            self._comments.append(comment)
+            self._dirty = True
+        elif self._column_names is None:
+            self._column_names = line.split()
+            self._dirty = True
+        elif line.strip():
+            # A data line that was written as plain text:
+            self.write_row([self._parse(value) for value in line.split()])
+
+    @staticmethod
+    def _parse(value: str) -> Any:
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return value
+
+    def write_row(self, values: Sequence[Any]) -> int:
+        self._rows.append(values)
+        self._dirty = True
+        if len(self._rows) >= self._chunk_rows:
+            self._write_chunk()
+            self._rows_written += len(self._rows)
+            self._rows = []
+            self._chunk_index += 1
+            self._write_header()
+        return 8 * len(values)
+
+    def write_rows(self, rows: Sequence[Sequence[Any]]) -> int:
+        written = 0
+        while rows:
+            head, rows = rows[:self._chunk_rows - len(self._rows)], rows[self._chunk_rows - len(self._rows):]
+            self._rows.extend(head[:-1])
+            # The last row of the piece completes the chunk if it is full:
+            written += len(head) * self.write_row(head[-1])
+        return written
+
+    def _columns_of(self, rows: List[Sequence[Any]]) -> List[np.ndarray]:
+        if self._dtypes is None:
+            self._dtypes = [self._dtype_for(value) for value in rows[0]]
+            names = list(self._column_names or [])
+            # Make the names match the number of values per row:
+            names += ['column{}'.format(index) for index in range(len(names), len(self._dtypes))]
+            self._column_names = names[:len(self._dtypes)]
+
+        return [self._column_of(index, [row[index] for row in rows]) for index in range(len(self._dtypes))]
+
+    def _column_of(self, index: int, values: List[Any]) -> np.ndarray:
+        dtype = self._dtypes[index]
+        if dtype == np.dtype('bool') and not all(isinstance(value, (bool, np.bool_)) for value in values):
+            # numpy would silently turn None, nan and text into True or False:
+            dtype = self._dtypes[index] = np.dtype('float64')
+        try:
+            return np.array(values, dtype=dtype)
+        except (TypeError, ValueError):
+            pass
+        print('WARNING', 'Column "{}" is written as text from row {} on: values do not fit {}'
+              .format(self._column_names[index], self._rows_written, dtype))
+        self._dtypes[index] = np.dtype('U')
+        return np.array([format_value(value) for value in values], dtype=self._dtypes[index])
+
+    @staticmethod
+    def _dtype_for(value: Any) -> np.dtype:
+        if isinstance(value, (datetime, np.datetime64)):
+            return np.dtype('datetime64[us]')
+        elif isinstance(value, (bool, np.bool_)):
+            return np.dtype('bool')
+        elif isinstance(value, (int, float, np.number)):
+            return np.dtype('float64')
+        return np.dtype('U')
+
+    def _write_chunk(self, compressed: bool = True) -> None:
+        """Write the rows of the current chunk, replacing an earlier version of it."""
+        if not self._rows:
+            return
+        columns = self._columns_of(self._rows)
+        self._dtype_strings = [column.dtype.str for column in columns]
+        path = os.path.join(self._directory, self.CHUNK_FILE_NAME.format(self._chunk_index))
+        with open(path + '.tmp', 'wb') as chunk_file:
+            (np.savez_compressed if compressed else np.savez)(chunk_file, **dict(zip(self._column_names, columns)))
+        os.replace(path + '.tmp', path)
+
+    def _write_header(self) -> None:
+        header = {'comments': self._comments,
+                  'columns': self._column_names or [],
+                  'dtypes': self._dtype_strings,
+                  'rows': self._rows_written + len(self._rows)}
+        path = os.path.join(self._directory, self.HEADER_FILE_NAME)
+        with open(path + '.tmp', 'w') as header_file:
+            json.dump(header, header_file, indent=1)
+        os.replace(path + '.tmp', path)
+
+    def flush(self) -> None:
+        if self._dirty:
+            # The chunk is not full yet and will be rewritten; compressing it every time costs too much:
+            self._write_chunk(compressed=False)
+            self._write_header()
+            self._dirty = False
+
+    def sync(self) -> None:
+        self.flush()
+
+    def close(self) -> None:
+        if self._pending_text:
+            self._handle_line(self._pending_text)
+            self._pending_text = ''
+        self._write_chunk()
+        self._write_header()
+        self._dirty = False
+
+
+class AsyncDataWriter:
+    """File-like object which formats and writes measurement rows on a background thread.
+
+    The acquisition thread only appends to a queue ('collections.deque', whose
+    appends and pops are atomic and need no lock), so slow file systems do not
+    delay the next instrument read. The background thread hands the queued
+    data to its sinks ('TextSink', 'BinaryColumnSink') and flushes them
+    whenever 'flush_interval' seconds have passed or 'flush_bytes' bytes are
+    pending.
+
+    'write_rows()' queues a whole block of rows, given as columns, in one go.
+    Besides 'write_row()', the writer supports 'write()' and 'print(..., file=...)'
+    so header code written for plain file handles keeps working. 'flush()' is
+    only a hint and returns immediately; use 'sync()' to wait until all data
+    is on disk. Closing the writer (also done at interpreter exit) writes,
+    flushes and fsyncs everything that was queued.
+    """
+
+    def __init__(self, sinks: List[Any], flush_interval: float = 1.0,
+                 flush_bytes: int = 64 * 1024) -> None:
+        """
+        :param sinks: Objects which write the data to disk, e.g. a 'TextSink'
+        :param flush_interval: Maximum time in seconds before written data is flushed
+        :param flush_bytes: Number of unflushed bytes which trigger a flush
+        """
+        self._sinks = sinks
+        self._flush_interval = flush_interval
+        self._flush_bytes = flush_bytes
+
+        self._queue = deque()  # type: deque
+        self._wake = Event()
+        self._synced = Event()
+        self._closing = False
+        self._closed = False
+        self._error = None  # type: Optional[BaseException]
+
+        self._thread = Thread(target=self._run, name='data writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def __enter__(self) -> 'AsyncDataWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+            return
+        # The exception of the measurement is the one to report; an error of the writer must not replace it:
+        try:
+            self.close()
+        except BaseException as error:
+            print('WARNING', 'Data writer failed while handling {}: {!r}'.format(exc_type.__name__, error))
+
+    def write(self, text: str) -> int:
+        """Queue a piece of text, e.g. a header line."""
+        self._check_state()
+        self._queue.append(text)
+        return len(text)
+
+    def write_row(self, *values: Any) -> None:
+        """Queue one data row; it is formatted on the writer thread.
+
+        In text files, 'datetime' values are written in ISO format, everything
+        else with 'str()'.
+        """
+        self._check_state()
+        self._queue.append(values)
+
+    def write_rows(self, *columns: Any) -> None:
+        """Queue a block of rows given as equally long columns, e.g. numpy arrays.
+
+        A column which is a single value instead of a list or an array is
+        repeated in every row. The rows are formatted like those of
+        'write_row()'.
+        """
+        self._check_state()
+        self._queue.append(list(columns))
+
+    def flush(self) -> None:
+        """Does not block; queued data is flushed within 'flush_interval'."""
+        self._check_state()
+
+    def sync(self) -> None:
+        """Block until everything queued so far is written, flushed and fsynced."""
+        self._check_state()
+        self._synced.clear()
+        self._queue.append(self._SYNC)
+        self._wake.set()
+        self._synced.wait()
+        self._check_state()
+
+    def close(self) -> None:
+        """Write everything that is still queued and close all sinks."""
+        if self._closed:
+            return
+        self._closing = True
+        self._wake.set()
+        self._thread.join()
+        self._closed = True
+        atexit.unregister(self.close)
+        if self._error is not None:
+            raise self._error
+
+    # Marker in the queue which asks the writer thread to fsync:
+    _SYNC = object()
+
+    def _check_state(self) -> None:
+        if self._error is not None:
+            raise self._error
+        if self._closing:
+            raise ValueError('Data writer is closed.')
+
+    def _run(self) -> None:
+        unflushed = 0
+        last_flush = monotonic()
+        try:
+            while True:
+                self._wake.wait(min(self._flush_interval, 0.1))
+                self._wake.clear()
+                closing = self._closing
+
+                while self._queue:
+                    item = self._queue.popleft()
+                    if item is self._SYNC:
+                        for sink in self._sinks:
+                            sink.sync()
+                        unflushed = 0
+                        last_flush = monotonic()
+                        self._synced.set()
+                        continue
+                    if isinstance(item, list):
+                        rows = rows_of(item)
+                        for sink in self._sinks:
+                            unflushed += sink.write_rows(rows)
+                        continue
+                    for sink in self._sinks:
+                        if isinstance(item, tuple):
+                            unflushed += sink.write_row(item)
+                        else:
+                            unflushed += sink.write_text(item)
+
+                if unflushed and (unflushed >= self._flush_bytes
+                                  or monotonic() - last_flush >= self._flush_interval):
+                    for sink in self._sinks:
+                        sink.flush()
+                    unflushed = 0
+                    last_flush = monotonic()
+
+                if closing:
+                    break
+        except BaseException as error:
+            self._error = error
+            self._synced.set()
+        finally:
+            for sink in self._sinks:
+                try:
+                    sink.close()
+                except BaseException as error:
+                    if self._error is None:
+                        self._error = error
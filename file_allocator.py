@@ -0,0 +1,214 @@
+"""Allocation of numbered file names ('{prefix}NNN{suffix}') in data directories.
+
+Scanning a data directory with tens of thousands of files for the highest
+number is slow, so every directory gets a small index file which remembers
+the last number handed out per file prefix. Numbers are claimed by creating
+the file exclusively, so two runs which start at the same time - in this or
+in another process - never get the same file.
+
+The index is only a hint: if it is missing, unreadable or wrong (a file with
+the next number already exists), the directory is scanned once and the index
+is rebuilt.
+
+:usage:
+file_path = FileAllocator.for_directory('/data').allocate('contacts_I-7--I-8_')
+"""
+import json
+import os
+from threading import Lock
+from typing import Dict, Iterable, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: exclusive create alone still prevents collisions
+    fcntl = None
+
+
+class FileAllocator:
+    """Hands out file numbers of one directory.
+
+    Attributes:
+        _counters: Last allocated number per counter key, as cached from the index
+        _index_mtime: Modification time of the index file when it was last read or
+                      written by this process; used to skip re-reading an unchanged index
+    """
+
+    INDEX_FILE_NAME = '.dasmess_index.json'
+    LOCK_FILE_NAME = '.dasmess_index.lock'
+    INDEX_VERSION = 1
+    MIN_DIGITS = 3
+    # Give up after this many taken numbers in a row following a rescan:
+    MAX_ATTEMPTS = 1000
+
+    _instances = dict()  # type: Dict[str, FileAllocator]
+    _instances_lock = Lock()
+
+    @classmethod
+    def for_directory(cls, directory: str) -> 'FileAllocator':
+        """Return the shared allocator of 'directory'."""
+        directory = os.path.abspath(directory)
+        with cls._instances_lock:
+            if directory not in cls._instances:
+                cls._instances[directory] = cls(directory)
+            return cls._instances[directory]
+
+    def __init__(self, directory: str) -> None:
+        self._directory = directory
+        self._index_path = os.path.join(directory, self.INDEX_FILE_NAME)
+        self._lock_path = os.path.join(directory, self.LOCK_FILE_NAME)
+        self._lock = Lock()
+        self._counters = dict()  # type: Dict[str, int]
+        self._index_mtime = None  # type: Optional[int]
+
+    def allocate(self, file_prefix: str, file_suffix: str = '.dat',
+                 reserved_suffixes: Tuple[str, ...] = (), create: bool = True) -> str:
+        """Create an empty file '{file_prefix}NNN{file_suffix}' with the next free number.
+
+        :param file_prefix: The beginning of the file name
+        :param file_suffix: The end of the file name
+        :param reserved_suffixes: Files and directories with these suffixes share the
+                                  numbers, i.e. a number is only free if none of
+                                  '{file_prefix}NNN{suffix}' exists
+        :param create: If False, the file is not created, e.g. for files which are only
+                       written at the end of a run; then only the index reserves the
+                       number, which a process with a stale index may hand out again
+        :return: Full path of the new file
+        """
+        suffixes = (file_suffix,) + tuple(reserved_suffixes)
+        key = '{}|{}'.format(file_prefix, ','.join(suffixes))
+
+        with self._lock, self._interprocess_lock():
+            self._load_index()
+            if key not in self._counters:
+                self._counters[key] = self._scan(file_prefix, suffixes)
+
+            rescanned = False
+            attempts = 0
+            while True:
+                number = self._counters[key] + 1
+                file_path = self._file_path(file_prefix, number, file_suffix)
+                if self._claim(file_path, file_prefix, number, reserved_suffixes, create):
+                    self._counters[key] = number
+                    break
+
+                if not rescanned:
+                    # The index is stale, e.g. files were copied in by hand.
+                    self._counters[key] = max(number, self._scan(file_prefix, suffixes))
+                    rescanned = True
+                else:
+                    # Somebody without the lock took the number; try the next one.
+                    self._counters[key] = number
+                    attempts += 1
+                    if attempts >= self.MAX_ATTEMPTS:
+                        raise FileExistsError('No free file number for {} in {}.'.format(
+                            file_prefix, self._directory))
+
+            self._save_index()
+
+        return file_path
+
+    def rescan(self) -> None:
+        """Forget the index and rebuild it with the next allocations."""
+        with self._lock, self._interprocess_lock():
+            self._counters = dict()
+            self._save_index()
+
+    def _file_path(self, file_prefix: str, number: int, suffix: str) -> str:
+        return os.path.join(self._directory, '{prefix}{number:0{digits}d}{suffix}'.format(
+            prefix=file_prefix, number=number, digits=self.MIN_DIGITS, suffix=suffix))
+
+    def _claim(self, file_path: str, file_prefix: str, number: int,
+               reserved_suffixes: Iterable[str], create: bool = True) -> bool:
+        for suffix in reserved_suffixes:
+            if os.path.exists(self._file_path(file_prefix, number, suffix)):
+                return False
+        if not create:
+            return not os.path.exists(file_path)
+        try:
+            open(file_path, 'x').close()
+        except FileExistsError:
+            return False
+        return True
+
+    def _scan(self, file_prefix: str, suffixes: Tuple[str, ...]) -> int:
+        """Return the highest number of the files '{file_prefix}NNN{suffix}', or 0."""
+        last_number = 0
+        with os.scandir(self._directory) as entries:
+            for entry in entries:
+                name = entry.name
+                if not name.startswith(file_prefix):
+                    continue
+                for suffix in suffixes:
+                    if name.endswith(suffix):
+                        digits = name[len(file_prefix):len(name) - len(suffix)]
+                        if len(digits) >= self.MIN_DIGITS and digits.isdigit():
+                            last_number = max(last_number, int(digits))
+        return last_number
+
+    def _load_index(self) -> None:
+        try:
+            mtime = os.stat(self._index_path).st_mtime_ns
+        except FileNotFoundError:
+            self._counters = dict()
+            self._index_mtime = None
+            return
+
+        if mtime == self._index_mtime:
+            return  # Nobody else wrote to the index since we last did.
+
+        try:
+            with open(self._index_path) as index_file:
+                index = json.load(index_file)
+            if index.get('version') != self.INDEX_VERSION:
+                raise ValueError('unknown index version {}'.format(index.get('version')))
+            self._counters = {str(key): int(value) for key, value in index['counters'].items()}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as error:
+            print('WARNING', 'Ignoring file index {}: {}'.format(self._index_path, error))
+            self._counters = dict()
+        self._index_mtime = mtime
+
+    def _save_index(self) -> None:
+        temporary_path = '{}.{}.tmp'.format(self._index_path, os.getpid())
+        try:
+            with open(temporary_path, 'w') as index_file:
+                json.dump({'version': self.INDEX_VERSION, 'counters': self._counters},
+                          index_file, indent=1, sort_keys=True)
+            os.replace(temporary_path, self._index_path)
+            self._index_mtime = os.stat(self._index_path).st_mtime_ns
+        except OSError as error:
+            # Numbers stay unique without the index, only the next start is slower.
+            print('WARNING', 'Could not write file index {}: {}'.format(self._index_path, error))
+            self._index_mtime = None
+
+    def _interprocess_lock(self) -> '_FileLock':
+        return _FileLock(self._lock_path)
+
+
+class _FileLock:
+    """Exclusive 'flock' on a lock file; does nothing where 'fcntl' is not available."""
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._file = None
+
+    def __enter__(self) -> '_FileLock':
+        if fcntl is not None:
+            try:
+                self._file = open(self._path, 'a')
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            except OSError as error:
+                print('WARNING', 'Could not lock {}: {}'.format(self._path, error))
+                self._close()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if self._file is not None:
+            try:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            finally:
+                self._close()
+
+    def _close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1 @@
+"""Shared access to the laboratory instruments used by the measurement methods."""
@@ -0,0 +1,157 @@
+"""Binary transfer of sourcemeter buffers.
+
+In ASCII, a reading takes about 14 bytes on the bus ('-1.234567e-09,')
+and is parsed one float at a time. The Keithley sourcemeters can send
+readings as IEEE-754 floats instead, 4 ('real32') or 8 ('real64') bytes
+each, which 'numpy.frombuffer' turns into an array without parsing:
+
+* 2400: ':FORM:DATA SREAL' or ':FORM:DATA REAL,64' with ':FORM:BORD SWAP',
+* 2602A/2636A: 'format.data = format.REAL32' or 'format.REAL64' with
+  'format.byteorder = format.LITTLEENDIAN', which 'printbuffer()' uses.
+
+Both answer with an IEEE 488.2 block: '#0' (or '#' followed by the
+number of length digits and the length) and the floats, then the
+termination character. The drivers of 'scientificdevices' parse ASCII, so
+the format is switched only around a buffer dump and back afterwards.
+
+:usage:
+with scpi_format(resource, 'real64'):
+    values = read_values(resource, ':READ?', count, 'real64')
+"""
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+import numpy as np
+
+# Format name -> numpy dtype of the values; 'ascii' is parsed as text:
+FORMATS = {'ascii': None, 'real32': '<f4', 'real64': '<f8'}
+# Keeps every digit the instruments send. 'real32' halves the bytes on the bus but
+# keeps only about 7 significant digits; pass it where the bus is the bottleneck:
+DEFAULT_FORMAT = 'real64'
+
+SCPI_FORMATS = {'ascii': ':FORM:DATA ASC', 'real32': ':FORM:DATA SREAL', 'real64': ':FORM:DATA REAL,64'}
+TSP_FORMATS = {'ascii': 'format.data = format.ASCII', 'real32': 'format.data = format.REAL32',
+               'real64': 'format.data = format.REAL64'}
+
+# Sent by the instruments after a binary block:
+TERMINATOR = b'\n'
+
+
+def _check(data_format: str) -> None:
+    if data_format not in FORMATS:
+        raise ValueError('Data format "{}" not known, use one of {}.'.format(data_format, sorted(FORMATS)))
+
+
+@contextmanager
+def scpi_format(resource: Any, data_format: str = DEFAULT_FORMAT) -> Iterator[None]:
+    """Switch a 2400 to a data format, and back to ASCII afterwards."""
+    _check(data_format)
+    if data_format == 'ascii':
+        yield
+        return
+    resource.write(SCPI_FORMATS[data_format])
+    resource.write(':FORM:BORD SWAP')
+    try:
+        yield
+    finally:
+        resource.write(SCPI_FORMATS['ascii'])
+
+
+@contextmanager
+def tsp_format(resource: Any, data_format: str = DEFAULT_FORMAT) -> Iterator[None]:
+    """Switch a 2602A/2636A to a data format, and back to ASCII afterwards."""
+    _check(data_format)
+    if data_format == 'ascii':
+        yield
+        return
+    resource.write(TSP_FORMATS[data_format])
+    resource.write('format.byteorder = format.LITTLEENDIAN')
+    try:
+        yield
+    finally:
+        resource.write(TSP_FORMATS['ascii'])
+
+
+def parse_ascii(answer: str) -> np.ndarray:
+    """Parse comma (or semicolon) separated readings."""
+    return np.array([float(value) for value in answer.replace(';', ',').split(',') if value.strip()])
+
+
+def read_block(resource: Any, count: int, dtype: str) -> np.ndarray:
+    """Read an IEEE 488.2 block of 'count' floats and its termination."""
+    header = resource.read_bytes(2)
+    if header[:1] != b'#':
+        raise ValueError('Expected a binary block, got {!r}.'.format(header))
+    digits = int(header[1:2])
+    if digits:
+        length = int(resource.read_bytes(digits))
+    else:
+        length = count * np.dtype(dtype).itemsize
+    data = resource.read_bytes(length)
+    resource.read_bytes(len(TERMINATOR))
+    return np.frombuffer(data, dtype=dtype)
+
+
+def read_values(resource: Any, query: str, count: int, data_format: str = DEFAULT_FORMAT) -> np.ndarray:
+    """Send a query which dumps 'count' readings and return them as 'float64' array.
+
+    The instrument must already send 'data_format', see 'scpi_format()' and 'tsp_format()'.
+    """
+    _check(data_format)
+    if data_format == 'ascii':
+        return parse_ascii(resource.query(query))
+    resource.write(query)
+    return read_block(resource, count, FORMATS[data_format]).astype(np.float64)
+
+
+if __name__ == '__main__':
+    from time import perf_counter, sleep
+
+    READINGS = 100000
+    BUS_RATE = 1e6  # bytes per second, about a fast GPIB transfer
+
+    class ScriptedSourcemeter:
+        """Stands in for the VISA resource of a 2602A: answers 'printbuffer()' in the selected format."""
+
+        def __init__(self, readings: np.ndarray) -> None:
+            self._readings = readings
+            self._format = 'ascii'
+            self._pending = b''
+            self.timeout = 2000
+
+        def _send(self, data: bytes) -> bytes:
+            # Time on the bus:
+            sleep(len(data) / BUS_RATE)
+            return data
+
+        def write(self, message: str) -> None:
+            for data_format, command in TSP_FORMATS.items():
+                if message == command:
+                    self._format = data_format
+            if message.startswith('printbuffer'):
+                if self._format == 'ascii':
+                    self._pending = ', '.join('{:.6e}'.format(value) for value in self._readings).encode() + b'\n'
+                else:
+                    self._pending = b'#0' + self._readings.astype(FORMATS[self._format]).tobytes() + TERMINATOR
+
+        def read_bytes(self, count: int) -> bytes:
+            data, self._pending = self._pending[:count], self._pending[count:]
+            return self._send(data)
+
+        def query(self, message: str) -> str:
+            self.write(message)
+            data, self._pending = self._pending, b''
+            return self._send(data).decode().rstrip()
+
+    readings = np.random.default_rng(0).normal(1e-9, 1e-10, READINGS)
+    resource = ScriptedSourcemeter(readings)
+    query = 'printbuffer(1, {}, smua.nvbuffer1.readings)'.format(READINGS)
+
+    for data_format in ('ascii', 'real32', 'real64'):
+        start = perf_counter()
+        with tsp_format(resource, data_format):
+            values = read_values(resource, query, READINGS, data_format)
+        seconds = perf_counter() - start
+        error = np.max(np.abs(values - readings) / np.abs(readings))
+        print('{:>6}: {:.3f} s, {:.0f} readings/s, max. relative error {:.1e}'.format(
+            data_format, seconds, READINGS / seconds, error))
@@ -0,0 +1,309 @@
+"""Locks which serialise access to shared instruments and GPIB buses.
+
+Several measurements and background samplers may talk to the same
+instrument, e.g. both channels of a 2636A or the ITC503 at address 24. Each
+device key has a re-entrant 'FairLock' which is granted in the order it was
+requested, so a fast polling loop cannot starve a slow measurement. A
+transaction, i.e. a write and the matching read, additionally holds the lock
+of its bus.
+
+'LockedResource' runs every single I/O call as a transaction. A driver
+which writes a query and reads the answer in two calls needs the locks for
+the whole method call; 'LockedDriver' holds them that way.
+
+Locks are always taken device first, bus second. A thread that holds a
+device lock for a longer sequence of commands must not wait for another
+device's lock while holding a bus lock.
+
+:usage:
+with LockManager.instance().transaction(('gpib', 0, 24)):
+    device.write('R1')
+    answer = device.read()
+"""
+import re
+from contextlib import contextmanager
+from threading import Condition, Lock, get_ident
+from time import monotonic, perf_counter
+from typing import Any, Dict, Hashable, Iterator, Optional, Set
+
+# Waiting longer than this for a lock is reported (seconds):
+SLOW_WAIT = 1.0
+
+_VISA_GPIB_ADDRESS = re.compile(r'GPIB(\d*)::(\d+)(?:::\d+)?::INSTR$', re.IGNORECASE)
+
+
+def visa_lock_key(address: str) -> Hashable:
+    """Return the device key of a VISA address; GPIB addresses share keys with linux-gpib.
+
+    'GPIB0::24::INSTR' -> ('gpib', 0, 24)
+    """
+    match = _VISA_GPIB_ADDRESS.match(address)
+    if match is None:
+        return ('visa', address)
+    return ('gpib', int(match.group(1) or 0), int(match.group(2)))
+
+
+def bus_key(device_key: Hashable) -> Optional[Hashable]:
+    """Return the bus of a device key, or None if the device has a bus of its own."""
+    if isinstance(device_key, tuple) and len(device_key) == 3 and device_key[0] == 'gpib':
+        return device_key[:2]
+    return None
+
+
+class LockStats:
+    """Number of acquisitions and time spent waiting for one lock."""
+
+    def __init__(self) -> None:
+        self.acquisitions = 0
+        self.contended = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait: float, contended: bool) -> None:
+        self.acquisitions += 1
+        if contended:
+            self.contended += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def summary(self) -> Dict[str, float]:
+        return {'acquisitions': self.acquisitions,
+                'contended': self.contended,
+                'timeouts': self.timeouts,
+                'total_wait': self.total_wait,
+                'mean_wait': self.total_wait / self.contended if self.contended else 0.0,
+                'max_wait': self.max_wait}
+
+
+class FairLock:
+    """Re-entrant lock which is granted first come, first served.
+
+    Every thread that has to wait draws a ticket; the lock passes on in
+    ticket order. A thread that already holds the lock acquires it again
+    without waiting.
+    """
+
+    def __init__(self, name: Hashable = None) -> None:
+        self.name = name
+        self.stats = LockStats()
+        self._condition = Condition(Lock())
+        self._owner = None  # type: Optional[int]
+        self._depth = 0
+        self._next_ticket = 0
+        self._serving = 0
+        self._abandoned = set()  # type: Set[int]
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Acquire the lock; return False if 'timeout' seconds passed first."""
+        me = get_ident()
+        with self._condition:
+            if self._owner == me:
+                self._depth += 1
+                return True
+
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            contended = self._owner is not None or self._serving != ticket
+            start = perf_counter()
+            deadline = None if timeout is None else monotonic() + timeout
+            while self._owner is not None or self._serving != ticket:
+                if deadline is None:
+                    self._condition.wait()
+                    continue
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    self._abandoned.add(ticket)
+                    self._skip_abandoned()
+                    self.stats.timeouts += 1
+                    self._condition.notify_all()
+                    return False
+                self._condition.wait(remaining)
+
+            self._owner = me
+            self._depth = 1
+            wait = perf_counter() - start
+            self.stats.record(wait, contended)
+        if wait > SLOW_WAIT:
+            print('DEBUG', 'waited {:.1f} s for lock {}'.format(wait, self.name))
+        return True
+
+    def release(self) -> None:
+        with self._condition:
+            if self._owner != get_ident():
+                raise RuntimeError('Lock {} released by a thread which does not hold it'.format(self.name))
+            self._depth -= 1
+            if self._depth == 0:
+                self._owner = None
+                self._serving += 1
+                self._skip_abandoned()
+                self._condition.notify_all()
+
+    def _skip_abandoned(self) -> None:
+        while self._serving in self._abandoned:
+            self._abandoned.remove(self._serving)
+            self._serving += 1
+
+    @property
+    def waiting(self) -> int:
+        """Number of threads waiting for the lock."""
+        with self._condition:
+            return self._next_ticket - self._serving - len(self._abandoned) - (self._owner is not None)
+
+    def __enter__(self) -> 'FairLock':
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.release()
+
+
+class LockManager:
+    """Locks by device and bus key, shared by all threads of this process."""
+
+    _instance = None  # type: Optional[LockManager]
+    _instance_lock = Lock()
+
+    @classmethod
+    def instance(cls) -> 'LockManager':
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._devices = dict()  # type: Dict[Hashable, FairLock]
+        self._buses = dict()  # type: Dict[Hashable, FairLock]
+
+    def device(self, key: Hashable) -> FairLock:
+        """Return the lock of a device, e.g. ('gpib', 0, 24); hold it for a sequence of commands."""
+        with self._lock:
+            if key not in self._devices:
+                self._devices[key] = FairLock(key)
+            return self._devices[key]
+
+    def bus(self, key: Hashable) -> FairLock:
+        """Return the lock of a bus, e.g. ('gpib', 0)."""
+        with self._lock:
+            if key not in self._buses:
+                self._buses[key] = FairLock(key)
+            return self._buses[key]
+
+    @contextmanager
+    def transaction(self, device_key: Hashable) -> Iterator[None]:
+        """Hold the locks of a device and of its bus, in this order."""
+        with self.device(device_key):
+            bus = bus_key(device_key)
+            if bus is None:
+                yield
+            else:
+                with self.bus(bus):
+                    yield
+
+    def stats(self) -> Dict[str, Dict[Hashable, Dict[str, float]]]:
+        """Return the 'LockStats' summaries of all device and bus locks."""
+        with self._lock:
+            return {'devices': {key: lock.stats.summary() for key, lock in self._devices.items()},
+                    'buses': {key: lock.stats.summary() for key, lock in self._buses.items()}}
+
+
+class LockedResource:
+    """Proxy of an instrument resource whose I/O methods run as transactions.
+
+    Use it for resources which are driven by third party drivers, e.g. the
+    pyvisa resource of a sourcemeter. Attributes other than the I/O methods
+    are passed through unchanged. Only a single call is one transaction;
+    wrap the driver in a 'LockedDriver' to keep its 'write()' and 'read()'
+    together.
+    """
+
+    IO_METHODS = frozenset(['write', 'read', 'query', 'ask', 'write_raw', 'read_raw', 'read_bytes',
+                            'write_ascii_values', 'write_binary_values', 'read_ascii_values',
+                            'read_binary_values', 'query_ascii_values', 'query_binary_values',
+                            'clear', 'assert_trigger'])
+
+    def __init__(self, resource: Any, device_key: Hashable, manager: Optional[LockManager] = None) -> None:
+        object.__setattr__(self, '_resource', resource)
+        object.__setattr__(self, '_device_key', device_key)
+        object.__setattr__(self, '_manager', manager or LockManager.instance())
+
+    def _is_io(self, name: str) -> bool:
+        return name in self.IO_METHODS
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._resource, name)
+        if not self._is_io(name) or not callable(attribute):
+            return attribute
+
+        def locked(*args, **kwargs):
+            with self._manager.transaction(self._device_key):
+                return attribute(*args, **kwargs)
+        return locked
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._resource, name, value)
+
+    def __repr__(self) -> str:
+        return '<{} {!r} of {}>'.format(type(self).__name__, self._resource, self._device_key)
+
+
+class LockedDriver(LockedResource):
+    """Proxy of a driver object which opens its own connection, e.g. 'IPS120_10()'.
+
+    Every public method call, property read and property write runs under
+    the device lock, so a background sampler and a measurement can use the
+    driver from different threads.
+    """
+
+    def _is_io(self, name: str) -> bool:
+        return not name.startswith('_')
+
+    def __getattr__(self, name: str) -> Any:
+        if not self._is_io(name):
+            return getattr(self._resource, name)
+        # Properties of the drivers talk to the instrument when they are read:
+        with self._manager.transaction(self._device_key):
+            attribute = getattr(self._resource, name)
+        if not callable(attribute):
+            return attribute
+
+        def locked(*args, **kwargs):
+            with self._manager.transaction(self._device_key):
+                return attribute(*args, **kwargs)
+        return locked
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if not self._is_io(name):
+            setattr(self._resource, name, value)
+            return
+        with self._manager.transaction(self._device_key):
+            setattr(self._resource, name, value)
+
+    def locked_resource(self, name: str = '_dev') -> Optional['LockedResource']:
+        """Return the driver's own VISA resource, whose I/O runs under the same locks; None if it has none."""
+        resource = getattr(self._resource, name, None)
+        if resource is None:
+            return None
+        return LockedResource(resource, self._device_key, self._manager)
+
+
+if __name__ == '__main__':
+    from threading import Thread
+
+    lock = FairLock('benchmark')
+    order = []
+
+    def worker(index: int) -> None:
+        for _ in range(1000):
+            with lock:
+                with lock:
+                    order.append(index)
+
+    threads = [Thread(target=worker, args=(index,)) for index in range(4)]
+    start = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print('{} acquisitions in {:.3f} s, {}'.format(len(order), perf_counter() - start, lock.stats.summary()))
@@ -0,0 +1,227 @@
+"""Continuous acquisition into the buffers of the sourcemeters.
+
+Monitoring a sample with 'read()' in a loop gives a few points per second:
+every point costs a trigger, the integration and a bus round trip. The
+monitors let the sourcemeter measure on its own at a fixed rate and fetch
+the recorded samples every 'MONITOR_POLL_INTERVAL' seconds, in binary
+(see 'buffer_format'):
+
+* 'TspBufferedMonitor': the trigger model of a 2602A/2636A channel,
+  paced by one of the trigger timers, measures voltage and current into
+  'nvbuffer2'/'nvbuffer1' with timestamps; kHz rates need a small NPLC,
+* 'ScpiBufferedMonitor': the 2400 has no buffer which can be read during
+  an acquisition, so it measures blocks of samples with ':READ?', paced
+  by the trigger delay. There is a short gap between two blocks.
+
+The source is not touched: it keeps the level set by the driver. Sample
+times come from the instrument clock and are anchored at the host time
+of the start of a recording.
+
+:usage:
+monitor = get_monitor(lease, sample_rate=1000, nplc=0.01)
+monitor.start()
+data = monitor.poll()
+monitor.stop()
+"""
+from datetime import datetime
+from threading import RLock
+from time import monotonic, sleep
+from typing import Any, ContextManager, NamedTuple, Optional
+
+import numpy as np
+
+from .buffer_format import DEFAULT_FORMAT, read_values, scpi_format, tsp_format
+from .sweeps import LINE_FREQUENCY, TIMEOUT_MARGIN
+
+# Seconds between two fetches from the buffers:
+MONITOR_POLL_INTERVAL = 0.25
+
+
+def _times(started: datetime, seconds: np.ndarray) -> np.ndarray:
+    return np.datetime64(started, 'us') + (seconds * 1e6).astype('timedelta64[us]')
+
+
+def _with_times(data_format: str) -> str:
+    """Return the transfer format for blocks which include sample times.
+
+    The instrument clock counts seconds since the start of a recording; after
+    10 hours, 'real32' resolves only about 4 ms, so 'real64' is used instead.
+    """
+    return 'real64' if data_format == 'real32' else data_format
+
+
+def _sample_period(name: str, sample_rate: float, nplc: float, overhead: float) -> float:
+    """Return the seconds between two samples; longer than '1 / sample_rate' if a reading takes longer."""
+    reading = nplc / LINE_FREQUENCY + overhead
+    if 1.0 / sample_rate >= reading:
+        return 1.0 / sample_rate
+    print('WARNING', '{}: {:g} samples/s not reachable with NPLC {:g}, measuring at {:.4g} samples/s'
+          .format(name, sample_rate, nplc, 1.0 / reading))
+    return reading
+
+
+class MonitorData(NamedTuple):
+    """Samples fetched from a sourcemeter, as columns.
+
+    Attributes:
+        time: Sample times ('datetime64[us]')
+        voltage, current: Measured voltages and currents
+    """
+    time: np.ndarray
+    voltage: np.ndarray
+    current: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.voltage)
+
+
+class ScpiBufferedMonitor:
+    """Measures a 2400 in blocks of samples at a fixed rate."""
+
+    # Readings of one ':READ?' of the 2400:
+    MAX_BLOCK = 2500
+    # Seconds a reading takes besides the integration (auto zero, A/D conversion, trigger layer):
+    READING_OVERHEAD = 0.003
+
+    def __init__(self, resource: Any, sample_rate: float, nplc: float = 1.0, lock: Optional[ContextManager] = None,
+                 data_format: str = DEFAULT_FORMAT, poll_interval: float = MONITOR_POLL_INTERVAL) -> None:
+        """
+        :param resource: VISA resource of the sourcemeter
+        :param sample_rate: Samples per second; lowered with a warning if a reading takes longer
+        :param nplc: Integration time the sourcemeter is configured with
+        :param lock: Held while talking to the sourcemeter, e.g. 'lease.lock()'
+        :param data_format: Transfer format of the readings, 'ascii', 'real32' or 'real64'; 'real32' is
+                            transferred as 'real64', which the sample times need
+        :param poll_interval: Duration of one block in seconds
+        """
+        self._resource = resource
+        self._period = _sample_period('2400', sample_rate, nplc, self.READING_OVERHEAD)
+        self.sample_rate = 1.0 / self._period
+        self._lock = lock if lock is not None else RLock()
+        self._data_format = _with_times(data_format)
+        self._delay = max(0.0, self._period - nplc / LINE_FREQUENCY - self.READING_OVERHEAD)
+        self._block = int(min(self.MAX_BLOCK, max(1, round(poll_interval / self._period))))
+        self._started = None  # type: Optional[datetime]
+
+    def start(self) -> None:
+        with self._lock:
+            for command in (':FORM:ELEM VOLT,CURR,TIME', ':TRIG:DEL {:g}'.format(self._delay),
+                            ':TRIG:COUN {}'.format(self._block), ':SYST:TIME:RES'):
+                self._resource.write(command)
+            self._started = datetime.now()
+
+    def poll(self) -> Optional[MonitorData]:
+        """Measure one block of samples; blocks for about 'poll_interval'."""
+        with self._lock:
+            old_timeout = self._resource.timeout
+            self._resource.timeout = 1000 * (self._block * self._period + TIMEOUT_MARGIN)
+            try:
+                with scpi_format(self._resource, self._data_format):
+                    values = read_values(self._resource, ':READ?', 3 * self._block, self._data_format)
+            finally:
+                self._resource.timeout = old_timeout
+        values = values.reshape(-1, 3)
+        return MonitorData(_times(self._started, values[:, 2]), values[:, 0], values[:, 1])
+
+    def stop(self) -> None:
+        with self._lock:
+            for command in (':TRIG:COUN 1', ':TRIG:DEL 0', ':FORM:ELEM VOLT,CURR'):
+                self._resource.write(command)
+
+
+class TspBufferedMonitor:
+    """Records voltage and current of a 2602A/2636A channel in its buffers at a fixed rate.
+
+    The trigger model runs until 'stop()'. When 'BUFFER_SIZE' samples are
+    recorded, the buffers are cleared and the recording starts again,
+    which leaves a gap of a few milliseconds.
+    """
+
+    BUFFER_SIZE = 50000
+    # Trigger timer pacing the measurements of each channel:
+    TIMERS = {'smua': 1, 'smub': 2}
+    # Seconds a reading takes besides the integration:
+    READING_OVERHEAD = 0.0002
+
+    def __init__(self, resource: Any, channel: str = 'smua', sample_rate: float = 1000.0,
+                 lock: Optional[ContextManager] = None, data_format: str = DEFAULT_FORMAT,
+                 poll_interval: float = MONITOR_POLL_INTERVAL,
+                 nplc: float = 0.01) -> None:
+        """
+        :param channel: 'smua' or 'smub'
+        :param poll_interval: Minimum time between two fetches in seconds
+
+        See 'ScpiBufferedMonitor' for the other parameters.
+        """
+        self._resource = resource
+        self._channel = channel
+        # The timer would fire faster than the channel measures, and the extra events would be lost:
+        self.sample_rate = 1.0 / _sample_period(channel, sample_rate, nplc, self.READING_OVERHEAD)
+        self._lock = lock if lock is not None else RLock()
+        self._data_format = _with_times(data_format)
+        self._poll_interval = poll_interval
+        self._started = None  # type: Optional[datetime]
+        self._last_poll = 0.0
+        self._read = 0
+
+    def _write(self, *commands: str) -> None:
+        for command in commands:
+            self._resource.write(command.format(self._channel, self.TIMERS[self._channel], 1.0 / self.sample_rate))
+
+    def start(self) -> None:
+        with self._lock:
+            self._write('{0}.abort()',
+                        '{0}.nvbuffer1.appendmode = 1',
+                        '{0}.nvbuffer2.appendmode = 1',
+                        '{0}.nvbuffer1.collecttimestamps = 1',
+                        '{0}.trigger.source.action = {0}.DISABLE',
+                        '{0}.trigger.measure.iv({0}.nvbuffer1, {0}.nvbuffer2)',
+                        '{0}.trigger.measure.action = {0}.ENABLE',
+                        '{0}.trigger.endpulse.action = {0}.SOURCE_HOLD',
+                        'trigger.timer[{1}].delay = {2:g}',
+                        'trigger.timer[{1}].count = 0',
+                        'trigger.timer[{1}].passthrough = true',
+                        'trigger.timer[{1}].stimulus = {0}.trigger.ARMED_EVENT_ID',
+                        '{0}.trigger.measure.stimulus = trigger.timer[{1}].EVENT_ID',
+                        '{0}.trigger.arm.count = 1',
+                        '{0}.trigger.count = 0')
+            self._restart()
+
+    def _restart(self) -> None:
+        self._write('{0}.abort()', '{0}.nvbuffer1.clear()', '{0}.nvbuffer2.clear()', '{0}.trigger.initiate()')
+        # The buffer timestamps count from the first sample, which follows the start immediately:
+        self._started = datetime.now()
+        self._last_poll = monotonic()
+        self._read = 0
+
+    def poll(self) -> Optional[MonitorData]:
+        """Fetch the samples recorded since the last call; None if there are none.
+
+        Waits until 'poll_interval' has passed since the last call.
+        """
+        sleep(max(0.0, self._last_poll + self._poll_interval - monotonic()))
+        self._last_poll = monotonic()
+        with self._lock:
+            stored = int(float(self._resource.query('print({}.nvbuffer1.n)'.format(self._channel))))
+            count = stored - self._read
+            if count <= 0:
+                return None
+            query = 'printbuffer({1}, {2}, {0}.nvbuffer1.timestamps, {0}.nvbuffer2.readings, {0}.nvbuffer1.readings)'
+            with tsp_format(self._resource, self._data_format):
+                values = read_values(self._resource, query.format(self._channel, self._read + 1, stored),
+                                     3 * count, self._data_format)
+            started = self._started
+            if stored >= self.BUFFER_SIZE:
+                self._restart()
+            else:
+                self._read = stored
+
+        values = values.reshape(-1, 3)
+        return MonitorData(_times(started, values[:, 0]), values[:, 1], values[:, 2])
+
+    def stop(self) -> None:
+        with self._lock:
+            self._write('{0}.abort()',
+                        '{0}.trigger.measure.stimulus = 0',
+                        '{0}.trigger.count = 1',
+                        '{0}.trigger.source.action = {0}.ENABLE')
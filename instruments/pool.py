@@ -0,0 +1,249 @@
+"""Process-wide pool of open instrument sessions.
+
+Opening a VISA resource, identifying the instrument and creating its driver
+takes seconds on a busy bus. The pool keeps sessions open between
+measurement runs: a measurement takes a lease on an address, and when the
+run ends the lease is returned while the session stays open. The next run
+on the same address gets the same resource, the cached identification and
+the cached driver objects. Sessions that nobody has leased for
+'IDLE_TIMEOUT' seconds are closed by a background thread.
+
+Every session has a device lock ('Lease.lock()') which measurements and
+background samplers hold for sequences of commands that must not be
+interleaved. The I/O methods of pooled VISA resources take the device and
+bus locks on every call, and the drivers of 'Lease.driver()' hold them for
+every method call, so a query written and read in two calls is not split.
+
+:usage:
+with InstrumentPool.instance().lease_visa('GPIB0::10::INSTR') as lease:
+    print(lease.identification)
+"""
+from threading import Event, Lock, Thread
+from time import monotonic
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from .locks import FairLock, LockManager, LockedDriver, LockedResource, visa_lock_key
+
+
+def is_bus_error(error: BaseException) -> bool:
+    """Whether an exception leaves a connection in an unknown state: I/O errors and timeouts."""
+    if isinstance(error, (OSError, TimeoutError)):
+        return True
+    # pyvisa is imported lazily, so its errors are recognized by name:
+    return any(cls.__name__ == 'VisaIOError' for cls in type(error).__mro__)
+
+
+class Session:
+    """One open connection, shared by all leases of its key.
+
+    Attributes:
+        key: Pool key, e.g. ('visa', '@py', 'GPIB0::10::INSTR')
+        lock_key: Device key in 'LockManager', e.g. ('gpib', 0, 10)
+        resource: The open resource or driver object
+        leases: Number of leases which are not yet released
+        idle_since: 'monotonic()' time of the last release
+    """
+
+    def __init__(self, key: Hashable, resource: Any, closer: Optional[Callable[[Any], None]],
+                 lock_key: Optional[Hashable] = None) -> None:
+        self.key = key
+        self.lock_key = key if lock_key is None else lock_key
+        self.resource = resource
+        self.leases = 0
+        self.idle_since = monotonic()
+        self.broken = False
+        self._closer = closer
+        self._identification = None  # type: Optional[str]
+        self._drivers = dict()  # type: Dict[Hashable, Any]
+        self._lock = Lock()
+
+    def identify(self, query: str = '*IDN?') -> str:
+        """Return the answer to '*IDN?', asking the instrument only once per session."""
+        with self._lock:
+            if self._identification is None:
+                ask = getattr(self.resource, 'query', None) or getattr(self.resource, 'ask')
+                self._identification = ask(query).strip()
+            return self._identification
+
+    def driver(self, key: Hashable, factory: Callable[[Any], Any]) -> Any:
+        """Return the driver object 'factory(resource)', creating it once per session and 'key'.
+
+        The driver is wrapped in a 'LockedDriver' of the session's lock key.
+        """
+        with self._lock:
+            if key not in self._drivers:
+                self._drivers[key] = LockedDriver(factory(self.resource), self.lock_key)
+            return self._drivers[key]
+
+    def close(self) -> None:
+        self._drivers.clear()
+        closer = self._closer
+        if closer is None:
+            closer = getattr(self.resource, 'close', None)
+            if closer is not None:
+                closer()
+        else:
+            closer(self.resource)
+
+
+class Lease:
+    """A measurement's claim on a pooled session; release it when the run is over."""
+
+    def __init__(self, pool: 'InstrumentPool', session: Session) -> None:
+        self._pool = pool
+        self._session = session
+        self._released = False
+
+    def __enter__(self) -> 'Lease':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.release()
+
+    @property
+    def resource(self) -> Any:
+        return self._session.resource
+
+    @property
+    def identification(self) -> str:
+        return self._session.identify()
+
+    def driver(self, key: Hashable, factory: Callable[[Any], Any]) -> Any:
+        """See 'Session.driver()'."""
+        return self._session.driver(key, factory)
+
+    def lock(self) -> FairLock:
+        """Return the device lock of the session; use it as 'with lease.lock(): ...'."""
+        return LockManager.instance().device(self._session.lock_key)
+
+    def invalidate(self) -> None:
+        """Mark the session as broken, e.g. after an I/O error; it is closed when released."""
+        self._session.broken = True
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._pool._release(self._session)
+
+
+class InstrumentPool:
+    """Sessions by key, shared by all measurements of this process."""
+
+    IDLE_TIMEOUT = 600.0  # seconds
+    REAP_INTERVAL = 30.0  # seconds
+
+    _instance = None  # type: Optional[InstrumentPool]
+    _instance_lock = Lock()
+
+    @classmethod
+    def instance(cls) -> 'InstrumentPool':
+        """Return the pool shared by all measurements."""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def __init__(self, idle_timeout: float = IDLE_TIMEOUT) -> None:
+        """
+        :param idle_timeout: Seconds after which a session without leases is closed
+        """
+        self._idle_timeout = idle_timeout
+        self._sessions = dict()  # type: Dict[Hashable, Session]
+        self._resource_managers = dict()  # type: Dict[str, Any]
+        self._lock = Lock()
+        self._opening = dict()  # type: Dict[Hashable, Lock]
+        self._stop = Event()
+        self._reaper = None  # type: Optional[Thread]
+
+    def lease(self, key: Hashable, opener: Callable[[], Any],
+              closer: Optional[Callable[[Any], None]] = None, lock_key: Optional[Hashable] = None) -> Lease:
+        """Lease the session of 'key', opening it with 'opener()' if there is none.
+
+        :param key: Identifies the connection, e.g. ('gpib', 0, 24)
+        :param opener: Returns a new resource or driver object
+        :param closer: Closes the object; by default its 'close()' method is called, if any
+        :param lock_key: Device key of the session's lock, 'key' by default
+        """
+        with self._lock:
+            opening = self._opening.setdefault(key, Lock())
+
+        # Only one thread opens a key; others wait for it instead of opening a second session:
+        with opening:
+            with self._lock:
+                session = self._sessions.get(key)
+                if session is not None:
+                    session.leases += 1
+                    return Lease(self, session)
+
+            print('DEBUG', 'opening instrument session {}'.format(key))
+            resource = opener()
+
+            with self._lock:
+                session = Session(key, resource, closer, lock_key)
+                session.leases = 1
+                self._sessions[key] = session
+                self._start_reaper()
+                return Lease(self, session)
+
+    def lease_visa(self, address: str, library: str = '@py', **open_arguments) -> Lease:
+        """Lease a VISA resource; all resources of one VISA library share a 'ResourceManager'.
+
+        :param address: VISA resource name, e.g. 'GPIB0::10::INSTR'
+        :param library: VISA library as passed to 'ResourceManager'
+        :param open_arguments: Passed to 'open_resource()' when the session is opened
+        """
+        key = ('visa', library, address) + tuple(sorted(open_arguments.items()))
+        lock_key = visa_lock_key(address)
+
+        def open_resource() -> LockedResource:
+            resource = self.resource_manager(library).open_resource(address, **open_arguments)
+            return LockedResource(resource, lock_key)
+        return self.lease(key, open_resource, lock_key=lock_key)
+
+    def resource_manager(self, library: str) -> Any:
+        """Return the 'ResourceManager' of a VISA library, shared by all its sessions."""
+        with self._lock:
+            if library not in self._resource_managers:
+                from visa import ResourceManager
+
+                self._resource_managers[library] = ResourceManager(library)
+            return self._resource_managers[library]
+
+    def _release(self, session: Session) -> None:
+        with self._lock:
+            session.leases -= 1
+            session.idle_since = monotonic()
+            if session.broken and session.leases == 0:
+                self._close(session)
+
+    def _close(self, session: Session) -> None:
+        """Close a session; the caller holds '_lock'."""
+        if self._sessions.get(session.key) is session:
+            del self._sessions[session.key]
+        print('DEBUG', 'closing instrument session {}'.format(session.key))
+        try:
+            session.close()
+        except Exception as error:
+            print('WARNING', 'Could not close {}: {}'.format(session.key, error))
+
+    def close_idle(self, idle_timeout: Optional[float] = None) -> None:
+        """Close all sessions without leases which are idle for longer than 'idle_timeout'."""
+        idle_timeout = self._idle_timeout if idle_timeout is None else idle_timeout
+        now = monotonic()
+        with self._lock:
+            for session in list(self._sessions.values()):
+                if session.leases == 0 and now - session.idle_since >= idle_timeout:
+                    self._close(session)
+
+    def close_all(self) -> None:
+        """Close every session without a lease, regardless of its idle time."""
+        self.close_idle(idle_timeout=0)
+
+    def _start_reaper(self) -> None:
+        if self._reaper is None:
+            self._reaper = Thread(target=self._reap, name='instrument pool reaper', daemon=True)
+            self._reaper.start()
+
+    def _reap(self) -> None:
+        while not self._stop.wait(min(self.REAP_INTERVAL, self._idle_timeout)):
+            self.close_idle()
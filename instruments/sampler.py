@@ -0,0 +1,160 @@
+"""Background polling of slow environmental instruments.
+
+Temperatures and magnetic fields change slowly compared to the rate at
+which a measurement takes data points, but reading them costs a GPIB round
+trip each. A 'Sampler' polls a few channels of one instrument on its own
+thread and keeps the latest timestamped value of each. Acquisition loops ask
+for a value no older than 'max_age' seconds and only go to the bus
+themselves if the poller has fallen behind.
+
+Samplers are shared by key: a second measurement which samples the same
+instrument gets the running sampler; it stops when the last one releases it.
+
+:usage:
+sampler = Sampler.shared(('itc', 0, 24), {'T1': lambda: itc.T1}, interval=1.0)
+temperature = sampler.get('T1', max_age=2.0)
+sampler.release()
+"""
+from datetime import datetime
+from threading import Event, Lock, Thread
+from time import monotonic
+from typing import Any, Callable, ContextManager, Dict, Hashable, Iterable, NamedTuple, Optional, Tuple
+
+
+class Reading(NamedTuple):
+    """A sampled value, when it was taken as wall clock time and as 'monotonic()' time."""
+    value: Any
+    timestamp: datetime
+    taken: float
+
+    @property
+    def age(self) -> float:
+        return monotonic() - self.taken
+
+
+class Sampler:
+    """Polls the channels of one instrument every 'interval' seconds."""
+
+    RETRIES = 1
+
+    _shared = dict()  # type: Dict[Hashable, Sampler]
+    _shared_lock = Lock()
+
+    @classmethod
+    def shared(cls, key: Hashable, channels: Dict[str, Callable[[], Any]], interval: float = 1.0,
+               lock: Optional[ContextManager] = None) -> 'Sampler':
+        """Return the running sampler of 'key', or start a new one; call 'release()' when done.
+
+        :param key: Identifies the instrument, e.g. ('itc', 0, 24)
+        :param channels: Functions which read a channel, by channel name
+        :param interval: Seconds between two polls of all channels
+        :param lock: Held while a round of channels is read, e.g. 'lease.lock()'
+        """
+        with cls._shared_lock:
+            sampler = cls._shared.get(key)
+            if sampler is None:
+                sampler = cls(key, channels, interval, lock)
+                cls._shared[key] = sampler
+                sampler.start()
+            else:
+                sampler.add_channels(channels)
+                sampler.interval = min(sampler.interval, interval)
+            sampler._users += 1
+            return sampler
+
+    def __init__(self, name: Hashable, channels: Dict[str, Callable[[], Any]], interval: float = 1.0,
+                 lock: Optional[ContextManager] = None) -> None:
+        self.name = name
+        self.interval = interval
+        self._channels = dict(channels)
+        self._lock = lock
+        self._readings = dict()  # type: Dict[str, Reading]
+        self._readings_lock = Lock()
+        self._users = 0
+        self._stop = Event()
+        self._thread = None  # type: Optional[Thread]
+
+    def add_channels(self, channels: Dict[str, Callable[[], Any]]) -> None:
+        with self._readings_lock:
+            for channel, read in channels.items():
+                self._channels.setdefault(channel, read)
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = Thread(target=self._run, name='sampler {}'.format(self.name), daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def release(self) -> None:
+        """Give up a reference from 'shared()'; the last one stops the sampler."""
+        with self._shared_lock:
+            self._users -= 1
+            if self._users > 0:
+                return
+            if self._shared.get(self.name) is self:
+                del self._shared[self.name]
+        self.stop()
+
+    def latest(self, channel: str) -> Optional[Reading]:
+        """Return the last reading of a channel, however old it is."""
+        with self._readings_lock:
+            return self._readings.get(channel)
+
+    def get(self, channel: str, max_age: Optional[float] = None) -> Any:
+        """Return a value of a channel which is at most 'max_age' seconds old.
+
+        Without 'max_age' a value at most two intervals old is returned. If
+        there is none, the channel is read now.
+        """
+        max_age = 2 * self.interval if max_age is None else max_age
+        reading = self.latest(channel)
+        if reading is None or reading.age > max_age:
+            reading = self._sample(channel, retries=self.RETRIES)
+        return reading.value
+
+    def get_many(self, channels: Iterable[str], max_age: Optional[float] = None) -> Tuple[Any, ...]:
+        return tuple(self.get(channel, max_age) for channel in channels)
+
+    def invalidate(self, channel: Optional[str] = None) -> None:
+        """Forget readings, e.g. after a write which changes them; all channels if 'channel' is None."""
+        with self._readings_lock:
+            if channel is None:
+                self._readings.clear()
+            else:
+                self._readings.pop(channel, None)
+
+    def _sample(self, channel: str, retries: int = 0) -> Reading:
+        read = self._channels[channel]
+        for attempt in range(retries + 1):
+            try:
+                if self._lock is None:
+                    value = read()
+                else:
+                    with self._lock:
+                        value = read()
+                break
+            except Exception:
+                if attempt == retries:
+                    raise
+        reading = Reading(value, datetime.now(), monotonic())
+        with self._readings_lock:
+            self._readings[channel] = reading
+        return reading
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            start = monotonic()
+            with self._readings_lock:
+                channels = list(self._channels)
+            for channel in channels:
+                try:
+                    self._sample(channel)
+                except Exception as error:
+                    print('WARNING', 'Sampler {} could not read {}: {}'.format(self.name, channel, error))
+            self._stop.wait(max(0.0, self.interval - (monotonic() - start)))
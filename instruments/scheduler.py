@@ -0,0 +1,106 @@
+"""Trigger-then-collect acquisition from several sourcemeters.
+
+Reading SMUs one after the other with 'read()' costs the sum of all
+integration times per sample. 'AcquisitionScheduler' first triggers a
+measurement on every channel and then collects the readings, so the
+sourcemeters integrate at the same time and a sample takes about as long
+as the slowest of them. Every device gets a worker thread: channels of
+different devices are triggered and collected in parallel, channels of
+the same device one after the other in the order they were added.
+
+:usage:
+scheduler = AcquisitionScheduler()
+scheduler.add(get_triggered_channel(lease), lease.lock())
+timestamp, readings = scheduler.acquire()
+scheduler.close()
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, ContextManager, Dict, List, Tuple
+
+from .buffer_format import parse_ascii
+
+
+class ScpiTriggeredChannel:
+    """Triggers a 2400 with ':INIT' and fetches voltage and current with ':FETC?'."""
+
+    def __init__(self, resource: Any) -> None:
+        self._resource = resource
+        self._resource.write(':FORM:ELEM VOLT,CURR')
+
+    def trigger(self) -> None:
+        self._resource.write(':INIT')
+
+    def collect(self) -> Tuple[float, float]:
+        # ':INIT' is overlapped; without '*WAI', ':FETC?' may return the previous reading:
+        voltage, current = parse_ascii(self._resource.query('*WAI;:FETC?'))[:2]
+        return float(voltage), float(current)
+
+
+class TspTriggeredChannel:
+    """Starts an overlapped measurement of a 2602A/2636A channel and fetches it from the buffers.
+
+    Both channels of a device measure at the same time once triggered.
+    """
+
+    def __init__(self, resource: Any, channel: str = 'smua') -> None:
+        """
+        :param channel: 'smua' or 'smub'
+        """
+        self._resource = resource
+        self._channel = channel
+
+    def trigger(self) -> None:
+        self._resource.write('{0}.nvbuffer1.clear() {0}.nvbuffer2.clear() '
+                             '{0}.measure.overlappediv({0}.nvbuffer1, {0}.nvbuffer2)'.format(self._channel))
+
+    def collect(self) -> Tuple[float, float]:
+        answer = self._resource.query('waitcomplete() printbuffer(1, 1, {0}.nvbuffer2.readings, {0}.nvbuffer1.readings)'
+                                      .format(self._channel))
+        voltage, current = parse_ascii(answer)[:2]
+        return float(voltage), float(current)
+
+
+class AcquisitionScheduler:
+    """Triggers all channels, then collects their readings, with one worker thread per device."""
+
+    def __init__(self) -> None:
+        # Device lock -> indices of its channels:
+        self._devices = dict()  # type: Dict[Any, List[int]]
+        self._channels = []  # type: List[Any]
+        self._executor = None  # type: ThreadPoolExecutor
+
+    def add(self, channel: Any, lock: ContextManager) -> int:
+        """Add a channel ('ScpiTriggeredChannel', 'TspTriggeredChannel'); return its index in the readings.
+
+        :param lock: Lock of the device, e.g. 'lease.lock()'; channels with the same lock share a worker
+        """
+        self._channels.append(channel)
+        self._devices.setdefault(lock, []).append(len(self._channels) - 1)
+        return len(self._channels) - 1
+
+    def _run(self, method: str) -> Dict[int, Any]:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=len(self._devices), thread_name_prefix='acquisition')
+
+        def run_device(lock: ContextManager, indices: List[int]) -> Dict[int, Any]:
+            with lock:
+                return {index: getattr(self._channels[index], method)() for index in indices}
+
+        futures = [self._executor.submit(run_device, lock, indices) for lock, indices in self._devices.items()]
+        results = dict()  # type: Dict[int, Any]
+        for future in futures:
+            results.update(future.result())
+        return results
+
+    def acquire(self) -> Tuple[datetime, List[Tuple[float, float]]]:
+        """Measure every channel once; return the trigger time and the readings (voltage, current) in channel order."""
+        timestamp = datetime.now()
+        self._run('trigger')
+        readings = self._run('collect')
+        return timestamp, [readings[index] for index in range(len(self._channels))]
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
@@ -0,0 +1,97 @@
+"""Keithley sourcemeter drivers for pooled VISA sessions."""
+from typing import Any, Optional
+
+from scientificdevices.keithley.sourcemeter2400 import Sourcemeter2400
+from scientificdevices.keithley.sourcemeter2602A import Sourcemeter2602A
+from scientificdevices.keithley.sourcemeter2636A import Sourcemeter2636A
+
+from .pool import Lease
+from .monitor import ScpiBufferedMonitor, TspBufferedMonitor
+from .scheduler import ScpiTriggeredChannel, TspTriggeredChannel
+from .sweeps import ScpiListSweeper, TspListSweeper, tsp_channel
+
+# Model number in the '*IDN?' answer -> driver class:
+MODELS = [('2400', Sourcemeter2400),
+          ('2602', Sourcemeter2602A),
+          ('2636', Sourcemeter2636A)]
+
+
+def sourcemeter_class(identification: str) -> type:
+    for model, cls in MODELS:
+        if model in identification:
+            return cls
+    raise ValueError('Sourcemeter "{}" not known.'.format(identification))
+
+
+def get_sourcemeter(lease: Lease, sub_device: Optional[Any] = None) -> Any:
+    """Return the driver for the sourcemeter of a lease, chosen by its (cached) identification.
+
+    The driver object is created once per session and channel.
+
+    :param lease: Lease of the sourcemeter's VISA resource
+    :param sub_device: Channel of a two-channel sourcemeter, e.g. 'SMUChannel.channelA'
+    """
+    identification = lease.identification
+    print('DEBUG', identification)
+    cls = sourcemeter_class(identification)
+
+    return get_driver(lease, cls, sub_device)
+
+
+def get_driver(lease: Lease, cls: type, sub_device: Optional[Any] = None) -> Any:
+    """Return a driver of a known class for a lease, created once per session and channel."""
+    if sub_device is None:
+        driver = lease.driver(('sourcemeter', cls), cls)
+    else:
+        driver = lease.driver(('sourcemeter', cls, sub_device),
+                              lambda resource: cls(resource, sub_device=sub_device))
+    return driver
+
+
+def get_sweeper(lease: Lease, sub_device: Optional[Any] = None) -> Optional[Any]:
+    """Return a hardware list sweeper for the sourcemeter of a lease; None if the model has none.
+
+    :param lease: Lease of the sourcemeter's VISA resource
+    :param sub_device: Channel of a two-channel sourcemeter, e.g. 'SMUChannel.channelA'
+    """
+    try:
+        cls = sourcemeter_class(lease.identification)
+    except ValueError:
+        return None
+    if cls is Sourcemeter2400:
+        return ScpiListSweeper(lease.resource, lease.lock())
+    return TspListSweeper(lease.resource, tsp_channel('smua' if sub_device is None else sub_device), lease.lock())
+
+
+def get_monitor(lease: Lease, sample_rate: float, nplc: float = 1.0,
+                sub_device: Optional[Any] = None) -> Optional[Any]:
+    """Return a buffered monitor for the sourcemeter of a lease; None if the model has none.
+
+    :param lease: Lease of the sourcemeter's VISA resource
+    :param sample_rate: Samples per second
+    :param nplc: Integration time the channel is configured with
+    :param sub_device: Channel of a two-channel sourcemeter, e.g. 'SMUChannel.channelA'
+    """
+    try:
+        cls = sourcemeter_class(lease.identification)
+    except ValueError:
+        return None
+    if cls is Sourcemeter2400:
+        return ScpiBufferedMonitor(lease.resource, sample_rate, nplc, lease.lock())
+    return TspBufferedMonitor(lease.resource, tsp_channel('smua' if sub_device is None else sub_device),
+                              sample_rate, lease.lock(), nplc=nplc)
+
+
+def get_triggered_channel(lease: Lease, sub_device: Optional[Any] = None) -> Optional[Any]:
+    """Return a channel for an 'AcquisitionScheduler'; None if the model is not known.
+
+    :param lease: Lease of the sourcemeter's VISA resource
+    :param sub_device: Channel of a two-channel sourcemeter, e.g. 'SMUChannel.channelA'
+    """
+    try:
+        cls = sourcemeter_class(lease.identification)
+    except ValueError:
+        return None
+    if cls is Sourcemeter2400:
+        return ScpiTriggeredChannel(lease.resource)
+    return TspTriggeredChannel(lease.resource, tsp_channel('smua' if sub_device is None else sub_device))
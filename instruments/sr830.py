@@ -0,0 +1,248 @@
+"""Fast reads of the SR830 lock-in amplifier.
+
+The 'SR830m' driver reads X, Y, R and theta with one 'OUTP?' query each, so
+a data point costs four bus round trips and the values belong to four
+different instants. 'SNAP?' returns up to six values which the lock-in
+records at the same instant, in one round trip.
+
+For faster measurements, 'BufferedReader' lets the lock-in record X and Y
+into its internal buffers at up to 512 Hz and fetches the new samples as
+binary floats from time to time.
+
+:usage:
+reader = SnapReader(device, lock=lease.lock())
+x, y, r, theta = reader.read()
+"""
+from datetime import datetime
+from threading import RLock
+from typing import Any, ContextManager, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .locks import LockedDriver
+
+# Parameter codes of 'SNAP?':
+SNAP_PARAMETERS = {'X': 1, 'Y': 2, 'R': 3, 'T': 4,
+                   'AUX1': 5, 'AUX2': 6, 'AUX3': 7, 'AUX4': 8,
+                   'FREQ': 9, 'CH1': 10, 'CH2': 11}
+MAX_SNAP_PARAMETERS = 6
+
+# Seconds between two fetches from the buffers in the measurements:
+BUFFER_POLL_INTERVAL = 0.25
+
+# Driver properties which read a parameter one by one:
+FALLBACK_PROPERTIES = {'X': 'outpX', 'Y': 'outpY', 'R': 'outpR', 'T': 'outpT', 'FREQ': 'freq'}
+
+
+def visa_resource(device: Any) -> Optional[Any]:
+    """Return the VISA resource of an 'SR830m' driver, also through a 'CachedInstrument'.
+
+    The resource of a 'LockedDriver' is wrapped, so its I/O takes the driver's locks.
+    """
+    driver = getattr(device, 'driver', device)
+    if isinstance(driver, LockedDriver):
+        return driver.locked_resource('_dev')
+    return getattr(driver, '_dev', None)
+
+
+class SnapReader:
+    """Reads several parameters of an SR830 with one 'SNAP?' query.
+
+    If the driver has no VISA resource to send 'SNAP?' to, or the lock-in
+    does not understand it, the parameters are read one by one through the
+    driver's properties from then on.
+    """
+
+    def __init__(self, device: Any, parameters: Sequence[str] = ('X', 'Y', 'R', 'T'),
+                 lock: Optional[ContextManager] = None) -> None:
+        """
+        :param device: 'SR830m' driver, possibly wrapped in a 'CachedInstrument'
+        :param parameters: Names in 'SNAP_PARAMETERS', two to six of them
+        :param lock: Held while talking to the lock-in, e.g. 'lease.lock()'
+        """
+        if not 2 <= len(parameters) <= MAX_SNAP_PARAMETERS:
+            raise ValueError('SNAP? reads 2 to {} parameters, not {}'.format(MAX_SNAP_PARAMETERS, len(parameters)))
+        self._device = device
+        self._lock = lock if lock is not None else RLock()
+        self._parameters = tuple(parameter.upper() for parameter in parameters)
+        self._query = 'SNAP? {}'.format(','.join(str(SNAP_PARAMETERS[parameter]) for parameter in self._parameters))
+        self._resource = visa_resource(device)
+        if self._resource is None:
+            self._use_fallback('driver has no VISA resource')
+
+    @property
+    def batched(self) -> bool:
+        return self._resource is not None
+
+    def _use_fallback(self, reason: str) -> None:
+        missing = [parameter for parameter in self._parameters if parameter not in FALLBACK_PROPERTIES]
+        if missing:
+            raise ValueError('Cannot read {} without SNAP?: {}'.format(missing, reason))
+        print('WARNING', 'SR830: reading parameters one by one, {}'.format(reason))
+        self._resource = None
+
+    def read(self) -> Tuple[float, ...]:
+        """Return the values of the parameters, in the order they were given."""
+        with self._lock:
+            return self._read()
+
+    def _read(self) -> Tuple[float, ...]:
+        if self._resource is not None:
+            try:
+                answer = self._resource.query(self._query)
+                values = tuple(float(value) for value in answer.strip().split(','))
+                if len(values) == len(self._parameters):
+                    return values
+                reason = 'unexpected answer {!r} to {}'.format(answer, self._query)
+            except ValueError as error:
+                reason = 'cannot parse answer to {}: {}'.format(self._query, error)
+            self._use_fallback(reason)
+
+        return tuple(float(getattr(self._device, FALLBACK_PROPERTIES[parameter]))
+                     for parameter in self._parameters)
+
+
+def rate_index(sample_rate: float) -> int:
+    """Return the 'SRAT' index of the sample rate nearest to 'sample_rate' (62.5 mHz * 2 ** index)."""
+    return int(min(13, max(0, round(np.log2(sample_rate) + 4))))
+
+
+class BufferedData(NamedTuple):
+    """Samples fetched from the buffers, as columns.
+
+    Attributes:
+        time: Sample times ('datetime64[us]')
+        timestamp: Sample times in seconds since the epoch
+        x, y, r, theta: Lock-in outputs; r and theta are computed from x and y
+    """
+    time: np.ndarray
+    timestamp: np.ndarray
+    x: np.ndarray
+    y: np.ndarray
+    r: np.ndarray
+    theta: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+    def head(self, count: int) -> 'BufferedData':
+        return BufferedData(*(column[:count] for column in self))
+
+
+class BufferedReader:
+    """Records X and Y in the SR830's buffers and fetches them in binary.
+
+    The displays are set to X (channel 1) and Y (channel 2), whose values
+    the buffers store. A buffer holds 'BUFFER_SIZE' samples; when it is
+    nearly full, it is emptied and recording starts again, which leaves a
+    gap of a few milliseconds. Sample times are derived from the start of
+    the recording and the sample rate.
+    """
+
+    BUFFER_SIZE = 16383
+    # Restart the recording when fewer samples than this are left:
+    RESTART_MARGIN = 1024
+
+    def __init__(self, device: Any, sample_rate: float = 512.0, lock: Optional[ContextManager] = None) -> None:
+        """
+        :param device: 'SR830m' driver, possibly wrapped in a 'CachedInstrument'
+        :param sample_rate: Samples per second; the nearest rate of the lock-in is used
+        :param lock: Held while talking to the lock-in, e.g. 'lease.lock()'
+        """
+        self._resource = visa_resource(device)
+        self._lock = lock if lock is not None else RLock()
+        if self._resource is None:
+            raise ValueError('Buffered acquisition needs the VISA resource of the SR830 driver.')
+        self._rate_index = rate_index(sample_rate)
+        self.sample_rate = 2.0 ** (self._rate_index - 4)
+        self._started = None  # type: Optional[datetime]
+        self._read = 0
+
+    def start(self) -> None:
+        with self._lock:
+            for command in ('DDEF 1,0,0', 'DDEF 2,0,0', 'SRAT {}'.format(self._rate_index), 'SEND 0'):
+                self._resource.write(command)
+            self._restart()
+
+    def _restart(self) -> None:
+        self._resource.write('REST')
+        self._resource.write('STRT')
+        self._started = datetime.now()
+        self._read = 0
+
+    def stop(self) -> None:
+        with self._lock:
+            self._resource.write('PAUS')
+
+    def _transfer(self, channel: int, start: int, count: int) -> np.ndarray:
+        self._resource.write('TRCB? {},{},{}'.format(channel, start, count))
+        return np.frombuffer(self._resource.read_bytes(4 * count), dtype='<f4').astype(np.float64)
+
+    def poll(self) -> Optional[BufferedData]:
+        """Fetch the samples recorded since the last call; None if there are none."""
+        with self._lock:
+            stored = int(self._resource.query('SPTS?'))
+            count = stored - self._read
+            if count <= 0:
+                return None
+
+            x = self._transfer(1, self._read, count)
+            y = self._transfer(2, self._read, count)
+            seconds = (self._read + np.arange(count)) / self.sample_rate
+            started = self._started
+            if stored >= self.BUFFER_SIZE - self.RESTART_MARGIN:
+                self._restart()
+            else:
+                self._read = stored
+
+        time = np.datetime64(started, 'us') + (seconds * 1e6).astype('timedelta64[us]')
+        return BufferedData(time, started.timestamp() + seconds,
+                            x, y, np.hypot(x, y), np.degrees(np.arctan2(y, x)))
+
+
+if __name__ == '__main__':
+    from time import perf_counter
+
+    from instruments.transport import Instrument, SimulatedBackend
+
+    ROUND_TRIP = 0.002  # seconds per write and per read, roughly a GPIB transaction
+
+    def answer(message: str) -> Optional[str]:
+        if message.startswith('SNAP?'):
+            return ','.join('{:.6e}'.format(0.001 * index) for index, _ in enumerate(message[6:].split(',')))
+        if message.startswith('OUTP?'):
+            return '1.234560e-03'
+        return None
+
+    class FakeSR830:
+        """Stands in for 'SR830m': one query per property."""
+
+        def __init__(self) -> None:
+            instrument = Instrument(SimulatedBackend(answer, latency=ROUND_TRIP))
+
+            class Resource:
+                """Text queries like a pyvisa resource."""
+                query = staticmethod(lambda message: instrument.ask(message).decode())
+
+            self._dev = Resource()
+
+        outpX = property(lambda self: float(self._dev.query('OUTP? 1')))
+        outpY = property(lambda self: float(self._dev.query('OUTP? 2')))
+        outpR = property(lambda self: float(self._dev.query('OUTP? 3')))
+        outpT = property(lambda self: float(self._dev.query('OUTP? 4')))
+
+    device = FakeSR830()
+    points = 200
+
+    start = perf_counter()
+    for _ in range(points):
+        (device.outpX, device.outpY, device.outpR, device.outpT)
+    single = points / (perf_counter() - start)
+
+    reader = SnapReader(device)
+    start = perf_counter()
+    for _ in range(points):
+        reader.read()
+    snap = points / (perf_counter() - start)
+
+    print('OUTP? x 4: {:.0f} points/s, SNAP?: {:.0f} points/s, {:.1f} times faster'.format(single, snap, snap / single))
@@ -0,0 +1,146 @@
+"""Write-through cache of instrument settings.
+
+Most settings of an instrument do not change during a measurement, e.g.
+the reference frequency, amplitude and time constant of a lock-in, which
+the SR830 measurements read for the header and for every data point.
+'CachedInstrument' wraps a driver object and
+
+* answers repeated reads of 'static' properties from the cache; 'volatile'
+  properties are cached for a few seconds only,
+* writes property assignments through to the driver, skipping assignments
+  of the value which was last read; the next read asks the instrument, which
+  may have rounded the value,
+* skips calls of 'idempotent' methods whose arguments equal the last call,
+  until another method named in 'invalidates' is called,
+* re-reads the static properties every 'check_interval' seconds and drops
+  everything it knows if one of them changed, e.g. at the front panel.
+
+Everything else is passed through to the driver. Only wrap drivers whose
+settings can be checked by reading them: an 'idempotent' call whose effect
+was undone elsewhere, e.g. at the front panel or by a setter the cache does
+not know about, is skipped although it is needed. For this reason the
+sourcemeter and magnet drivers are not wrapped; 'set_voltage()' changes
+what 'voltage_driven()' configured, and the IPS120 has no static
+property which would reveal a changed sweep mode.
+
+:usage:
+device = CachedInstrument(SR830m(gpib), **SR830_CACHE)
+resistance = x / device.slvl  # queried once
+"""
+from threading import RLock
+from time import monotonic
+from typing import Any, Dict, Iterable, Mapping, Optional, Tuple
+
+CHECK_INTERVAL = 30.0  # seconds
+
+SR830_CACHE = {'static': ('freq', 'slvl', 'oflt', 'phas', 'fmod', 'harm', 'isrc', 'ofsl'),
+               'volatile': {'sens': 1.0}}
+
+
+class CachedInstrument:
+    """Proxy of a driver object which avoids redundant queries and writes."""
+
+    def __init__(self, driver: Any, static: Iterable[str] = (), volatile: Optional[Mapping[str, float]] = None,
+                 idempotent: Iterable[str] = (), invalidates: Optional[Mapping[str, Optional[Iterable[str]]]] = None,
+                 check_interval: float = CHECK_INTERVAL) -> None:
+        """
+        :param driver: The wrapped driver object
+        :param static: Properties which only change when they are set
+        :param volatile: Properties which are cached for the given number of seconds
+        :param idempotent: Methods whose repeated calls with the same arguments have no effect
+        :param invalidates: Methods and the names they invalidate when called; None invalidates everything
+        :param check_interval: Seconds after which the static properties are read again
+        """
+        set_attribute = object.__setattr__
+        set_attribute(self, '_driver', driver)
+        set_attribute(self, '_static', frozenset(static))
+        set_attribute(self, '_volatile', dict(volatile or dict()))
+        set_attribute(self, '_idempotent', frozenset(idempotent))
+        set_attribute(self, '_invalidates', {name: (None if names is None else tuple(names))
+                                             for name, names in (invalidates or dict()).items()})
+        set_attribute(self, '_check_interval', check_interval)
+        set_attribute(self, '_values', dict())  # type: Dict[str, Tuple[Any, float]]
+        set_attribute(self, '_calls', dict())  # type: Dict[str, Tuple[tuple, tuple]]
+        set_attribute(self, '_last_check', monotonic())
+        set_attribute(self, '_lock', RLock())
+        set_attribute(self, 'hits', 0)
+        set_attribute(self, 'misses', 0)
+
+    @property
+    def driver(self) -> Any:
+        return self._driver
+
+    def invalidate(self, *names: str) -> None:
+        """Forget cached values and calls; everything if no names are given."""
+        with self._lock:
+            if not names:
+                self._values.clear()
+                self._calls.clear()
+                return
+            for name in names:
+                self._values.pop(name, None)
+                self._calls.pop(name, None)
+
+    def _check(self) -> None:
+        """Drop the cache if a static property changed behind our back."""
+        now = monotonic()
+        if now - self._last_check < self._check_interval:
+            return
+        object.__setattr__(self, '_last_check', now)
+        for name in self._static:
+            cached = self._values.get(name)
+            if cached is not None and getattr(self._driver, name) != cached[0]:
+                print('DEBUG', '{} changed on the instrument, dropping cached settings'.format(name))
+                self.invalidate()
+                return
+
+    def _read(self, name: str) -> Any:
+        with self._lock:
+            self._check()
+            cached = self._values.get(name)
+            now = monotonic()
+            if cached is not None and (name in self._static or now - cached[1] < self._volatile[name]):
+                object.__setattr__(self, 'hits', self.hits + 1)
+                return cached[0]
+            object.__setattr__(self, 'misses', self.misses + 1)
+            value = getattr(self._driver, name)
+            self._values[name] = (value, now)
+            return value
+
+    def __getattr__(self, name: str) -> Any:
+        if name in self._static or name in self._volatile:
+            return self._read(name)
+
+        attribute = getattr(self._driver, name)
+        if not callable(attribute) or (name not in self._idempotent and name not in self._invalidates):
+            return attribute
+
+        def call(*args, **kwargs):
+            with self._lock:
+                key = (args, tuple(sorted(kwargs.items())))
+                if name in self._idempotent and self._calls.get(name) == key:
+                    object.__setattr__(self, 'hits', self.hits + 1)
+                    return None
+                result = attribute(*args, **kwargs)
+                if name in self._invalidates:
+                    names = self._invalidates[name]
+                    self.invalidate(*(() if names is None else names))
+                if name in self._idempotent:
+                    self._calls[name] = key
+                return result
+        return call
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if name not in self._static and name not in self._volatile:
+            setattr(self._driver, name, value)
+            return
+        with self._lock:
+            cached = self._values.get(name)
+            if cached is not None and cached[0] == value:
+                object.__setattr__(self, 'hits', self.hits + 1)
+                return
+            setattr(self._driver, name, value)
+            self._values.pop(name, None)
+
+    def __repr__(self) -> str:
+        return '<CachedInstrument {!r}, {} hits, {} misses>'.format(self._driver, self.hits, self.misses)
@@ -0,0 +1,332 @@
+"""Voltage sweeps which run on the sourcemeter instead of in Python.
+
+Stepping a sweep from Python costs a 'set_voltage()' and a 'read()', i.e.
+several bus round trips, per point. The sweepers upload the whole list of
+voltages, trigger it once and fetch all readings in a single transfer, so a
+sweep takes about the integration time of its points. The readings come
+back as binary floats ('real64' by default, see 'buffer_format'):
+
+* 'ScpiListSweeper': SCPI list sweep of the 2400 ('SOUR:LIST:VOLT'),
+* 'TspListSweeper': trigger model list sweep of a 2600 channel
+  ('smuX.trigger.source.listv()'),
+* 'TspDualChannelLoop': steps one channel of a 2602A/2636A and measures
+  both channels at the same instant, in a loop of a TSP function which
+  returns the points in batches.
+
+Both hold the lock of the instrument for the whole sweep and leave the
+source at the last voltage of the list with the output on, as a stepped
+sweep would.
+
+:usage:
+voltages, currents = get_sweeper(lease).sweep(np.linspace(0, 1, 100), current_limit=1e-6, nplc=1)
+"""
+from datetime import datetime
+from threading import Event, RLock
+from typing import Any, ContextManager, Iterator, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .buffer_format import DEFAULT_FORMAT, read_values, scpi_format, tsp_format
+
+# Values per list command; longer lists are sent in pieces:
+MAX_LIST_POINTS = 100
+# Points measured by one call of the TSP loop of 'TspDualChannelLoop':
+DUAL_BATCH_POINTS = 25
+# Points of one list sweep in 'batches()'; an abort is noticed between two of them:
+SWEEP_BATCH_POINTS = 100
+# Time allowed for talking to the instrument besides the integration time (seconds):
+TIMEOUT_MARGIN = 10.0
+LINE_FREQUENCY = 50.0  # Hz
+
+# Stands in for the lock of an instrument when none is given:
+_NO_LOCK = RLock()
+
+
+def _pieces(values: Sequence[float], size: int = MAX_LIST_POINTS) -> Iterator[str]:
+    for start in range(0, len(values), size):
+        yield ','.join('{:.6g}'.format(value) for value in values[start:start + size])
+
+
+class _ListSweeper:
+    """Common part of the sweepers: locking and the timeout of the final read."""
+
+    # A reading takes up to this many integrations, e.g. with auto zero on a 2400:
+    CONVERSIONS_PER_READING = 3
+    # Seconds per reading besides the integrations and the source delay:
+    READING_OVERHEAD = 0.003
+    # Most points of one list sweep; None for no limit:
+    MAX_POINTS = None  # type: Optional[int]
+
+    def __init__(self, resource: Any, lock: Optional[ContextManager] = None,
+                 data_format: str = DEFAULT_FORMAT) -> None:
+        """
+        :param resource: VISA resource of the sourcemeter
+        :param lock: Held during the sweep, e.g. 'lease.lock()'
+        :param data_format: Transfer format of the readings, 'ascii', 'real32' or 'real64'
+        """
+        self._resource = resource
+        self._lock = lock
+        self._data_format = data_format
+
+    def sweep(self, voltages: Sequence[float], current_limit: float, nplc: float = 1.0,
+              delay: float = 0.0) -> Tuple[np.ndarray, np.ndarray]:
+        """Source the voltages one after the other and measure the current at each.
+
+        :param voltages: Voltages to source
+        :param current_limit: Compliance current in A
+        :param nplc: Integration time in power line cycles
+        :param delay: Source delay before each measurement in seconds
+        :returns: Sourced voltages and measured currents
+        """
+        voltages = np.asarray(voltages, dtype=float)
+        if len(voltages) == 0:
+            return voltages, voltages.copy()
+        if self.MAX_POINTS is not None and len(voltages) > self.MAX_POINTS:
+            raise ValueError('A list sweep has at most {} points, not {}; use batches().'
+                             .format(self.MAX_POINTS, len(voltages)))
+
+        # Generous, a timeout loses the whole sweep:
+        duration = len(voltages) * (self.CONVERSIONS_PER_READING * nplc / LINE_FREQUENCY + delay
+                                    + self.READING_OVERHEAD)
+        old_timeout = self._resource.timeout
+        self._resource.timeout = 1000 * (duration + TIMEOUT_MARGIN)  # milliseconds
+        try:
+            if self._lock is None:
+                return self._sweep(voltages, current_limit, nplc, delay)
+            with self._lock:
+                return self._sweep(voltages, current_limit, nplc, delay)
+        finally:
+            self._resource.timeout = old_timeout
+
+    def batches(self, voltages: Sequence[float], current_limit: float, nplc: float = 1.0, delay: float = 0.0,
+                should_stop: Optional[Event] = None,
+                batch_points: int = SWEEP_BATCH_POINTS) -> Iterator[Tuple[datetime, np.ndarray, np.ndarray]]:
+        """Sweep the voltages as several list sweeps; yield the start time, voltages and currents of each.
+
+        A sweep of many points blocks for a long time, so it is split into
+        batches of 'batch_points'; none is started once 'should_stop' is set.
+        See 'sweep()' for the other parameters.
+        """
+        voltages = np.asarray(voltages, dtype=float)
+        for start in range(0, len(voltages), batch_points):
+            if should_stop is not None and should_stop.is_set():
+                return
+            started = datetime.now()
+            yield (started,) + self.sweep(voltages[start:start + batch_points], current_limit, nplc, delay)
+
+    def _sweep(self, voltages: np.ndarray, current_limit: float, nplc: float,
+               delay: float) -> Tuple[np.ndarray, np.ndarray]:
+        raise NotImplementedError()
+
+
+class ScpiListSweeper(_ListSweeper):
+    """List sweep of a Keithley 2400."""
+
+    # Largest trigger count of the 2400:
+    MAX_POINTS = 2500
+
+    # Settings the sweep changes and restores afterwards; the drivers do not set them again:
+    RESTORED = (':FORM:ELEM', ':SENS:CURR:NPLC', ':SOUR:DEL', ':SOUR:DEL:AUTO')
+
+    def _sweep(self, voltages: np.ndarray, current_limit: float, nplc: float,
+               delay: float) -> Tuple[np.ndarray, np.ndarray]:
+        write = self._resource.write
+        restore = [(setting, self._resource.query(setting + '?').strip()) for setting in self.RESTORED]
+        write(':SOUR:FUNC VOLT')
+        write(':SENS:FUNC "CURR"')
+        write(':SENS:CURR:PROT {:g}'.format(current_limit))
+        write(':SENS:CURR:NPLC {:g}'.format(nplc))
+        write(':SOUR:DEL {:g}'.format(delay))
+        pieces = _pieces(voltages)
+        write(':SOUR:LIST:VOLT {}'.format(next(pieces)))
+        for piece in pieces:
+            write(':SOUR:LIST:VOLT:APP {}'.format(piece))
+        write(':SOUR:VOLT:MODE LIST')
+        write(':TRIG:COUN {}'.format(len(voltages)))
+        write(':FORM:ELEM VOLT,CURR')
+        write(':OUTP ON')
+        try:
+            with scpi_format(self._resource, self._data_format):
+                readings = read_values(self._resource, ':READ?', 2 * len(voltages), self._data_format).reshape(-1, 2)
+        finally:
+            # Back to single values; the source stays at the last voltage:
+            write(':SOUR:VOLT:MODE FIXED')
+            write(':SOUR:VOLT {:g}'.format(voltages[-1]))
+            write(':TRIG:COUN 1')
+            for setting, value in restore:
+                write('{} {}'.format(setting, value))
+        return readings[:, 0], readings[:, 1]
+
+
+class TspListSweeper(_ListSweeper):
+    """Trigger model list sweep of one channel of a Keithley 2602A/2636A."""
+
+    def __init__(self, resource: Any, channel: str = 'smua', lock: Optional[ContextManager] = None,
+                 data_format: str = DEFAULT_FORMAT) -> None:
+        """
+        :param channel: 'smua' or 'smub'
+        """
+        super().__init__(resource, lock, data_format)
+        self.channel = channel
+
+    def _sweep(self, voltages: np.ndarray, current_limit: float, nplc: float,
+               delay: float) -> Tuple[np.ndarray, np.ndarray]:
+        smu = self.channel
+        write = self._resource.write
+        # Restored afterwards; the drivers do not set them again:
+        restore = [(setting, self._resource.query('print({})'.format(setting.format(smu))).strip())
+                   for setting in ('{0}.measure.nplc', '{0}.source.delay')]
+        pieces = _pieces(voltages)
+        write('sweep_voltages = {{{}}}'.format(next(pieces)))
+        for piece in pieces:
+            write('for _, v in ipairs({{{}}}) do table.insert(sweep_voltages, v) end'.format(piece))
+
+        try:
+            for command in ('{0}.source.func = {0}.OUTPUT_DCVOLTS',
+                            '{0}.source.limiti = {1:g}',
+                            '{0}.measure.nplc = {2:g}',
+                            '{0}.source.delay = {3:g}',
+                            '{0}.nvbuffer1.clear()',
+                            '{0}.nvbuffer1.collectsourcevalues = 1',
+                            '{0}.trigger.source.listv(sweep_voltages)',
+                            '{0}.trigger.source.action = {0}.ENABLE',
+                            '{0}.trigger.measure.i({0}.nvbuffer1)',
+                            '{0}.trigger.measure.action = {0}.ENABLE',
+                            '{0}.trigger.endpulse.action = {0}.SOURCE_HOLD',
+                            '{0}.trigger.arm.count = 1',
+                            '{0}.trigger.count = {4}',
+                            '{0}.source.output = {0}.OUTPUT_ON',
+                            '{0}.trigger.initiate()',
+                            'waitcomplete()'):
+                write(command.format(smu, current_limit, nplc, delay, len(voltages)))
+
+            query = 'printbuffer(1, {1}, {0}.nvbuffer1.sourcevalues, {0}.nvbuffer1.readings)'.format(smu, len(voltages))
+            with tsp_format(self._resource, self._data_format):
+                readings = read_values(self._resource, query, 2 * len(voltages), self._data_format).reshape(-1, 2)
+            write('{0}.source.levelv = {1:g}'.format(smu, voltages[-1]))
+        finally:
+            for setting, value in restore:
+                write('{} = {}'.format(setting.format(smu), value))
+        return readings[:, 0], readings[:, 1]
+
+
+class DualChannelBatch(NamedTuple):
+    """Points of both channels measured by one call of the TSP loop, as columns.
+
+    Attributes:
+        time: Estimated times of the points ('datetime64[us]')
+        voltage, current: Voltages and currents of the stepped channel
+        other_voltage, other_current: Voltages and currents of the other channel
+    """
+    time: np.ndarray
+    voltage: np.ndarray
+    current: np.ndarray
+    other_voltage: np.ndarray
+    other_current: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.voltage)
+
+
+class TspDualChannelLoop:
+    """Steps the voltage of one channel of a 2602A/2636A and measures both channels on the instrument.
+
+    For every level the TSP function sets the stepped channel, waits
+    'settle' seconds and starts an overlapped measurement of its voltage
+    and current while the other channel measures, so both readings belong
+    to the same instant. The buffers append every reading ('appendmode'),
+    and the points of a batch are returned with one 'printbuffer()'. The
+    channels keep the source and measure configuration set by their
+    drivers.
+    """
+
+    FUNCTION = ('function dasmess_dual_step(stepped, other, levels, count, settle) '
+                'for _, buffer in ipairs({stepped.nvbuffer1, stepped.nvbuffer2, other.nvbuffer1, other.nvbuffer2}) do '
+                'buffer.clear() '
+                'buffer.appendmode = 1 '
+                'end '
+                'for k = 1, count do '
+                'stepped.source.levelv = levels[k] '
+                'if settle > 0 then delay(settle) end '
+                'stepped.measure.overlappediv(stepped.nvbuffer1, stepped.nvbuffer2) '
+                'other.measure.iv(other.nvbuffer1, other.nvbuffer2) '
+                'waitcomplete() '
+                'end '
+                'printbuffer(1, count, stepped.nvbuffer2, stepped.nvbuffer1, other.nvbuffer2, other.nvbuffer1) '
+                'end')
+
+    def __init__(self, resource: Any, stepped: str = 'smua', other: str = 'smub',
+                 lock: Optional[ContextManager] = None, batch_points: int = DUAL_BATCH_POINTS,
+                 data_format: str = DEFAULT_FORMAT) -> None:
+        """
+        :param resource: VISA resource of the sourcemeter
+        :param stepped: Channel whose voltage is stepped, 'smua' or 'smub'
+        :param other: Channel which is measured along, 'smua' or 'smub'
+        :param lock: Held during each batch, e.g. 'lease.lock()'
+        :param batch_points: Points per batch, at most 'MAX_LIST_POINTS'
+        :param data_format: Transfer format of the readings, 'ascii', 'real32' or 'real64'
+        """
+        self._resource = resource
+        self._stepped = stepped
+        self._other = other
+        self._lock = lock
+        self._batch_points = min(batch_points, MAX_LIST_POINTS)
+        self._data_format = data_format
+
+    def run(self, levels: Sequence[float], nplc: float = 1.0, settle: float = 0.0) -> Iterator[DualChannelBatch]:
+        """Step through the levels; yield the points batch by batch.
+
+        Stop iterating to abort between two batches.
+
+        :param levels: Voltages of the stepped channel
+        :param nplc: Integration time the channels are configured with, for the timeout
+        :param settle: Seconds between setting a level and measuring
+        """
+        levels = np.asarray(levels, dtype=float)
+        # Both channels measure in parallel, so a point takes one integration time:
+        timeout = 1000 * (self._batch_points * (nplc / LINE_FREQUENCY + settle) + TIMEOUT_MARGIN)
+        with self._locked():
+            self._resource.write(self.FUNCTION)
+        for start in range(0, len(levels), self._batch_points):
+            yield self._batch(levels[start:start + self._batch_points], settle, timeout)
+
+    def _batch(self, levels: np.ndarray, settle: float, timeout: float) -> DualChannelBatch:
+        old_timeout = self._resource.timeout
+        self._resource.timeout = timeout
+        try:
+            with self._locked():
+                return self._measure_batch(levels, settle)
+        finally:
+            self._resource.timeout = old_timeout
+
+    def _locked(self) -> ContextManager:
+        return self._lock if self._lock is not None else _NO_LOCK
+
+    def _measure_batch(self, levels: np.ndarray, settle: float) -> DualChannelBatch:
+        self._resource.write('dual_levels = {{{}}}'.format(next(_pieces(levels))))
+        query = 'dasmess_dual_step({}, {}, dual_levels, {}, {:g})'.format(
+            self._stepped, self._other, len(levels), settle)
+        with tsp_format(self._resource, self._data_format):
+            started = datetime.now()
+            readings = read_values(self._resource, query, 4 * len(levels), self._data_format).reshape(-1, 4)
+        finished = datetime.now()
+
+        # The points are spread evenly between the call and its answer:
+        fractions = np.arange(1, len(readings) + 1) / len(readings)
+        microseconds = fractions * (finished - started).total_seconds() * 1e6
+        time = np.datetime64(started, 'us') + microseconds.astype('timedelta64[us]')
+        return DualChannelBatch(time, *readings.T)
+
+
+def point_times(started: datetime, count: int, nplc: float = 1.0, delay: float = 0.0) -> np.ndarray:
+    """Return estimated times ('datetime64[us]') of the points of a sweep which was triggered at 'started'."""
+    seconds = np.arange(1, count + 1) * (nplc / LINE_FREQUENCY + delay)
+    return np.datetime64(started, 'us') + (seconds * 1e6).astype('timedelta64[us]')
+
+
+def tsp_channel(sub_device: Any) -> str:
+    """Return the TSP name of a channel, e.g. 'smua' for 'SMUChannel.channelA'."""
+    name = str(getattr(sub_device, 'value', sub_device))
+    if name.startswith('smu'):
+        return name
+    return 'smu' + str(getattr(sub_device, 'name', name))[-1].lower()
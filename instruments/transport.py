@@ -0,0 +1,443 @@
+"""Message-based I/O with GPIB instruments over exchangeable backends.
+
+'Instrument' implements the interface the instrument drivers expect
+('write()', 'read()', 'ask()', 'clear()', 'close()') on top of a backend:
+
+* 'LinuxGpibBackend' talks to linux-gpib directly,
+* 'VisaBackend' wraps an open pyvisa resource,
+* 'SimulatedBackend' answers from a table, for tests and benchmarks.
+
+Responses are read in chunks of 'chunk_size' bytes until the backend
+reports the end of the message (END/EOI), so long answers are no longer cut
+off. 'read()' and 'ask()' return bytes, as the drivers of 'scientificdevices'
+expect from linux-gpib. Every
+call can have its own timeout, several queries can be sent as one message
+('pipeline()'), and the time spent in each kind of call is counted
+('stats'). Instruments opened by 'open_instrument()' run every transaction
+under the locks of their device and bus (see 'instruments.locks').
+
+:usage:
+device = get_gpib_device(24)
+print(device.ask('V'), device.stats)
+"""
+import os
+from collections import deque
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter, sleep
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+
+from .locks import LockManager
+
+DEFAULT_CHUNK_SIZE = 4096
+DEFAULT_TIMEOUT = 0.5  # seconds
+
+# END bit of the linux-gpib status word 'ibsta': the last byte was sent with EOI.
+IBSTA_END = 0x2000
+
+# Backend used by 'get_gpib_device()': 'linux-gpib', 'visa' or 'simulated'
+DEFAULT_BACKEND = os.environ.get('DASMESS_GPIB_BACKEND', 'linux-gpib')
+
+
+def get_gpib_timeout(timeout):
+    """ returns the correct timeout object to a certain timeoutvalue
+        it will find the nearest match, e.g., 120us will be 100us
+
+        Arguments:
+        timeout -- (float) number of seconds to wait until timeout
+    """
+    import gpib
+
+    gpib_timeout_list = [(0, gpib.TNONE), \
+                         (10e-6, gpib.T10us), \
+                         (30e-6, gpib.T30us), \
+                         (100e-6, gpib.T100us), \
+                         (300e-6, gpib.T300us), \
+                         (1e-3, gpib.T1ms), \
+                         (3e-3, gpib.T3ms), \
+                         (10e-3, gpib.T10ms), \
+                         (30e-3, gpib.T30ms), \
+                         (100e-3, gpib.T100ms), \
+                         (300e-3, gpib.T300ms), \
+                         (1, gpib.T1s), \
+                         (3, gpib.T3s), \
+                         (10, gpib.T10s), \
+                         (30, gpib.T30s), \
+                         (100, gpib.T100s), \
+                         (300, gpib.T300s), \
+                         (1000, gpib.T1000s)]
+
+    for val, res in gpib_timeout_list:
+        if timeout <= val:
+            return res
+    return gpib.T1000s
+
+
+class LinuxGpibBackend:
+    """Raw linux-gpib device handle."""
+
+    def __init__(self, device: int) -> None:
+        """
+        :param device: Handle returned by 'gpib.dev()'
+        """
+        import gpib
+
+        self._gpib = gpib
+        self._device = device
+        self._timeout = None  # type: Optional[float]
+
+    @classmethod
+    def open(cls, board: int, port: int) -> 'LinuxGpibBackend':
+        import gpib
+
+        return cls(gpib.dev(board, port))
+
+    def set_timeout(self, timeout: float) -> None:
+        if timeout != self._timeout:
+            self._gpib.timeout(self._device, get_gpib_timeout(timeout))
+            self._timeout = timeout
+
+    def write(self, data: bytes) -> None:
+        self._gpib.write(self._device, data)
+
+    def read(self, size: int) -> Tuple[bytes, bool]:
+        """Read up to 'size' bytes; return them and whether the instrument ended the message."""
+        data = self._gpib.read(self._device, size)
+        ibsta = getattr(self._gpib, 'ibsta', None)
+        if ibsta is None:
+            # Old bindings without the status word: a short read is the end.
+            return data, len(data) < size
+        return data, bool(ibsta() & IBSTA_END)
+
+    def clear(self) -> None:
+        self._gpib.clear(self._device)
+
+    def close(self) -> None:
+        self._gpib.close(self._device)
+
+
+class VisaBackend:
+    """An open pyvisa resource."""
+
+    def __init__(self, resource: Any) -> None:
+        self._resource = resource
+        self._timeout = None  # type: Optional[float]
+
+    @classmethod
+    def open(cls, address: str, library: str = '@py') -> 'VisaBackend':
+        from .pool import InstrumentPool
+
+        return cls(InstrumentPool.instance().resource_manager(library).open_resource(address))
+
+    def set_timeout(self, timeout: float) -> None:
+        if timeout != self._timeout:
+            self._resource.timeout = 1000 * timeout  # milliseconds
+            self._timeout = timeout
+
+    def write(self, data: bytes) -> None:
+        self._resource.write_raw(data)
+
+    def read(self, size: int) -> Tuple[bytes, bool]:
+        # pyvisa reads until END itself, so one call returns the whole message:
+        return self._resource.read_raw(size), True
+
+    def clear(self) -> None:
+        self._resource.clear()
+
+    def close(self) -> None:
+        self._resource.close()
+
+
+class SimulatedBackend:
+    """Answers queries from a table or a function instead of a bus.
+
+    Written messages are kept in 'written'. A written message that matches a
+    key of 'responses' (after stripping the termination) queues the answer,
+    which can be a string, bytes or a function of the message. Every answer
+    is one message; its last byte is sent with END.
+    """
+
+    def __init__(self, responses: Union[Mapping[str, Any], Callable[[str], Any], None] = None,
+                 latency: float = 0.0, default: str = '') -> None:
+        """
+        :param responses: Answers by query, or a function which returns the answer to a query
+        :param latency: Seconds every write and read takes, to imitate a bus
+        :param default: Answer to queries which are not in 'responses'
+        """
+        self._responses = responses if responses is not None else dict()
+        self._latency = latency
+        self._default = default
+        self._pending = deque()  # type: deque
+        self.written = []  # type: List[str]
+        self.timeout = None  # type: Optional[float]
+        self.closed = False
+
+    def set_timeout(self, timeout: float) -> None:
+        self.timeout = timeout
+
+    def write(self, data: bytes) -> None:
+        if self._latency:
+            sleep(self._latency)
+        message = data.decode().rstrip('\r\n')
+        self.written.append(message)
+        if callable(self._responses):
+            answer = self._responses(message)
+        else:
+            answer = self._responses.get(message, self._default if message.endswith('?') else None)
+        if answer is None:
+            return
+        if isinstance(answer, str):
+            answer = (answer + '\n').encode()
+        self._pending.append(answer)
+
+    def read(self, size: int) -> Tuple[bytes, bool]:
+        if self._latency:
+            sleep(self._latency)
+        if not self._pending:
+            raise TimeoutError('Simulated instrument has nothing to send.')
+        message = self._pending.popleft()
+        data, rest = message[:size], message[size:]
+        if rest:
+            self._pending.appendleft(rest)
+        return data, not rest
+
+    def clear(self) -> None:
+        self._pending.clear()
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class TransportStats:
+    """Number of calls and time spent per kind of call ('write', 'read', ...)."""
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._calls = dict()  # type: Dict[str, List[float]]
+
+    def record(self, kind: str, duration: float) -> None:
+        with self._lock:
+            entry = self._calls.setdefault(kind, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += duration
+            entry[2] = max(entry[2], duration)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Return count, total, mean and maximum time in seconds per kind of call."""
+        with self._lock:
+            return {kind: {'count': count, 'total': total, 'mean': total / count, 'max': maximum}
+                    for kind, (count, total, maximum) in self._calls.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._calls.clear()
+
+    def __repr__(self) -> str:
+        return ', '.join('{}: {} x {:.2f} ms (max {:.2f} ms)'.format(
+            kind, int(entry['count']), 1000 * entry['mean'], 1000 * entry['max'])
+            for kind, entry in sorted(self.summary().items()))
+
+
+class GenericInstrument(object):
+    """ This is an abstract class for a generic instrument """
+    def __init__(self):
+        """ Initialises the generic instrument """
+        self.term_chars = '\n'
+
+    def ask(self, query):
+        """ ask will write a request and waits for an answer
+
+            Arguments:
+            query -- (string) the query which shall be sent
+
+            Result:
+            (string) -- answer from device
+        """
+        self.write(query)
+        return self.read()
+
+    def write(self, query):
+        """ writes a query to remote device
+
+            Arguments:
+            query -- (string) the query which shall be sent
+        """
+        pass
+
+    def read(self):
+        """ reads a message from remote device
+
+            Result:
+            (string) -- message from remote device
+        """
+        pass
+
+    def close(self):
+        """ closes connection to remote device """
+        pass
+
+
+class Instrument(GenericInstrument):
+    """ Implementation of GenericInstrument on top of a transport backend """
+
+    def __init__(self, backend: Any, timeout: float = DEFAULT_TIMEOUT,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, encoding: str = 'ascii',
+                 lock_key: Optional[Hashable] = None) -> None:
+        """
+        :param backend: One of the backends of this module
+        :param timeout: Default timeout of every call in seconds
+        :param chunk_size: Number of bytes requested per read call
+        :param encoding: Encoding of text messages
+        :param lock_key: Device key in 'LockManager', e.g. ('gpib', 0, 24); None for no locking
+        """
+        GenericInstrument.__init__(self)
+        self.backend = backend
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.encoding = encoding
+        self.lock_key = lock_key
+        self.stats = TransportStats()
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """Hold the device and bus locks, e.g. around a write and its read."""
+        if self.lock_key is None:
+            yield
+        else:
+            with LockManager.instance().transaction(self.lock_key):
+                yield
+
+    def _with_timeout(self, timeout: Optional[float]) -> None:
+        self.backend.set_timeout(self.timeout if timeout is None else timeout)
+
+    def write(self, query: str, timeout: Optional[float] = None) -> None:
+        """ writes a query to remote device
+
+            Arguments:
+            query -- (string) the query which shall be sent
+            timeout -- (float) seconds to wait instead of the default timeout
+        """
+        self.write_raw((query + self.term_chars).encode(self.encoding), timeout)
+
+    def write_raw(self, data: bytes, timeout: Optional[float] = None) -> None:
+        with self.transaction():
+            self._with_timeout(timeout)
+            start = perf_counter()
+            self.backend.write(data)
+        self.stats.record('write', perf_counter() - start)
+
+    def read_raw(self, timeout: Optional[float] = None) -> bytes:
+        """Read one complete message as bytes, chunk by chunk."""
+        with self.transaction():
+            self._with_timeout(timeout)
+            start = perf_counter()
+            chunks = []
+            end = False
+            while not end:
+                chunk, end = self.backend.read(self.chunk_size)
+                chunks.append(chunk)
+        self.stats.record('read', perf_counter() - start)
+        return b''.join(chunks)
+
+    def read(self, timeout: Optional[float] = None) -> bytes:
+        """ reads a message from remote device
+
+            Arguments:
+            timeout -- (float) seconds to wait instead of the default timeout
+
+            Result:
+            (bytes) -- message from remote device, without trailing whitespace
+        """
+        return self.read_raw(timeout).rstrip()
+
+    def ask(self, query: str, timeout: Optional[float] = None) -> bytes:
+        """ ask will write a request and waits for an answer
+
+            Arguments:
+            query -- (string) the query which shall be sent
+            timeout -- (float) seconds to wait instead of the default timeout
+
+            Result:
+            (bytes) -- answer from device
+        """
+        start = perf_counter()
+        with self.transaction():
+            self.write(query, timeout)
+            answer = self.read(timeout)
+        self.stats.record('ask', perf_counter() - start)
+        return answer
+
+    query = ask
+
+    def pipeline(self, queries: Sequence[str], separator: Optional[str] = ';',
+                 timeout: Optional[float] = None) -> List[str]:
+        """Send several queries and return their answers.
+
+        With a 'separator' (SCPI instruments and the SR830 use ';') the queries
+        go out as one message and the answers come back as one message, which
+        costs one bus turnaround instead of one per query. Instruments without
+        compound commands need 'separator=None'; the queries are then asked
+        one after the other. The answers are decoded to text.
+        """
+        if separator is None:
+            return [self.ask(query, timeout).decode(self.encoding, errors='replace').strip() for query in queries]
+
+        start = perf_counter()
+        with self.transaction():
+            self.write(separator.join(queries), timeout)
+            answers = self.read(timeout).decode(self.encoding, errors='replace').split(separator)
+        self.stats.record('pipeline', perf_counter() - start)
+        if len(answers) != len(queries):
+            raise ValueError('Expected {} answers to {}, got {!r}.'.format(
+                len(queries), list(queries), answers))
+        return [answer.strip() for answer in answers]
+
+    def close(self) -> None:
+        """ closes connection to remote device """
+        self.backend.close()
+
+    def clear(self) -> None:
+        """ clears all communication buffers """
+        with self.transaction():
+            self.backend.clear()
+
+
+class GpibInstrument(Instrument):
+    """ Instrument on a linux-gpib device handle """
+    def __init__(self, device, timeout: float = DEFAULT_TIMEOUT, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 lock_key: Optional[Hashable] = None):
+        """ initializes connection to gpib device
+
+            Arguments:
+            device - (gpib.dev) a gpib object to speak to
+        """
+        Instrument.__init__(self, LinuxGpibBackend(device), timeout=timeout, chunk_size=chunk_size,
+                            lock_key=lock_key)
+        self.device = device
+
+
+def open_instrument(port: int, timeout: float = DEFAULT_TIMEOUT, backend: Optional[str] = None,
+                    board: int = 0, chunk_size: int = DEFAULT_CHUNK_SIZE, **options) -> Instrument:
+    """Open the instrument at a GPIB primary address.
+
+    :param port: Primary GPIB address
+    :param timeout: Default timeout of every call in seconds
+    :param backend: 'linux-gpib', 'visa' or 'simulated'; 'DEFAULT_BACKEND' if not given
+    :param board: GPIB board index
+    :param chunk_size: Number of bytes requested per read call
+    :param options: 'library' for 'visa', the arguments of 'SimulatedBackend' for 'simulated'
+    """
+    backend = DEFAULT_BACKEND if backend is None else backend
+    if backend == 'linux-gpib':
+        transport = LinuxGpibBackend.open(board, port)
+    elif backend == 'visa':
+        transport = VisaBackend.open('GPIB{}::{}::INSTR'.format(board, port), **options)
+    elif backend == 'simulated':
+        transport = SimulatedBackend(**options)
+    else:
+        raise ValueError('Unknown GPIB backend "{}".'.format(backend))
+    return Instrument(transport, timeout=timeout, chunk_size=chunk_size, lock_key=('gpib', board, port))
+
+
+def get_gpib_device(port: int, timeout=DEFAULT_TIMEOUT):
+    return open_instrument(port, timeout)
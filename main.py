@@ -6,8 +6,9 @@ from PyQt5.QtWidgets import QApplication
 from main_ui import MainUI
 from windows.table_window import TableWindow
 from windows.plot_window import PlotWindow
+from windows.refresh_scheduler import RefreshScheduler
 from windows.dynamic_input import DynamicInputLayout, delete_children
-import pandas as pd
+from data_store import DataStore
 
 import os
 from threading import Thread
@@ -15,7 +16,8 @@ from threading import Thread
 from datetime import datetime
 
 import measurement
-from measurement.measurement import SignalInterface, Contacts, AbstractMeasurement
+from measurement.measurement import SignalInterface, Contacts, AbstractMeasurement, CoalescingSignalInterface
+from measurement.measurement import OutputFormat
 from typing import Dict, List, Union, Tuple, Type
 
 from configparser import ConfigParser
@@ -26,6 +28,7 @@ from windows.gpib_picker import GPIBPicker
 class SignalDataAcquisition(QtCore.QObject, SignalInterface):
     finished = QtCore.pyqtSignal(object)
     data = QtCore.pyqtSignal(object)
+    data_batch = QtCore.pyqtSignal(object)
     started = QtCore.pyqtSignal()
     aborted = QtCore.pyqtSignal()
     status = QtCore.pyqtSignal(str)
@@ -39,6 +42,9 @@ class SignalDataAcquisition(QtCore.QObject, SignalInterface):
     def emit_data(self, something):
         self.data.emit(something)
 
+    def emit_data_batch(self, something):
+        self.data_batch.emit(something)
+
     def emit_started(self):
         self.started.emit()
 
@@ -92,6 +98,7 @@ class Main(MainUI):
         self.__signal_interface = SignalDataAcquisition()
         self.__signal_interface.finished.connect(self.__finished)
         self.__signal_interface.data.connect(self.__new_data)
+        self.__signal_interface.data_batch.connect(self.__new_data_batch)
         self.__signal_interface.aborted.connect(self.__measurement_aborted)
         self.__signal_interface.status.connect(self._show_status)
         self.__signal_interface.started.connect(self.__started)
@@ -106,12 +113,25 @@ class Main(MainUI):
             self._config['general'] = {'last_folder': '/tmp'}
             self._directory_name = '/tmp'
 
+        max_refresh_rate = self._config['general'].getfloat(
+            'max_refresh_rate', fallback=RefreshScheduler.DEFAULT_MAX_RATE
+        )
+        self.__refresh_scheduler = RefreshScheduler(max_refresh_rate, parent=self)
+        self.__refresh_scheduler.refresh.connect(self.__refresh_views)
+
         self._measurement_class = AbstractMeasurement
         self._measurement = None  # type: AbstractMeasurement
 
         self._init_gui()
         self.__setup_connections()
 
+        try:
+            output_format = OutputFormat(self._config['general'].get('output_format', OutputFormat.TEXT.value))
+        except ValueError as error:
+            print('WARNING', 'Unknown output format in the configuration, writing text files: {}'.format(error))
+            output_format = OutputFormat.TEXT
+        self._output_format_box.setCurrentIndex(self._output_format_box.findData(output_format))
+
         self._dir_picker.directory = self._directory_name
 
     def __setup_connections(self):
@@ -122,14 +142,27 @@ class Main(MainUI):
         self._measure_button.clicked.connect(self.__start__measurement)
         self._abort_button.clicked.connect(self.__abort_measurement)
         self._next_button.clicked.connect(self.__increment_contact_number)
+        self._output_format_box.currentIndexChanged.connect(lambda index: self._update_config())
+
+    def __measurement_method_selected(self, title, method: measurement.MeasurementEntry):
+        self.setWindowTitle('{} -- {}'.format(self.TITLE, title))
+
+        # The module of a method and its drivers are only imported once it is selected:
+        try:
+            cls = method.load()
+        except ImportError as error:
+            self._set_input_ui(method)
+            print('WARNING', error)
+            self._show_status(str(error))
+            self._measure_button.setEnabled(False)
+            self._next_button.setEnabled(False)
+            return
 
-    def __measurement_method_selected(self, title, cls: AbstractMeasurement):
         for button in [self._next_button, self._abort_button, self._measure_button]:
             button.setEnabled(True)
 
-        self.setWindowTitle('{} -- {}'.format(self.TITLE, title))
+        self._set_input_ui(method)
         self._measurement_class = cls
-        self._set_input_ui(cls)
 
         number_of_contacts = cls.number_of_contacts()
 
@@ -156,10 +189,13 @@ class Main(MainUI):
             else:
                 return
 
-        self._measurement = self._measurement_class(self.__signal_interface,
+        # Points emitted one by one reach the UI in batches:
+        signal_interface = CoalescingSignalInterface(self.__signal_interface)
+        self._measurement = self._measurement_class(signal_interface,
                                                     path, contacts, **inputs)
+        self._measurement.output_format = self._output_format_box.currentData()
 
-        self.__df = pd.DataFrame()
+        self.__store = DataStore(self._measurement_class.outputs())
 
         self._plot_windows = {}
 
@@ -198,6 +234,9 @@ class Main(MainUI):
         return self._dir_picker.directory
 
     def __finished(self, data_dict):
+        # Make sure the plots show all data before saving them:
+        self.__refresh_scheduler.flush()
+
         # Save plots:
         for axis_label_pair in list(data_dict.keys()):
             if axis_label_pair in self._plot_windows.keys():
@@ -209,11 +248,18 @@ class Main(MainUI):
         self._set_ui_state(True)
 
     def __new_data(self, data_dict):
-        self.__df = self.__df.append(data_dict, ignore_index=True)
-        self._tb_window.update_data(self.__df)
+        self.__store.append(data_dict)
+        self.__refresh_scheduler.mark_dirty()
+
+    def __new_data_batch(self, columns):
+        self.__store.extend(columns)
+        self.__refresh_scheduler.mark_dirty()
+
+    def __refresh_views(self):
+        self._tb_window.update_data(self.__store)
 
         for pair, window in self._plot_windows.items():
-            window.update_data(self.__df[list(pair)])
+            window.update_data(*self.__store.columns(pair))
 
     def __measurement_aborted(self):
         self._show_status('Measurement aborted.')
@@ -233,6 +279,7 @@ class Main(MainUI):
             self._config['general'] = {}
 
         self._config['general']['last_folder'] = self._directory_name
+        self._config['general']['output_format'] = self._output_format_box.currentData().value
 
         with open('settings.cfg', 'w') as file_handle:
             self._config.write(file_handle)
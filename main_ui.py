@@ -3,17 +3,23 @@ from windows.table_window import TableWindow
 from windows.dynamic_input import DynamicInputLayout
 
 from datetime import datetime
+from time import perf_counter
 from PyQt5 import QtCore, QtWidgets, QtGui
 from typing import Type
 
 from windows.contacts_picker import ContactsPicker
 from windows.directory_picker import DirectoryPicker
+from measurement.measurement import OutputFormat
 
 
 class MainUI(QtWidgets.QMainWindow):
     """Class that generates the layout for the main application window."""
 
     SIDE_BAR_WIDTH = 200
+
+    OUTPUT_FORMATS = [("Text (.dat)", OutputFormat.TEXT),
+                      ("Binary (.chunks)", OutputFormat.BINARY),
+                      ("Text and binary", OutputFormat.TEXT_AND_BINARY)]
     
     def __init__(self):
         super().__init__()
@@ -57,9 +63,19 @@ class MainUI(QtWidgets.QMainWindow):
         for method in available_methods:
             self._method_selection_box.addItem(method)
 
+        format_layout = QtWidgets.QVBoxLayout()
+        format_layout.setSpacing(3)
+        self._inputs_layout.addLayout(format_layout)
+        format_layout.addWidget(QtWidgets.QLabel("Output format:"))
+        self._output_format_box = QtWidgets.QComboBox()
+        self._output_format_box.setFixedWidth(self.SIDE_BAR_WIDTH)
+        format_layout.addWidget(self._output_format_box)
+        for label, output_format in self.OUTPUT_FORMATS:
+            self._output_format_box.addItem(label, output_format)
+
         self._dynamic_inputs_area = QtWidgets.QScrollArea()
-        # Initialise and hold all dynamic inputs in memory:
-        self._dynamic_inputs = dict()  # type: Dict[Type, QtWidgets.QWidget]
+        # Dynamic inputs are created when a method is first selected and then kept in memory:
+        self._dynamic_inputs = dict()  # type: Dict[measurement.MeasurementEntry, QtWidgets.QWidget]
         self.__create_input_ui()
 
         self._dynamic_inputs_area.setFrameShape(QtWidgets.QFrame.NoFrame)
@@ -154,13 +170,17 @@ class MainUI(QtWidgets.QMainWindow):
 
     def _set_ui_state(self, enable: bool):
         self._method_selection_box.setEnabled(enable)
+        self._output_format_box.setEnabled(enable)
         self._abort_button.setEnabled(not enable)
         self._measure_button.setEnabled(enable)
         self._next_button.setEnabled(enable)
         self._dynamic_inputs_layout.setEnabled(enable)
 
-    def _set_input_ui(self, measurement_method: measurement.measurement.AbstractMeasurement):
-        """Show the dynamic inputs for a measurement method."""
+    def _set_input_ui(self, measurement_method: measurement.MeasurementEntry):
+        """Show the dynamic inputs for a measurement method, creating them on first use."""
+        if measurement_method not in self._dynamic_inputs:
+            self.__create_method_input_ui(measurement_method)
+
         for method, container in self._dynamic_inputs.items():
             if method is measurement_method:
                 container.show()
@@ -172,28 +192,31 @@ class MainUI(QtWidgets.QMainWindow):
         self.__statusbar.showMessage('{} - {}'.format(datetime.now().isoformat(), message))
 
     def __create_input_ui(self):
-        """Create inputs for all measurement methods and keep them hidden.
+        """Create the container for the inputs of the measurement methods.
 
-        They can be selectively shown using '__set_input_ui()'.
+        The inputs of a method are added by '__create_method_input_ui()' when
+        it is selected for the first time, so startup does not depend on the
+        number of methods (and GPIB pickers).
         """
-        # Create all input containers:
-        for method in measurement.REGISTRY.values():
-            container = QtWidgets.QWidget()
-            container.setLayout(DynamicInputLayout(method.inputs()))
-
-            self._dynamic_inputs[method] = container
-
-        # Add them all to the dynamic input area and hide everything:
         parent_container = QtWidgets.QWidget()
-        parent_layout = QtWidgets.QHBoxLayout()
-        parent_layout.setContentsMargins(0, 0, 0, 0)
-        parent_container.setLayout(parent_layout)
-        for container in self._dynamic_inputs.values():
-            parent_layout.addWidget(container)
-            container.hide()
+        self._dynamic_inputs_parent_layout = QtWidgets.QHBoxLayout()
+        self._dynamic_inputs_parent_layout.setContentsMargins(0, 0, 0, 0)
+        parent_container.setLayout(self._dynamic_inputs_parent_layout)
 
         self._dynamic_inputs_area.setWidget(parent_container)
 
+    def __create_method_input_ui(self, method: measurement.MeasurementEntry):
+        """Create the hidden input container of one measurement method."""
+        start = perf_counter()
+
+        container = QtWidgets.QWidget()
+        container.setLayout(DynamicInputLayout(method.inputs()))
+        container.hide()
+        self._dynamic_inputs_parent_layout.addWidget(container)
+        self._dynamic_inputs[method] = container
+
+        print('DEBUG', 'created inputs of "{}" in {:.1f} ms'.format(method, 1000 * (perf_counter() - start)))
+
     @QtCore.pyqtSlot(str)
     def _set_directory_name(self, dir_name):
         self._directory_name = dir_name
@@ -8,12 +8,14 @@ import time
 from typing import Dict, Tuple, List
 from typing.io import TextIO
 
-from visa import ResourceManager
 import visa
 
 from scientificdevices.keithley.sourcemeter2602A import SMUChannel
 from scientificdevices.keithley.sourcemeter2636A import Sourcemeter2636A
 from scientificdevices.lakeshore.model340 import Model340, Sensor
+from instruments.sourcemeters import get_driver
+from instruments.locks import LockedDriver
+from instruments.sweeps import TspDualChannelLoop, tsp_channel
 
 @register('SET voltage sweep')
 class SETSGD(AbstractMeasurement):
@@ -41,16 +43,31 @@ class SETSGD(AbstractMeasurement):
         
         print('DEBUG: current limit is ',self._current_limit, i)
 
-        resource_man = ResourceManager(self.VISA_LIBRARY)
-        resource = resource_man.open_resource(self.GPIB_RESOURCE, query_delay=self.QUERY_DELAY)
+        lease = self._lease_visa(self.GPIB_RESOURCE, self.VISA_LIBRARY, query_delay=self.QUERY_DELAY)
         
-        self._device = Sourcemeter2636A(resource, sub_device=SMUChannel.channelA)
+        self._device = get_driver(lease, Sourcemeter2636A, sub_device=SMUChannel.channelA)
         self._device.voltage_driven(0, i, nplc, range=sd_current_range)
         
-        self._gate = Sourcemeter2636A(resource, sub_device=SMUChannel.channelB)
+        self._gate = get_driver(lease, Sourcemeter2636A, sub_device=SMUChannel.channelB)
         self._gate.voltage_driven(0, i, nplc, range=gd_current_range)
         
-        self._temperature_controller = Model340(self.TEMP_ADDR)
+        # Both channels share one resource; hold its lock while a batch of data points is measured:
+        self._lock = lease.lock()
+        # The source-drain channel is stepped and both channels are measured on the instrument:
+        self._loop = TspDualChannelLoop(lease.resource, stepped=tsp_channel(SMUChannel.channelA),
+                                        other=tsp_channel(SMUChannel.channelB), lock=self._lock)
+
+        temperature_lease = self._lease_instrument(
+            ('Model340', self.TEMP_ADDR),
+            lambda: LockedDriver(Model340(self.TEMP_ADDR), ('gpib', 0, self.TEMP_ADDR)),
+            lock_key=('gpib', 0, self.TEMP_ADDR))
+        temperature_controller = temperature_lease.resource
+        # Temperatures are polled in the background; batches take the latest values:
+        self._temperature_sampler = self._sampler(
+            ('Model340', self.TEMP_ADDR),
+            {sensor: (lambda sensor=sensor: temperature_controller.get_temperature(sensor))
+             for sensor in (Sensor.A, Sensor.B, Sensor.C)},
+            interval=1.0, lock=temperature_lease.lock())
         
         self._symmetric = symmetric
 
@@ -96,29 +113,27 @@ class SETSGD(AbstractMeasurement):
         else:
             voltages = np.linspace(0, self._max_voltage, self._number_of_points)
 
-        for voltage in voltages:
+        for batch in self._loop.run(voltages, self._nplc):
+            temperature_a, temperature_b, temperature_c = \
+                self._temperature_sampler.get_many((Sensor.A, Sensor.B, Sensor.C))
+            
+            file_handle.write_rows(batch.time,
+                                   batch.voltage, batch.current,
+                                   batch.other_voltage, batch.other_current,
+                                   temperature_a,
+                                   temperature_b,
+                                   temperature_c)
+            # Send data points to UI for plotting:
+            self._signal_interface.emit_data_batch({'v': batch.voltage, 'i': batch.current,
+                                                    'gate_voltage': batch.other_voltage,
+                                                    'gate_current': batch.other_current,
+                                                    'datetime': batch.time.tolist()})
+
             if self._should_stop.is_set():
                 print("DEBUG: Aborting measurement.")
                 self._signal_interface.emit_aborted()
                 break
 
-            self._device.set_voltage(voltage)
-            (voltage, current), (gate_voltage, gate_current) = self.__measure_data_point()
-            
-            temperature_a, temperature_b, temperature_c = self._get_temperatures()
-            
-            file_handle.write("{} {} {} {} {} {} {} {}\n".format(datetime.now().isoformat(),
-                                                           voltage, current,
-                                                           gate_voltage, gate_current,
-                                                           temperature_a,
-                                                           temperature_b,
-                                                           temperature_c))
-            file_handle.flush()
-            # Send data point to UI for plotting:
-            self._signal_interface.emit_data({'v': voltage, 'i': current,
-                                              'gate_voltage': gate_voltage, 'gate_current': gate_current,
-                                               'datetime': datetime.now()})
-
         self.__deinitialize_device()
 
     def __initialize_device(self) -> None:
@@ -147,18 +162,3 @@ class SETSGD(AbstractMeasurement):
         file_handle.write("# gate voltage {0} V\n".format(self._gate_voltage))
         file_handle.write('# nplc {}\n'.format(self._nplc))
         file_handle.write("Datetime Voltage Current GateVoltage GateCurrent TemperatureA TemperatureB TemperatureC\n")
-
-    def __measure_data_point(self) -> Tuple[Tuple[float, float], Tuple[float, float]]:
-        """Return one data point: (voltage, current).
-
-        Device must be initialised and armed.
-        """
-        data_SD = self._device.read()
-        data_GD = self._gate.read()
-        return data_SD, data_GD
-        
-    def _get_temperatures(self):
-        t_a = self._temperature_controller.get_temperature(Sensor.A)
-        t_b = self._temperature_controller.get_temperature(Sensor.B)
-        t_c = self._temperature_controller.get_temperature(Sensor.C) 
-        return t_a, t_b, t_c
@@ -1,12 +1,6 @@
-from .measurement import REGISTRY
+from typing import Dict
 
-from importlib import import_module
-import os
+from .discovery import discover, MeasurementEntry
 
-directory = __file__[:-len('__init__.py')]
-
-paths = [x for x in os.listdir(directory) if x.endswith('py') and x != '__init__.py' and x != 'measurement.py']
-
-for path in paths:
-    print('importing measurement.{}'.format(path[:-3]))
-    import_module('measurement.{}'.format(path[:-3]))
\ No newline at end of file
+# Registered measurement methods by name; their modules are imported on first use:
+REGISTRY = discover()  # type: Dict[str, MeasurementEntry]
@@ -1,14 +1,17 @@
 from .measurement import register, SignalInterface, AbstractValue, AbstractMeasurement, Contacts, PlotRecommendation
 from .measurement import FloatValue, IntegerValue, StringValue, DatetimeValue
 
-from visa import ResourceManager
 from scientificdevices.keithley.sourcemeter2400 import Sourcemeter2400
 from scientificdevices.keithley.sourcemeter2602A import Sourcemeter2602A, SMUChannel
 from scientificdevices.keithley.sourcemeter2636A import Sourcemeter2636A
+from instruments.sourcemeters import get_driver, get_monitor, get_triggered_channel
+from instruments.scheduler import AcquisitionScheduler
 
 from typing import Tuple, Dict, List
 from datetime import datetime
 
+import numpy as np
+
 
 @register('ALD 2probe multiple SET monitor')
 class Ald2ProbeMultipleSETMonitor(AbstractMeasurement):
@@ -28,7 +31,8 @@ class Ald2ProbeMultipleSETMonitor(AbstractMeasurement):
                  sample4_v: float = 0.0, sample4_i: float = 1e-6,
                  sample4_nplc: int = 3, sample4_comment: str = '',
                  sample5_v: float = 0.0, sample5_i: float = 1e-6,
-                 sample5_nplc: int = 3, sample5_comment: str = ''):
+                 sample5_nplc: int = 3, sample5_comment: str = '',
+                 sample_rate: float = 0.0):
 
         super().__init__(signal_interface, path, contacts)
 
@@ -39,25 +43,47 @@ class Ald2ProbeMultipleSETMonitor(AbstractMeasurement):
         self._sample5 = {'v': sample5_v, 'i': sample5_i, 'nplc': sample5_nplc, 'comment': sample5_comment}
 
         self._samples = [self._sample1, self._sample2, self._sample3, self._sample4, self._sample5]
+        # Above zero, every SMU records into its buffer at this rate:
+        self._sample_rate = sample_rate
 
         self._init_smus()
 
     def _init_smus(self):
-        rm = ResourceManager('@py')
-        dev1 = rm.open_resource(self.GPIB_RESOURCE_2400)
-        dev2 = rm.open_resource(self.GPIB_RESOURCE_2636A)
-        dev3 = rm.open_resource(self.GPIB_RESOURCE_2602A)
+        dev1 = self._lease_visa(self.GPIB_RESOURCE_2400)
+        dev2 = self._lease_visa(self.GPIB_RESOURCE_2636A)
+        dev3 = self._lease_visa(self.GPIB_RESOURCE_2602A)
 
-        self._smus = [Sourcemeter2400(dev1),
-                      Sourcemeter2636A(dev2, sub_device=SMUChannel.channelA),
-                      Sourcemeter2636A(dev2, sub_device=SMUChannel.channelB),
-                      Sourcemeter2602A(dev3, sub_device=SMUChannel.channelA),
-                      Sourcemeter2602A(dev3, sub_device=SMUChannel.channelB)]
+        self._smus = [get_driver(dev1, Sourcemeter2400),
+                      get_driver(dev2, Sourcemeter2636A, sub_device=SMUChannel.channelA),
+                      get_driver(dev2, Sourcemeter2636A, sub_device=SMUChannel.channelB),
+                      get_driver(dev3, Sourcemeter2602A, sub_device=SMUChannel.channelA),
+                      get_driver(dev3, Sourcemeter2602A, sub_device=SMUChannel.channelB)]
 
         for index, smu in enumerate(self._smus):
             sample = self._samples[index]
             smu.voltage_driven(sample['v'], current_limit=sample['i'], nplc=sample['nplc'])
 
+        leases = [dev1, dev2, dev2, dev3, dev3]
+        sub_devices = [None, SMUChannel.channelA, SMUChannel.channelB, SMUChannel.channelA, SMUChannel.channelB]
+
+        # Single points: all SMUs are triggered first and read afterwards, one worker per device:
+        self._scheduler = AcquisitionScheduler()
+        for lease, sub_device in zip(leases, sub_devices):
+            channel = get_triggered_channel(lease, sub_device)
+            if channel is None:
+                print('WARNING', 'SMU model not known, reading the SMUs one after the other.')
+                self._scheduler = None
+                break
+            self._scheduler.add(channel, lease.lock())
+
+        self._monitors = []
+        if self._sample_rate > 0:
+            self._monitors = [get_monitor(lease, self._sample_rate, sample['nplc'], sub_device)
+                              for lease, sub_device, sample in zip(leases, sub_devices, self._samples)]
+            if None in self._monitors:
+                print('WARNING', 'No buffered monitor for every SMU, measuring single points.')
+                self._monitors = []
+
     @staticmethod
     def number_of_contacts():
         return Contacts.NONE
@@ -83,7 +109,8 @@ class Ald2ProbeMultipleSETMonitor(AbstractMeasurement):
                 'sample5_v': FloatValue('(5) Maximum Voltage', default=1e-3),
                 'sample5_i': FloatValue('(5) Current Limit', default=1e-6),
                 'sample5_nplc': IntegerValue('(5) NPLC', default=1),
-                'sample5_comment': StringValue('(5) Comment')
+                'sample5_comment': StringValue('(5) Comment'),
+                'sample_rate': FloatValue('Buffer Rate [Hz] (0: single points)', default=0.0)
                 }
 
     @staticmethod
@@ -124,15 +151,50 @@ class Ald2ProbeMultipleSETMonitor(AbstractMeasurement):
 
         self.__arm_devices()
 
-        while not self._should_stop.is_set():
-            data = self.__get_data()
-            self.__write_data(data, file_handle=file_handle)
-            self.__send_data(data)
-        else:
-            self._signal_interface.emit_aborted()
+        try:
+            if self._monitors:
+                self._acquire_buffered(file_handle)
+            else:
+                while not self._should_stop.is_set():
+                    data = self.__get_data()
+                    self.__write_data(data, file_handle=file_handle)
+                    self.__send_data(data)
+        finally:
+            if self._scheduler is not None:
+                self._scheduler.close()
+        self._signal_interface.emit_aborted()
 
         self.__disarm_devices()
 
+    def _acquire_buffered(self, file_handle):
+        """Record into the buffers of all SMUs and write their samples chunk by chunk.
+
+        The SMUs record independently, so each row holds the sample of one
+        SMU; the columns of the others are NaN.
+        """
+        for monitor in self._monitors:
+            monitor.start()
+        try:
+            while not self._should_stop.is_set():
+                for index, monitor in enumerate(self._monitors):
+                    data = monitor.poll()
+                    if data is None:
+                        continue
+                    columns = self.__buffered_columns(index, data)
+                    file_handle.write_rows(data.time, *(columns[key] for key in self.__data_columns()))
+                    self._signal_interface.emit_data_batch(dict(columns, datetime=data.time.tolist()))
+        finally:
+            for monitor in self._monitors:
+                monitor.stop()
+
+    def __buffered_columns(self, index, data):
+        columns = {key: np.full(len(data), np.nan) for key in self.__data_columns()}
+        columns['v{}'.format(index + 1)] = data.voltage
+        columns['i{}'.format(index + 1)] = data.current
+        with np.errstate(divide='ignore', invalid='ignore'):
+            columns['c{}'.format(index + 1)] = np.where(data.voltage == 0, np.nan, data.current / data.voltage)
+        return columns
+
     def __write_header(self, file_handle):
         file_handle.write("# {0}\n".format(datetime.now().isoformat()))
         for index, smu in enumerate(self._smus):
@@ -144,17 +206,24 @@ class Ald2ProbeMultipleSETMonitor(AbstractMeasurement):
             file_handle.write("# applied voltage {} V\n".format(sample['v']))
             file_handle.write("# current limit {} A\n".format(sample['i']))
             file_handle.write('# nplc {}\n'.format(sample['nplc']))
+        if self._monitors:
+            file_handle.write('#\n')
+            file_handle.write('# buffer rate {} Hz\n'.format(self._sample_rate))
         file_handle.write("Datetime Voltage1 Current1 Conductance1 Voltage2 Current2 Conductance2 Voltage3 Current3 Conductance3 Voltage4 Current4 Conductance4 Voltage5 Current5 Conductance5\n")
 
     def __get_data(self):
+        if self._scheduler is not None:
+            # Timestamp of the trigger, which all SMUs share:
+            timestamp, readings = self._scheduler.acquire()
+        else:
+            timestamp, readings = datetime.now(), [smu.read() for smu in self._smus]
+
         all_data = {}
-        for index, smu in enumerate(self._smus):
+        for index, data in enumerate(readings):
             v_string = 'v{}'.format(index + 1)
             i_string = 'i{}'.format(index + 1)
             c_string = 'c{}'.format(index + 1)
 
-            data = smu.read()
-
             all_data[v_string] = data[0]
             all_data[i_string] = data[1]
             if data[0] != 0:
@@ -162,7 +231,7 @@ class Ald2ProbeMultipleSETMonitor(AbstractMeasurement):
             else:
                 all_data[c_string] = float('nan')
 
-        all_data['datetime'] = datetime.now()
+        all_data['datetime'] = timestamp
 
         return all_data
 
@@ -170,8 +239,13 @@ class Ald2ProbeMultipleSETMonitor(AbstractMeasurement):
         self._signal_interface.emit_data(data)
 
     def __write_data(self, data, file_handle):
-        datetime_string = data['datetime'].isoformat()
-        file_handle.write('{datetime} {data[v1]} {data[i1]} {data[c1]} {data[v2]} {data[i2]} {data[c2]} {data[v3]} {data[i3]} {data[c3]} {data[v4]} {data[i4]} {data[c4]} {data[v5]} {data[i5]} {data[c5]}\n'.format(datetime=datetime_string, data=data))
+        file_handle.write_row(data['datetime'], *(data[key] for key in self.__data_columns()))
+
+    def __data_columns(self):
+        """Names of the data columns in file order, without the timestamp."""
+        return ['{}{}'.format(quantity, index + 1)
+                for index in range(len(self._smus))
+                for quantity in ('v', 'i', 'c')]
 
     def __arm_devices(self):
         for index, smu in enumerate(self._smus):
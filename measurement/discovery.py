@@ -0,0 +1,282 @@
+"""Lazy discovery of the measurement methods in this package.
+
+Importing a measurement module pulls in its instrument drivers, which is
+slow and fails on machines where a driver is missing. The names, inputs,
+outputs and numbers of contacts of the registered methods are therefore
+kept in a manifest file next to the modules. A module is only imported when
+it is new or has changed since the manifest was written, and otherwise when
+one of its methods is actually used ('MeasurementEntry.load()').
+
+Modules without '@register' decorators are never imported. If a module
+cannot be imported, its method names are taken from the source code and the
+error is remembered until the module changes.
+"""
+import ast
+import json
+import os
+import traceback
+from importlib import import_module
+from typing import Any, Dict, List, Optional, Type
+
+from . import measurement as measurement_module
+from .measurement import AbstractMeasurement, AbstractValue, Contacts, DatetimeValue
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+MANIFEST_PATH = os.path.join(DIRECTORY, '.registry_manifest.json')
+MANIFEST_VERSION = 1
+PACKAGE = __name__.rsplit('.', 1)[0]
+
+# Modules of this package which hold no measurement methods:
+EXCLUDED_MODULES = {'__init__', 'measurement', 'discovery'}
+
+
+class ManifestError(Exception):
+    """A measurement class cannot be described in the manifest."""
+
+
+def _describe_values(values: Dict[str, AbstractValue]) -> List[List[Any]]:
+    description = []
+    for key, value in values.items():
+        type_name = type(value).__name__
+        if getattr(measurement_module, type_name, None) is not type(value):
+            raise ManifestError('{} is not a value type of measurement.measurement'.format(type_name))
+        default = None if isinstance(value, DatetimeValue) else value.default
+        if not isinstance(default, (int, float, bool, str, type(None))):
+            raise ManifestError('Default of {} cannot be stored: {!r}'.format(key, default))
+        description.append([key, type_name, value.fullname, default])
+    return description
+
+
+def _create_values(description: List[List[Any]]) -> Dict[str, AbstractValue]:
+    values = dict()  # type: Dict[str, AbstractValue]
+    for key, type_name, fullname, default in description:
+        value_type = getattr(measurement_module, type_name)
+        if value_type is DatetimeValue:
+            values[key] = value_type(fullname)
+        else:
+            values[key] = value_type(fullname, default)
+    return values
+
+
+def _describe_class(name: str, cls: Type[AbstractMeasurement]) -> Dict[str, Any]:
+    return {'name': name,
+            'class': cls.__name__,
+            'inputs': _describe_values(cls.inputs()),
+            'outputs': _describe_values(cls.outputs()),
+            'contacts': cls.number_of_contacts().name}
+
+
+def _registered_names(file_path: str) -> List[str]:
+    """Return the names in the '@register(...)' decorators of a module without importing it.
+
+    :raises ManifestError: if a name is not a string literal
+    """
+    with open(file_path, 'rb') as source_file:
+        tree = ast.parse(source_file.read(), file_path)
+
+    names = []
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.ClassDef):
+            continue
+        for decorator in node.decorator_list:
+            if (isinstance(decorator, ast.Call) and isinstance(decorator.func, ast.Name)
+                    and decorator.func.id == 'register'):
+                argument = decorator.args[0] if decorator.args else None
+                if not (isinstance(argument, ast.Constant) and isinstance(argument.value, str)):
+                    raise ManifestError('Name of {} is not a string literal'.format(node.name))
+                names.append(argument.value)
+    return names
+
+
+class MeasurementEntry:
+    """Stands in for a registered measurement class until it is needed.
+
+    'inputs()', 'outputs()' and 'number_of_contacts()' are answered from the
+    manifest. Calling the entry like the class creates a measurement object
+    and imports the module first if necessary.
+    """
+
+    def __init__(self, name: str, module: str, description: Optional[Dict[str, Any]] = None,
+                 error: Optional[str] = None) -> None:
+        """
+        :param name: Name under which the class is registered
+        :param module: Name of the module within this package
+        :param description: Manifest entry of the class, if known
+        :param error: Error message of the last failed import of the module
+        """
+        self.name = name
+        self.module = module
+        self.error = error
+        self._description = description
+        self._cls = None  # type: Optional[Type[AbstractMeasurement]]
+
+    def __str__(self) -> str:
+        return self.name
+
+    def __repr__(self) -> str:
+        return '<MeasurementEntry {!r} in {}>'.format(self.name, self.module)
+
+    @property
+    def loaded(self) -> bool:
+        return self._cls is not None
+
+    def load(self) -> Type[AbstractMeasurement]:
+        """Import the module if necessary and return the measurement class.
+
+        :raises ImportError: if the module cannot be imported or does not register the name
+        """
+        if self._cls is not None:
+            return self._cls
+
+        try:
+            import_module('{}.{}'.format(PACKAGE, self.module))
+        except Exception as error:
+            self.error = '{}: {}'.format(type(error).__name__, error)
+            raise ImportError('Measurement "{}" cannot be loaded: {}'.format(self.name, self.error)) from error
+
+        cls = measurement_module.REGISTRY.get(self.name)
+        if cls is None:
+            self.error = 'module {} does not register "{}"'.format(self.module, self.name)
+            raise ImportError('Measurement "{}" cannot be loaded: {}'.format(self.name, self.error))
+
+        self._cls = cls
+        if self.error is not None:
+            # Replace the placeholder in the manifest, e.g. after a driver was installed:
+            self.error = None
+            _manifest.update_module(self.module)
+        return cls
+
+    def inputs(self) -> Dict[str, AbstractValue]:
+        if self._cls is not None:
+            return self._cls.inputs()
+        if self._description is None:
+            return dict()
+        return _create_values(self._description['inputs'])
+
+    def outputs(self) -> Dict[str, AbstractValue]:
+        if self._cls is not None:
+            return self._cls.outputs()
+        if self._description is None:
+            return dict()
+        return _create_values(self._description['outputs'])
+
+    def number_of_contacts(self) -> Contacts:
+        if self._cls is not None:
+            return self._cls.number_of_contacts()
+        if self._description is None:
+            return Contacts.NONE
+        return Contacts[self._description['contacts']]
+
+    def __call__(self, *args, **kwargs) -> AbstractMeasurement:
+        return self.load()(*args, **kwargs)
+
+
+class _Manifest:
+    """The manifest file: per module its modification time and registered methods."""
+
+    def __init__(self) -> None:
+        self._modules = dict()  # type: Dict[str, Dict[str, Any]]
+        self._changed = False
+        self._base_mtime = os.stat(measurement_module.__file__).st_mtime_ns
+
+    def load(self) -> None:
+        try:
+            with open(MANIFEST_PATH) as manifest_file:
+                manifest = json.load(manifest_file)
+            if manifest.get('version') == MANIFEST_VERSION and manifest.get('base_mtime') == self._base_mtime:
+                self._modules = manifest['modules']
+        except (OSError, ValueError, KeyError, AttributeError):
+            self._modules = dict()
+
+    def save(self) -> None:
+        temporary_path = '{}.{}.tmp'.format(MANIFEST_PATH, os.getpid())
+        try:
+            with open(temporary_path, 'w') as manifest_file:
+                json.dump({'version': MANIFEST_VERSION, 'base_mtime': self._base_mtime,
+                           'modules': self._modules}, manifest_file, indent=1, sort_keys=True)
+            os.replace(temporary_path, MANIFEST_PATH)
+        except OSError as error:
+            print('WARNING', 'Could not write measurement manifest: {}'.format(error))
+        self._changed = False
+
+    def save_if_changed(self) -> None:
+        if self._changed:
+            self.save()
+
+    def module_entry(self, module: str, mtime: int) -> Dict[str, Any]:
+        """Return the manifest entry of a module, scanning the module if it changed."""
+        entry = self._modules.get(module)
+        if entry is None or entry.get('mtime') != mtime:
+            entry = self._scan(module, mtime)
+            self._modules[module] = entry
+            self._changed = True
+        return entry
+
+    def update_module(self, module: str) -> None:
+        """Describe an imported module anew."""
+        mtime = os.stat(os.path.join(DIRECTORY, module + '.py')).st_mtime_ns
+        self._modules[module] = self._scan(module, mtime)
+        self.save()
+
+    @staticmethod
+    def _scan(module: str, mtime: int) -> Dict[str, Any]:
+        file_path = os.path.join(DIRECTORY, module + '.py')
+        try:
+            names = _registered_names(file_path)
+        except (SyntaxError, ManifestError):
+            names = None  # Only an import can tell.
+
+        entry = {'mtime': mtime, 'names': names, 'methods': [], 'eager': False, 'error': None}
+        if names == []:
+            return entry
+
+        print('DEBUG', 'scanning measurement.{}'.format(module))
+        try:
+            import_module('{}.{}'.format(PACKAGE, module))
+        except Exception as error:
+            print('WARNING', 'Could not import measurement.{}'.format(module))
+            traceback.print_exc()
+            entry['error'] = '{}: {}'.format(type(error).__name__, error)
+            return entry
+
+        module_name = '{}.{}'.format(PACKAGE, module)
+        for name, cls in measurement_module.REGISTRY.items():
+            if cls.__module__ != module_name:
+                continue
+            try:
+                entry['methods'].append(_describe_class(name, cls))
+            except ManifestError as error:
+                print('DEBUG', 'measurement.{} is imported at every start: {}'.format(module, error))
+                entry['eager'] = True
+        entry['names'] = [name for name, cls in measurement_module.REGISTRY.items()
+                          if cls.__module__ == module_name]
+        return entry
+
+
+_manifest = _Manifest()
+
+
+def discover() -> Dict[str, MeasurementEntry]:
+    """Return entries of all measurement methods in this package by their registered names."""
+    _manifest.load()
+
+    modules = sorted(file_name[:-len('.py')] for file_name in os.listdir(DIRECTORY)
+                     if file_name.endswith('.py') and file_name[:-len('.py')] not in EXCLUDED_MODULES)
+
+    registry = dict()  # type: Dict[str, MeasurementEntry]
+    for module in modules:
+        mtime = os.stat(os.path.join(DIRECTORY, module + '.py')).st_mtime_ns
+        entry = _manifest.module_entry(module, mtime)
+
+        descriptions = {method['name']: method for method in entry['methods']}
+        for name in entry['names'] or []:
+            method = MeasurementEntry(name, module, descriptions.get(name), entry['error'])
+            if entry['eager'] and entry['error'] is None:
+                try:
+                    method.load()
+                except ImportError as error:
+                    print('WARNING', error)
+            registry[name] = method
+
+    _manifest.save_if_changed()
+    return registry
@@ -42,8 +42,7 @@ class DummyMeasurement(AbstractMeasurement):
         self.__print_header(file_handle)
 
         for i in range(self._n):
-            print('{} {} {}'.format(datetime.now().isoformat(), random(), random()), file=file_handle)
-            file_handle.flush()
+            file_handle.write_row(datetime.now(), random(), random())
             self._signal_interface.emit_data({'datetime': datetime.now(),
                                               'random1': random(),
                                               'random2': random()})
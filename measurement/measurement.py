@@ -3,22 +3,27 @@
 """
 from enum import Enum
 from threading import Thread
+import sys
+import weakref
 from datetime import datetime
 
-from threading import Event
-from typing import Dict, List, Tuple, Union
+from threading import Event, Lock
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple, Union
 
 from abc import ABC, abstractmethod
 
 from dateutil import parser
 
-from os import listdir
-from os.path import join as join_path
+from os import path as os_path, remove
 
 import numpy as np
 
 from typing import List
 from overview import Overview
+from data_writer import AsyncDataWriter, BinaryColumnSink, TextSink
+from file_allocator import FileAllocator
+from instruments.pool import InstrumentPool, Lease, is_bus_error
+from instruments.sampler import Sampler
 
 REGISTRY = {}
 
@@ -126,6 +131,14 @@ class Contacts(Enum):
     FOUR = 4
 
 
+class OutputFormat(Enum):
+    """File formats a measurement writes its data to.
+    """
+    TEXT = 'text'
+    BINARY = 'binary'
+    TEXT_AND_BINARY = 'text+binary'
+
+
 class SignalInterface:
     """An typical
     """
@@ -135,6 +148,17 @@ class SignalInterface:
     def emit_data(self, data: Dict[str, Union[int, float, bool, str, datetime]]) -> None:
         NotImplementedError()
 
+    def emit_data_batch(self, data: Dict[str, Sequence[Union[int, float, bool, str, datetime]]]) -> None:
+        """Emit several data points at once.
+
+        :param data: Keys are output names, values are equally long columns
+                     (lists or numpy arrays) of data points
+        """
+        columns = list(data.values())
+        length = len(columns[0]) if columns else 0
+        for index in range(length):
+            self.emit_data({name: column[index] for name, column in data.items()})
+
     def emit_started(self) -> None:
         NotImplementedError()
 
@@ -144,6 +168,100 @@ class SignalInterface:
     def emit_status_message(self, message: str) -> None:
         NotImplementedError()
 
+    def close(self) -> None:
+        """Stop background work of the interface; called when a run ends, also after an error."""
+        pass
+
+
+class CoalescingSignalInterface(SignalInterface):
+    """Buffers single data points and forwards them to another interface in batches.
+
+    Measurements keep calling 'emit_data()' once per point. The points are
+    collected and handed on with a single 'emit_data_batch()' call as soon as
+    'max_points' are buffered or 'max_delay' seconds have passed, whichever
+    comes first. All other signals flush the buffer before they are passed
+    on, so the order of data and status signals is preserved.
+    """
+
+    def __init__(self, target: SignalInterface,
+                 max_points: int = 500, max_delay: float = 0.05) -> None:
+        """
+        :param target: Interface which receives the batches
+        :param max_points: Number of buffered points which triggers a flush
+        :param max_delay: Maximum time in seconds a point stays in the buffer
+        """
+        self._target = target
+        self._max_points = max_points
+        self._max_delay = max_delay
+
+        self._rows = []  # type: List[Dict[str, Union[int, float, bool, str, datetime]]]
+        self._lock = Lock()
+        self._flush_lock = Lock()  # Keeps batches in order when two threads flush
+        self._closed = Event()
+
+        self._flush_thread = Thread(target=self._flush_periodically, daemon=True)
+        self._flush_thread.start()
+
+    def _flush_periodically(self) -> None:
+        while not self._closed.wait(self._max_delay):
+            self.flush()
+
+    def flush(self) -> None:
+        """Forward all buffered points."""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+
+            if rows:
+                self._target.emit_data_batch(self.rows_to_columns(rows))
+
+    def close(self) -> None:
+        """Flush and stop the background thread; later points are forwarded immediately."""
+        self._closed.set()
+        self.flush()
+
+    @staticmethod
+    def rows_to_columns(rows: List[Dict]) -> Dict[str, list]:
+        """Turn a list of data points into a dictionary of columns.
+
+        Columns missing from some of the points are filled with 'None'.
+        """
+        names = []  # type: List[str]
+        for row in rows:
+            for name in row:
+                if name not in names:
+                    names.append(name)
+
+        return {name: [row.get(name) for row in rows] for name in names}
+
+    def emit_data(self, data: Dict[str, Union[int, float, bool, str, datetime]]) -> None:
+        with self._lock:
+            self._rows.append(data)
+            full = len(self._rows) >= self._max_points
+
+        if full or self._closed.is_set():
+            self.flush()
+
+    def emit_data_batch(self, data: Dict[str, Sequence[Union[int, float, bool, str, datetime]]]) -> None:
+        self.flush()
+        self._target.emit_data_batch(data)
+
+    def emit_finished(self, data: Dict[str, Union[int, float, bool, str, datetime]]) -> None:
+        self.close()
+        self._target.emit_finished(data)
+
+    def emit_started(self) -> None:
+        self.flush()
+        self._target.emit_started()
+
+    def emit_aborted(self) -> None:
+        self.flush()
+        self._target.emit_aborted()
+
+    def emit_status_message(self, message: str) -> None:
+        self.flush()
+        self._target.emit_status_message(message)
+
 
 class PlotRecommendation:
     def __init__(self, title: str, x_label: str, y_label: str, show_fit: bool=False):
@@ -189,6 +307,14 @@ class AbstractMeasurement(ABC):
     """
 
     """
+
+    # The data file is flushed after this many seconds or pending bytes:
+    WRITER_FLUSH_INTERVAL = 1.0
+    WRITER_FLUSH_BYTES = 64 * 1024
+
+    # Directory suffix of the binary column format (see 'BinaryColumnSink'):
+    BINARY_SUFFIX = '.chunks'
+
     def __init__(self,
                  signal_interface: SignalInterface,
                  path: str,
@@ -204,6 +330,19 @@ class AbstractMeasurement(ABC):
         self._should_stop = Event()
         self._should_stop.clear()
         self._recommended_plot_file_paths = {}
+        self._output_format = OutputFormat.TEXT
+        # Instrument sessions used by this measurement, returned to the pool after the run:
+        self._leases = []  # type: List[Union[Lease, Sampler]]
+        weakref.finalize(self, AbstractMeasurement._release, self._leases)
+
+    @property
+    def output_format(self) -> OutputFormat:
+        return self._output_format
+
+    @output_format.setter
+    def output_format(self, output_format: OutputFormat) -> None:
+        """Select the file format(s) of the next run."""
+        self._output_format = output_format
 
     @staticmethod
     def inputs() -> Dict[str, AbstractValue]:
@@ -221,38 +360,23 @@ class AbstractMeasurement(ABC):
     def number_of_contacts() -> Contacts:
         return Contacts.TWO
 
-    def _get_next_file(self, file_prefix: str, file_suffix: str = '.dat') -> str:
+    def _get_next_file(self, file_prefix: str, file_suffix: str = '.dat',
+                       reserved_suffixes: Tuple[str, ...] = (), create: bool = True) -> str:
         """
-        Looks for existing files and generates a suitable successor
+        Creates an empty file with the next free number, see 'FileAllocator'
         :param file_prefix: the beginning of the file name
         :param file_suffix: the end of the file name, normally '.dat
+        :param reserved_suffixes: numbers of files with these suffixes are taken as well
+        :param create: if False, only the number is reserved and no file is created
         :return: full path of new file
         """
-        file_list = listdir(self._path)
+        # filename has the form  {prefix}DDD{suffix}, with three or more digits
+        file_path = FileAllocator.for_directory(self._path).allocate(
+            file_prefix, file_suffix, reserved_suffixes, create)
 
-        # filename has the form  {prefix}DDD{suffix}
-        filtered_file_list = [file_name
-                              for file_name in file_list
-                              if file_name.startswith(file_prefix) and file_name.endswith(file_suffix)
-                              and len(file_name[len(file_prefix):-len(file_suffix)]) == 3
-                              and file_name[len(file_prefix):-len(file_suffix)].isdigit()
-                              ]
+        print(file_path)
 
-        if len(filtered_file_list) == 0:
-            new_file_name = '{prefix}001{suffix}'.format(prefix=file_prefix, suffix=file_suffix)
-            return join_path(self._path, new_file_name)
-
-        last_file_name = sorted(filtered_file_list)[-1]
-
-        last_number = int(last_file_name[len(file_prefix):-len(file_suffix)])
-
-        new_file_name = '{prefix}{number:03d}{suffix}'.format(prefix=file_prefix,
-                                                              number=last_number + 1,
-                                                              suffix=file_suffix)
-
-        print(self._path, new_file_name)
-
-        return join_path(self._path, new_file_name)
+        return file_path
 
     def _generate_file_name_prefix(self) -> str:
         return 'contacts_{}_'.format('--'.join(self._contacts))
@@ -262,31 +386,99 @@ class AbstractMeasurement(ABC):
 
     def _generate_all_file_names(self) -> None:
         file_prefix = self._generate_file_name_prefix()
-        self._file_path = self._get_next_file(file_prefix)
+        # Text and binary files of one run share their number:
+        self._file_path = self._get_next_file(file_prefix, reserved_suffixes=(self.BINARY_SUFFIX,))
+        self._binary_path = self._file_path[:-len('.dat')] + self.BINARY_SUFFIX
 
         self._recommended_plot_file_paths = {}
         for recommendation in self.recommended_plots:
             pair = (recommendation.x_label, recommendation.y_label)
             plot_file_name_prefix = self._generate_plot_file_name_prefix(pair)
-            self._recommended_plot_file_paths[pair] = self._get_next_file(plot_file_name_prefix, file_suffix='.pdf')
+            # The plots are saved when the run finishes; a failed run leaves no empty file behind:
+            self._recommended_plot_file_paths[pair] = self._get_next_file(plot_file_name_prefix, file_suffix='.pdf',
+                                                                          create=False)
+
+
+    def _create_sinks(self) -> list:
+        sinks = []
+        if self._output_format in (OutputFormat.TEXT, OutputFormat.TEXT_AND_BINARY):
+            print('writing to {}'.format(self._file_path))
+            sinks.append(TextSink(self._file_path))
+        if self._output_format in (OutputFormat.BINARY, OutputFormat.TEXT_AND_BINARY):
+            print('writing to {}'.format(self._binary_path))
+            sinks.append(BinaryColumnSink(self._binary_path))
+            if self._output_format == OutputFormat.BINARY and os_path.getsize(self._file_path) == 0:
+                # The directory now holds the number; drop the empty placeholder text file.
+                remove(self._file_path)
+        return sinks
+
+    def _lease_visa(self, address: str, library: str = '@py', **open_arguments) -> Lease:
+        """Lease a VISA resource from the instrument pool for this measurement, see 'InstrumentPool'."""
+        lease = InstrumentPool.instance().lease_visa(address, library, **open_arguments)
+        self._leases.append(lease)
+        return lease
+
+    def _lease_instrument(self, key: Hashable, opener: Callable[[], Any],
+                          closer: Optional[Callable[[Any], None]] = None,
+                          lock_key: Optional[Hashable] = None) -> Lease:
+        """Lease any other connection or driver object from the instrument pool for this measurement."""
+        lease = InstrumentPool.instance().lease(key, opener, closer, lock_key)
+        self._leases.append(lease)
+        return lease
+
+    def _sampler(self, key: Hashable, channels: Dict[str, Callable[[], Any]], interval: float = 1.0,
+                 lock: Optional[Any] = None) -> Sampler:
+        """Share a background sampler of an instrument for this measurement, see 'Sampler.shared()'."""
+        sampler = Sampler.shared(key, channels, interval, lock)
+        self._leases.append(sampler)
+        return sampler
+
+    def _invalidate_on_bus_error(self, error: Optional[BaseException] = None) -> None:
+        """Mark the sessions of this run as broken if 'error' is an I/O error or a timeout.
+
+        Call it in 'except' blocks which handle an error and carry on; without
+        'error', the exception being handled is checked. Broken sessions are
+        closed when the run releases them, so the next run opens new ones.
+        """
+        error = sys.exc_info()[1] if error is None else error
+        if error is None or not is_bus_error(error):
+            return
+        print('WARNING', 'bus error, instrument sessions of this run will be reopened: {}'.format(error))
+        for lease in self._leases:
+            if isinstance(lease, Lease):
+                lease.invalidate()
 
+    @staticmethod
+    def _release(leases: List[Union[Lease, Sampler]]) -> None:
+        while leases:
+            leases.pop().release()
 
     def abort(self) -> None:
         self._should_stop.set()
 
     def __call__(self) -> None:
         self._signal_interface.emit_started()
-        
-        if not self._should_stop.is_set():
-            self._generate_all_file_names()
-            print('writing to {}'.format(self._file_path))
-            with open(self._file_path, 'w') as file_handle:
-                self._measure(file_handle)
-                
+
+        try:
+            if not self._should_stop.is_set():
+                self._generate_all_file_names()
+                with AsyncDataWriter(self._create_sinks(),
+                                     flush_interval=self.WRITER_FLUSH_INTERVAL,
+                                     flush_bytes=self.WRITER_FLUSH_BYTES) as file_handle:
+                    self._measure(file_handle)
+        except BaseException as error:
+            self._invalidate_on_bus_error(error)
+            raise
+        finally:
+            # The sessions stay open for the next run:
+            self._release(self._leases)
+            # Forwards the points that are still buffered and stops the flush thread of a 'CoalescingSignalInterface':
+            self._signal_interface.close()
+
         self._signal_interface.emit_finished(self._recommended_plot_file_paths)
 
     @abstractmethod
-    def _measure(self, file_handle) -> None:
+    def _measure(self, file_handle: AsyncDataWriter) -> None:
         pass
 
     def _write_overview(self, comment_lines: List[str] = [],  **data) -> None:
@@ -301,6 +493,6 @@ class AbstractMeasurement(ABC):
             measurement_data["Contacts"] = contacts_string[:-1]  # Omit trailing space
                         
         columns.sort()
-        overview_file = Overview(self._path, self.__class__.__name__, columns, comment_lines)
+        overview_file = Overview.open(self._path, self.__class__.__name__, columns, comment_lines)
         overview_file.add_measurement(**measurement_data)
 
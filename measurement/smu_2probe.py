@@ -8,12 +8,11 @@ import time
 from typing import Dict, Tuple, List
 from typing.io import TextIO
 
-from visa import ResourceManager
 import visa
 #TODO: handle automagic Sourcemeter choice and write this info into the measurement file
 from scientificdevices.keithley.sourcemeter2400 import Sourcemeter2400
-from scientificdevices.keithley.sourcemeter2602A import Sourcemeter2602A
-from scientificdevices.keithley.sourcemeter2636A import Sourcemeter2636A
+from instruments.sourcemeters import get_driver, get_sourcemeter, get_sweeper
+from instruments.sweeps import point_times
 
 
 @register('SourceMeter two probe voltage sweep')
@@ -22,6 +21,8 @@ class SMU2Probe(AbstractMeasurement):
 
     VISA_LIBRARY = "@py"
     QUERY_DELAY = 0.0
+    # Run the sweep as a list sweep on the sourcemeter if it has one:
+    USE_LIST_SWEEP = True
 
     def __init__(self, signal_interface: SignalInterface,
                  path: str, contacts: Tuple[str, str],
@@ -34,30 +35,19 @@ class SMU2Probe(AbstractMeasurement):
         self._nplc = nplc
         self._comment = comment
 
-        resource_man = ResourceManager(self.VISA_LIBRARY)
-        resource = resource_man.open_resource(gpib, query_delay=self.QUERY_DELAY)
+        lease = self._lease_visa(gpib, self.VISA_LIBRARY, query_delay=self.QUERY_DELAY)
 
         try:
-            self._device = SMU2Probe._get_sourcemeter(resource)
+            self._device = get_sourcemeter(lease)
+            # The whole sweep runs on the sourcemeter if it can:
+            self._sweeper = get_sweeper(lease) if self.USE_LIST_SWEEP else None
         except visa.VisaIOError:
             # Should only occur when pyvisa-sim is used:
-            self._device = Sourcemeter2400(resource)
+            self._device = get_driver(lease, Sourcemeter2400)
+            self._sweeper = None
 
         self._device.voltage_driven(0, i, nplc)
 
-    @staticmethod
-    def _get_sourcemeter(resource):
-        identification = resource.query('*IDN?')
-        print('DEBUG', identification)
-        if '2400' in identification:
-            return Sourcemeter2400(resource)
-        elif '2602' in identification:
-            return Sourcemeter2602A(resource)
-        elif '2636' in identification:
-            return Sourcemeter2636A(resource)
-        else:
-            raise ValueError('Sourcemeter "{}" not known.'.format(identification))
-
     @staticmethod
     def number_of_contacts():
         return Contacts.TWO
@@ -87,6 +77,38 @@ class SMU2Probe(AbstractMeasurement):
         self.__write_header(file_handle)
         self.__initialize_device()
         time.sleep(0.5)
+        if self._sweeper is not None:
+            voltages, currents = self.__sweep(file_handle)
+        else:
+            voltages, currents = self.__step(file_handle)
+
+        self.__deinitialize_device()
+
+        conductance, _ = np.polyfit(voltages, currents, 1)
+        resistance = 1 / conductance
+        self._write_overview(Resistance=resistance, Datetime=datetime.now().isoformat(),
+                             Aborted=self._should_stop.is_set())
+
+    def __sweep(self, file_handle) -> Tuple[np.ndarray, np.ndarray]:
+        """Run the sweep as list sweeps of the sourcemeter and fetch the points batch by batch."""
+        voltages, currents = [np.empty(0)], [np.empty(0)]
+        for started, batch_voltages, batch_currents in self._sweeper.batches(
+                np.linspace(0, self._max_voltage, self._number_of_points), self._current_limit, self._nplc,
+                should_stop=self._should_stop):
+            voltages.append(batch_voltages)
+            currents.append(batch_currents)
+            file_handle.write_rows(batch_voltages, batch_currents)
+            self._signal_interface.emit_data_batch(
+                {'v': batch_voltages, 'i': batch_currents,
+                 'datetime': point_times(started, len(batch_voltages), self._nplc).tolist()})
+
+        if self._should_stop.is_set():
+            print("DEBUG: Aborting measurement.")
+            self._signal_interface.emit_aborted()
+        return np.concatenate(voltages), np.concatenate(currents)
+
+    def __step(self, file_handle) -> Tuple[List[float], List[float]]:
+        """Set and measure the voltages one by one."""
         voltages, currents = [], []
 
         for voltage in np.linspace(0, self._max_voltage, self._number_of_points):
@@ -99,17 +121,11 @@ class SMU2Probe(AbstractMeasurement):
             voltage, current = self.__measure_data_point()
             voltages.append(voltage)
             currents.append(current)
-            file_handle.write("{} {}\n".format(voltage, current))
-            file_handle.flush()
+            file_handle.write_row(voltage, current)
             # Send data point to UI for plotting:
             self._signal_interface.emit_data({'v': voltage, 'i': current, 'datetime': datetime.now()})
 
-        self.__deinitialize_device()
-
-        conductance, _ = np.polyfit(voltages, currents, 1)
-        resistance = 1 / conductance
-        self._write_overview(Resistance=resistance, Datetime=datetime.now().isoformat(),
-                             Aborted=self._should_stop.is_set())
+        return voltages, currents
 
     def __initialize_device(self) -> None:
         """Make device ready for measurement."""
@@ -147,6 +163,8 @@ class SMU2ProbeSimulation(SMU2Probe):
 
     VISA_LIBRARY = "measurement/test_devices.yaml@sim"
     QUERY_DELAY = 0.1
+    # The simulated device only knows the commands of the stepped sweep:
+    USE_LIST_SWEEP = False
 
     def __init__(self, signal_interface: SignalInterface,
                  path: str, contacts: Tuple[str, str],
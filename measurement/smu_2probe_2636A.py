@@ -8,10 +8,10 @@ import time
 from typing import Dict, Tuple, List
 from typing.io import TextIO
 
-from visa import ResourceManager
 import visa
 #TODO: handle automagic Sourcemeter choice and write this info into the measurement file
 from scientificdevices.keithley.sourcemeter2602A import Sourcemeter2602A
+from instruments.sourcemeters import get_driver
 
 
 @register('SourceMeter two probe voltage sweep 2636A')
@@ -33,9 +33,8 @@ class SMU2Probe(AbstractMeasurement):
         self._nplc = nplc
         self._comment = comment
 
-        resource_man = ResourceManager(self.VISA_LIBRARY)
-        resource = resource_man.open_resource(self.GPIB_RESOURCE, query_delay=self.QUERY_DELAY)
-        self._device = Sourcemeter2602A(resource)
+        lease = self._lease_visa(self.GPIB_RESOURCE, self.VISA_LIBRARY, query_delay=self.QUERY_DELAY)
+        self._device = get_driver(lease, Sourcemeter2602A)
         self._device.voltage_driven(0, i, nplc, range=range)
 
     @staticmethod
@@ -76,8 +75,7 @@ class SMU2Probe(AbstractMeasurement):
 
             self._device.set_voltage(voltage)
             voltage, current = self.__measure_data_point()
-            file_handle.write("{} {}\n".format(voltage, current))
-            file_handle.flush()
+            file_handle.write_row(voltage, current)
             # Send data point to UI for plotting:
             self._signal_interface.emit_data({'v': voltage, 'i': current, 'datetime': datetime.now()})
 
@@ -4,15 +4,14 @@ from .measurement import StringValue, FloatValue, IntegerValue, DatetimeValue, A
 from typing import Dict, Tuple, List
 from typing.io import TextIO
 
-from visa import ResourceManager
-from scientificdevices.keithley.sourcemeter2400 import Sourcemeter2400
-from scientificdevices.keithley.sourcemeter2602A import Sourcemeter2602A
-from scientificdevices.keithley.sourcemeter2636A import Sourcemeter2636A
+from instruments.sourcemeters import get_monitor, get_sourcemeter
 
 from datetime import datetime
 from time import sleep
 from threading import Event
 
+import numpy as np
+
 
 @register('SourceMeter two probe current vs. time')
 class SMU2ProbeIvt(AbstractMeasurement):
@@ -21,7 +20,8 @@ class SMU2ProbeIvt(AbstractMeasurement):
     def __init__(self, signal_interface: SignalInterface,
                  path: str, contacts: Tuple[str, str],
                  v: float = 0.0, i: float = 1e-6,
-                 nplc: int = 3, comment: str = '', time_difference: float=0, gpib: str='GPIB0::10::INSTR'):
+                 nplc: int = 3, comment: str = '', time_difference: float=0, gpib: str='GPIB0::10::INSTR',
+                 sample_rate: float = 0.0):
         super().__init__(signal_interface, path, contacts)
         self._max_voltage = v
         self._current_limit = i
@@ -30,36 +30,29 @@ class SMU2ProbeIvt(AbstractMeasurement):
         self._time_difference = time_difference
         self._gpib = gpib
 
-        resource_man = ResourceManager('@py')
-        resource = resource_man.open_resource(self._gpib)
-
-        self._device = SMU2ProbeIvt._get_sourcemeter(resource)
+        lease = self._lease_visa(self._gpib)
+        self._device = get_sourcemeter(lease)
         self._device.voltage_driven(0, i, nplc)
+        # Above zero, the sourcemeter records into its buffer at this rate:
+        self._sample_rate = sample_rate
+        self._monitor = None
+        if sample_rate > 0:
+            self._monitor = get_monitor(lease, sample_rate, nplc)
+            if self._monitor is None:
+                print('WARNING', 'No buffered monitor for this sourcemeter, measuring single points.')
 
     @staticmethod
     def number_of_contacts():
         return Contacts.TWO
 
-    @staticmethod
-    def _get_sourcemeter(resource):
-        identification = resource.query('*IDN?')
-        print('DEBUG', identification)
-        if '2400' in identification:
-            return Sourcemeter2400(resource)
-        elif '2602' in identification:
-            return Sourcemeter2602A(resource)
-        elif '2636' in identification:
-            return Sourcemeter2636A(resource)
-        else:
-            raise ValueError('Sourcemeter "{}" not known.'.format(identification))
-
     @staticmethod
     def inputs() -> Dict[str, AbstractValue]:
         return {'v': FloatValue('Maximum Voltage', default=0.0),
                 'i': FloatValue('Current Limit', default=1e-6),
                 'nplc': IntegerValue('NPLC', default=1),
                 'comment': StringValue('Comment', default=''),
-                'gpib': GPIBPathValue('GPIB Address', default='GPIB0::10::INSTR')}
+                'gpib': GPIBPathValue('GPIB Address', default='GPIB0::10::INSTR'),
+                'sample_rate': FloatValue('Buffer Rate [Hz] (0: single points)', default=0.0)}
 
     @staticmethod
     def outputs() -> Dict[str, AbstractValue]:
@@ -79,29 +72,63 @@ class SMU2ProbeIvt(AbstractMeasurement):
 
         self._device.set_voltage(self._max_voltage)
 
+        if self._monitor is not None:
+            switched_to_current_driven = self._acquire_buffered(file_handle)
+        else:
+            switched_to_current_driven = self._acquire_data_points(file_handle)
+
+        self.__deinitialize_device(switched_to_current_driven)
+
+    def _acquire_data_points(self, file_handle) -> bool:
         switched_to_current_driven = False
 
         while not self._should_stop.is_set():
             voltage, current = self.__measure_data_point()
             if not switched_to_current_driven and current > 0.9 * self._current_limit:
-                self._device.disarm()
-                self._device.set_voltage(0)
-                self._device.current_driven(self._current_limit, 
-                                            voltage_limit=self._max_voltage, 
-                                            nplc = self._nplc)
-                self._device.set_current(self._current_limit)
-                self._device.arm()
+                self.__switch_to_current_driven()
                 switched_to_current_driven = True
-                sleep(2)
                 
             timestamp = datetime.now()
-            file_handle.write("{} {} {}\n".format(timestamp.isoformat(), voltage, current))
-            file_handle.flush()
+            file_handle.write_row(timestamp, voltage, current)
             # Send data point to UI for plotting:
             g = float('nan') if voltage == 0 else current / voltage
             self._signal_interface.emit_data({'g': g, 'datetime': timestamp})
 
-        self.__deinitialize_device(switched_to_current_driven)
+        return switched_to_current_driven
+
+    def _acquire_buffered(self, file_handle) -> bool:
+        """Record into the sourcemeter's buffer and write the samples chunk by chunk."""
+        switched_to_current_driven = False
+
+        self._monitor.start()
+        while not self._should_stop.is_set():
+            data = self._monitor.poll()
+            if data is None:
+                continue
+
+            file_handle.write_rows(data.time, data.voltage, data.current)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                g = np.where(data.voltage == 0, np.nan, data.current / data.voltage)
+            self._signal_interface.emit_data_batch({'g': g, 'datetime': data.time.tolist()})
+
+            if not switched_to_current_driven and np.max(data.current) > 0.9 * self._current_limit:
+                self._monitor.stop()
+                self.__switch_to_current_driven()
+                switched_to_current_driven = True
+                self._monitor.start()
+        self._monitor.stop()
+
+        return switched_to_current_driven
+
+    def __switch_to_current_driven(self) -> None:
+        self._device.disarm()
+        self._device.set_voltage(0)
+        self._device.current_driven(self._current_limit, 
+                                    voltage_limit=self._max_voltage, 
+                                    nplc = self._nplc)
+        self._device.set_current(self._current_limit)
+        self._device.arm()
+        sleep(2)
 
                              
     def __initialize_device(self) -> None:
@@ -128,6 +155,8 @@ class SMU2ProbeIvt(AbstractMeasurement):
         file_handle.write("# maximum voltage {0} V\n".format(self._max_voltage))
         file_handle.write("# current limit {0} A\n".format(self._current_limit))
         file_handle.write('# nplc {}\n'.format(self._nplc))
+        if self._monitor is not None:
+            file_handle.write('# buffer rate {} Hz\n'.format(self._monitor.sample_rate))
         file_handle.write("Datetime Voltage Current\n")
 
     def __measure_data_point(self) -> Tuple[float, float]:
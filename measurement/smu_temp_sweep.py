@@ -4,13 +4,12 @@ from .measurement import StringValue, FloatValue, IntegerValue, DatetimeValue, A
 from typing import Dict, Tuple, List
 from typing.io import TextIO
 
-from visa import ResourceManager
-from scientificdevices.keithley.sourcemeter2400 import Sourcemeter2400
-from scientificdevices.keithley.sourcemeter2602A import Sourcemeter2602A
-from scientificdevices.keithley.sourcemeter2636A import Sourcemeter2636A
+from instruments.sourcemeters import get_sourcemeter
 
 from scientificdevices.oxford.itc503 import ITC
 
+from instruments.transport import get_gpib_device
+
 from datetime import datetime
 from time import sleep, time
 from threading import Event
@@ -18,123 +17,10 @@ from threading import Event
 import numpy as np
 from queue import Queue
 
-import gpib
-
 import traceback
 
 from ast import literal_eval
 
-class GenericInstrument(object):
-    """ This is an abstract class for a generic instrument """
-    def __init__(self):
-        """ Initialises the generic instrument """
-        self.term_chars = '\n'
-
-    def ask(self, query):
-        """ ask will write a request and waits for an answer
-
-            Arguments:
-            query -- (string) the query which shall be sent
-
-            Result:
-            (string) -- answer from device
-        """
-        self.write(query)
-        return self.read()
-
-    def write(self, query):
-        """ writes a query to remote device
-
-            Arguments:
-            query -- (string) the query which shall be sent
-        """
-        pass
-
-    def read(self):
-        """ reads a message from remote device
-
-            Result:
-            (string) -- message from remote device
-        """
-        pass
-
-    def close(self):
-        """ closes connection to remote device """
-        pass
-
-class GpibInstrument(GenericInstrument):
-    """ Implementation of GenericInstrument to communicate with gpib devices """
-    def __init__(self, device):
-        """ initializes connection to gpib device
-
-            Arguments:
-            connection - (gpib.dev) a gpib object to speak to
-        """
-        GenericInstrument.__init__(self)
-        self.device = device
-        self.term_chars = '\n'
-
-    def write(self, query):
-        """ writes a query to remote device
-
-            Arguments:
-            query -- (string) the query which shall be sent
-        """
-        gpib.write(self.device, query + self.term_chars)
-
-    def read(self):
-        """ reads a message from remote device
-
-            Result:
-            (string) -- message from remote device
-        """
-        return gpib.read(self.device, 512).rstrip()
-
-    def close(self):
-        """ closes connection to remote device """
-        gpib.close(self.device)
-
-    def clear(self):
-        """ clears all communication buffers """
-        gpib.clear(self.device)
-
-def get_gpib_timeout(timeout):
-    """ returns the correct timeout object to a certain timeoutvalue
-        it will find the nearest match, e.g., 120us will be 100us
-
-        Arguments:
-        timeout -- (float) number of seconds to wait until timeout
-    """
-    gpib_timeout_list = [(0, gpib.TNONE), \
-                         (10e-6, gpib.T10us), \
-                         (30e-6, gpib.T30us), \
-                         (100e-6, gpib.T100us), \
-                         (300e-6, gpib.T300us), \
-                         (1e-3, gpib.T1ms), \
-                         (3e-3, gpib.T3ms), \
-                         (10e-3, gpib.T10ms), \
-                         (30e-3, gpib.T30ms), \
-                         (100e-3, gpib.T100ms), \
-                         (300e-3, gpib.T300ms), \
-                         (1, gpib.T1s), \
-                         (3, gpib.T3s), \
-                         (10, gpib.T10s), \
-                         (30, gpib.T30s), \
-                         (100, gpib.T100s), \
-                         (300, gpib.T300s), \
-                         (1000, gpib.T1000s)]
-
-    for val, res in gpib_timeout_list:
-        if timeout <= val:
-            return res
-    return gpib.T1000s
-
-def get_gpib_device(port: int, timeout=0.5):
-    device = gpib.dev(0, port)
-    gpib.timeout(device, get_gpib_timeout(timeout))
-    return GpibInstrument(device)
-
-
 @register('SourceMeter two probe Current vs. Temp. (blue)')
 class SMU2ProbeIvTBlue(AbstractMeasurement):
 
@@ -148,7 +34,12 @@ class SMU2ProbeIvTBlue(AbstractMeasurement):
                      
         super().__init__(signal_interface, path, contacts)
         self._comment = comment
-        self._temp = ITC(get_gpib_device(24))
+        itc_lease = self._lease_instrument(('gpib', 0, 24), lambda: get_gpib_device(24))
+        self._temp = itc = itc_lease.driver('itc', ITC)
+        # Temperatures are polled in the background; data points take the latest values:
+        self._temperature_sampler = self._sampler(('itc', 0, 24),
+                                                  {'T1': lambda: itc.T1, 'T2': lambda: itc.T2, 'T3': lambda: itc.T3},
+                                                  interval=1.0, lock=itc_lease.lock())
         self._sweep_rate = sweep_rate
         self._voltage = voltage
         self._current_limit = current_limit
@@ -164,10 +55,7 @@ class SMU2ProbeIvTBlue(AbstractMeasurement):
             self.abort()
             return   
             
-        resource_man = ResourceManager('@py')
-        resource = resource_man.open_resource(self._gpib)
-            
-        self._device = SMU2ProbeIvTBlue._get_sourcemeter(resource)
+        self._device = get_sourcemeter(self._lease_visa(self._gpib))
         self._device.voltage_driven(0, current_limit, nplc)
             
         self._temperature_end = temperature_end
@@ -180,19 +68,6 @@ class SMU2ProbeIvTBlue(AbstractMeasurement):
     def number_of_contacts():
         return Contacts.FOUR
         
-    @staticmethod
-    def _get_sourcemeter(resource):
-        identification = resource.query('*IDN?')
-        print('DEBUG', identification)
-        if '2400' in identification:
-            return Sourcemeter2400(resource)
-        elif '2602' in identification:
-            return Sourcemeter2602A(resource)
-        elif '2636' in identification:
-            return Sourcemeter2636A(resource)
-        else:
-            raise ValueError('Sourcemeter "{}" not known.'.format(identification))
-            
     @staticmethod
     def inputs() -> Dict[str, AbstractValue]:
         return {'temperature_end': FloatValue('Target temperature', default=295),
@@ -226,13 +101,14 @@ class SMU2ProbeIvTBlue(AbstractMeasurement):
             except:
                 print('{} failed to acquire datapoint.'.format(datetime.now().isoformat()))
                 traceback.print_exc()
+                self._invalidate_on_bus_error()
                 
             self._toggle_pid_if_necessary()
 
         self.__deinitialize_device()
 
     def _start_sweep(self):
-        current_temperature = self._temp.T1
+        current_temperature = self._temperature_sampler.get('T1')
         
         sweep_time = abs((current_temperature - self._temperature_end) / self._sweep_rate)
         
@@ -241,7 +117,7 @@ class SMU2ProbeIvTBlue(AbstractMeasurement):
         self._temp.start_temperature_sweep()
 
     def _toggle_pid_if_necessary(self):
-        current_temperature = self._temp.T1
+        current_temperature = self._temperature_sampler.get('T1')
         
         if 20 < current_temperature < 30 and time() - self._last_toggle > 100:
             self._temp.toggle_pid_auto(False)
@@ -251,11 +127,9 @@ class SMU2ProbeIvTBlue(AbstractMeasurement):
 
     def _acquire_data_point(self, file_handle):
         voltage, current = self.__measure_data_point()
-        T1, T2, T3 = self._temp.T1, self._temp.T2, self._temp.T3
+        T1, T2, T3 = self._temperature_sampler.get_many(('T1', 'T2', 'T3'))
         
-        file_handle.write('{} {} {} {} {} {}\n'.format(datetime.now().isoformat(), 
-                                                       voltage, current, T1, T2, T3))
-        file_handle.flush()
+        file_handle.write_row(datetime.now(), voltage, current, T1, T2, T3)
         
         conductance = current / voltage
         
@@ -4,13 +4,13 @@ from .measurement import StringValue, FloatValue, IntegerValue, DatetimeValue, A
 from typing import Dict, Tuple, List
 from typing.io import TextIO
 
-from visa import ResourceManager
-from scientificdevices.keithley.sourcemeter2400 import Sourcemeter2400
-from scientificdevices.keithley.sourcemeter2602A import Sourcemeter2602A
-from scientificdevices.keithley.sourcemeter2636A import Sourcemeter2636A
+from instruments.sourcemeters import get_sourcemeter, get_sweeper
+from instruments.sweeps import point_times
 
 from scientificdevices.oxford.itc503 import ITC
 
+from instruments.transport import get_gpib_device
+
 from datetime import datetime
 from time import sleep, time
 from threading import Event
@@ -18,123 +18,10 @@ from threading import Event
 import numpy as np
 from queue import Queue
 
-import gpib
-
 import traceback
 
 from ast import literal_eval
 
-class GenericInstrument(object):
-    """ This is an abstract class for a generic instrument """
-    def __init__(self):
-        """ Initialises the generic instrument """
-        self.term_chars = '\n'
-
-    def ask(self, query):
-        """ ask will write a request and waits for an answer
-
-            Arguments:
-            query -- (string) the query which shall be sent
-
-            Result:
-            (string) -- answer from device
-        """
-        self.write(query)
-        return self.read()
-
-    def write(self, query):
-        """ writes a query to remote device
-
-            Arguments:
-            query -- (string) the query which shall be sent
-        """
-        pass
-
-    def read(self):
-        """ reads a message from remote device
-
-            Result:
-            (string) -- message from remote device
-        """
-        pass
-
-    def close(self):
-        """ closes connection to remote device """
-        pass
-
-class GpibInstrument(GenericInstrument):
-    """ Implementation of GenericInstrument to communicate with gpib devices """
-    def __init__(self, device):
-        """ initializes connection to gpib device
-
-            Arguments:
-            connection - (gpib.dev) a gpib object to speak to
-        """
-        GenericInstrument.__init__(self)
-        self.device = device
-        self.term_chars = '\n'
-
-    def write(self, query):
-        """ writes a query to remote device
-
-            Arguments:
-            query -- (string) the query which shall be sent
-        """
-        gpib.write(self.device, query + self.term_chars)
-
-    def read(self):
-        """ reads a message from remote device
-
-            Result:
-            (string) -- message from remote device
-        """
-        return gpib.read(self.device, 512).rstrip()
-
-    def close(self):
-        """ closes connection to remote device """
-        gpib.close(self.device)
-
-    def clear(self):
-        """ clears all communication buffers """
-        gpib.clear(self.device)
-
-def get_gpib_timeout(timeout):
-    """ returns the correct timeout object to a certain timeoutvalue
-        it will find the nearest match, e.g., 120us will be 100us
-
-        Arguments:
-        timeout -- (float) number of seconds to wait until timeout
-    """
-    gpib_timeout_list = [(0, gpib.TNONE), \
-                         (10e-6, gpib.T10us), \
-                         (30e-6, gpib.T30us), \
-                         (100e-6, gpib.T100us), \
-                         (300e-6, gpib.T300us), \
-                         (1e-3, gpib.T1ms), \
-                         (3e-3, gpib.T3ms), \
-                         (10e-3, gpib.T10ms), \
-                         (30e-3, gpib.T30ms), \
-                         (100e-3, gpib.T100ms), \
-                         (300e-3, gpib.T300ms), \
-                         (1, gpib.T1s), \
-                         (3, gpib.T3s), \
-                         (10, gpib.T10s), \
-                         (30, gpib.T30s), \
-                         (100, gpib.T100s), \
-                         (300, gpib.T300s), \
-                         (1000, gpib.T1000s)]
-
-    for val, res in gpib_timeout_list:
-        if timeout <= val:
-            return res
-    return gpib.T1000s
-
-def get_gpib_device(port: int, timeout=0.5):
-    device = gpib.dev(0, port)
-    gpib.timeout(device, get_gpib_timeout(timeout))
-    return GpibInstrument(device)
-
-
 @register('Two Probe I-V Automatic Temperature Sweep (blue)')
 class SMUTempSweepIV(AbstractMeasurement):
 
@@ -152,14 +39,21 @@ class SMUTempSweepIV(AbstractMeasurement):
         self._time_difference = time_difference
         self._gpib = gpib
 
-        resource_man = ResourceManager('@py')
-        resource = resource_man.open_resource(self._gpib)
-        resource.timeout = 30000
+        lease = self._lease_visa(self._gpib)
+        # The session is shared; its timeout is raised only while this run measures:
+        self._resource = lease.resource
 
-        self._device = SMUTempSweepIV._get_sourcemeter(resource)
+        self._device = get_sourcemeter(lease)
         self._device.voltage_driven(0, i, nplc)
+        # Each I-V curve runs as one list sweep on the sourcemeter if it can:
+        self._sweeper = get_sweeper(lease)
         
-        self._temp =  ITC(get_gpib_device(24))
+        itc_lease = self._lease_instrument(('gpib', 0, 24), lambda: get_gpib_device(24))
+        self._temp = itc = itc_lease.driver('itc', ITC)
+        # Temperatures are polled in the background; data points take the latest values:
+        self._temperature_sampler = self._sampler(('itc', 0, 24),
+                                                  {'T1': lambda: itc.T1, 'T2': lambda: itc.T2, 'T3': lambda: itc.T3},
+                                                  interval=1.0, lock=itc_lease.lock())
         
         step1 = np.linspace(0, self._max_voltage, 25, endpoint=False)
         step2 = np.linspace(self._max_voltage, -self._max_voltage, 50, endpoint=False)
@@ -194,19 +88,6 @@ class SMUTempSweepIV(AbstractMeasurement):
     def number_of_contacts():
         return Contacts.TWO
 
-    @staticmethod
-    def _get_sourcemeter(resource):
-        identification = resource.query('*IDN?')
-        print('DEBUG', identification)
-        if '2400' in identification:
-            return Sourcemeter2400(resource)
-        elif '2602' in identification:
-            return Sourcemeter2602A(resource)
-        elif '2636' in identification:
-            return Sourcemeter2636A(resource)
-        else:
-            raise ValueError('Sourcemeter "{}" not known.'.format(identification))
-
     @staticmethod
     def inputs() -> Dict[str, AbstractValue]:
         return {'v': FloatValue('Maximum Voltage', default=0.0),
@@ -220,7 +101,7 @@ class SMUTempSweepIV(AbstractMeasurement):
     @staticmethod
     def outputs() -> Dict[str, AbstractValue]:
         return {'R': FloatValue('Resistance'),
-                'T': DatetimeValue('Temperature')}
+                'T': FloatValue('Temperature')}
 
     @property
     def recommended_plots(self) -> List[PlotRecommendation]:
@@ -232,20 +113,24 @@ class SMUTempSweepIV(AbstractMeasurement):
         self.__write_header(file_handle)
         sleep(0.5)
         
+        old_timeout = self._resource.timeout
+        self._resource.timeout = 30000
+        try:
+            for next_temperature in self._temperatures:
+                if self._should_stop.is_set():
+                    break
 
-        for next_temperature in self._temperatures:
-            if self._should_stop.is_set():
-                break
-
-            self._goto_temperature_and_stabilize(next_temperature)  
-            self._acquire_i_v_u_curve(file_handle)
+                self._goto_temperature_and_stabilize(next_temperature)  
+                self._acquire_i_v_u_curve(file_handle)
 
-        self.__deinitialize_device()
+            self.__deinitialize_device()
+        finally:
+            self._resource.timeout = old_timeout
 
          
     def _goto_temperature_and_stabilize(self, temperature):
         ramp = 2.0
-        current_temperature = self._temp.T1
+        current_temperature = self._temperature_sampler.get('T1')
         
         sweep_time = abs((current_temperature - temperature) / ramp)
         
@@ -263,10 +148,7 @@ class SMUTempSweepIV(AbstractMeasurement):
         while not temperature_reached:
             if len(temperatures) > 300:
                 temperatures = temperatures[1:300]
-            try:
-                temperatures.append(self._temp.T1)
-            except:
-                temperatures.append(self._temp.T1)
+            temperatures.append(self._temperature_sampler.get('T1', max_age=1.0))
             
             if 20 < temperatures[-1] < 30 and time() - last_toggle_time >= 10:
                 self._temp.toggle_pid_auto(False)
@@ -296,10 +178,7 @@ class SMUTempSweepIV(AbstractMeasurement):
             if len(temperatures) == 300:
                 temperatures = temperatures[1:]
                 
-            try:
-                temperatures.append(self._temp.T1)
-            except:
-                temperatures.append(self._temp.T1)
+            temperatures.append(self._temperature_sampler.get('T1', max_age=1.0))
         
             relative_std = np.std(temperatures) / temperature
         
@@ -322,6 +201,44 @@ class SMUTempSweepIV(AbstractMeasurement):
         
          
     def _acquire_i_v_u_curve(self, file_handle):
+        if self._sweeper is None:
+            self._step_i_v_u_curve(file_handle)
+            return
+
+        print('DEBUG','start voltage sweep')
+        before = self._temperature_sampler.get_many(('T1', 'T2', 'T3'))
+        voltages, currents, temperatures = [], [], []
+        try:
+            # 0.1 s source delay per point, as the stepped sweep waits after each voltage:
+            for started, batch_voltages, batch_currents in self._sweeper.batches(
+                    self._voltages, self._current_limit, self._nplc, delay=0.1, should_stop=self._should_stop):
+                # The temperatures of a batch are the mean of those before and after it:
+                after = self._temperature_sampler.get_many(('T1', 'T2', 'T3'))
+                T1, T2, T3 = np.mean([before, after], axis=0)
+                before = after
+
+                file_handle.write_rows(point_times(started, len(batch_voltages), self._nplc, 0.1),
+                                       batch_voltages, batch_currents, T1, T2, T3)
+                voltages.append(batch_voltages)
+                currents.append(batch_currents)
+                temperatures.append(T3)
+        except:
+            file_handle.write("# error while collecting data\n")
+            print('ERROR', '-'*74)
+            traceback.print_exc()
+            self._invalidate_on_bus_error()
+            return
+        if self._should_stop.is_set():
+            return
+
+        try:
+            R, _ = np.polyfit(np.concatenate(currents), np.concatenate(voltages), 1)
+            self._signal_interface.emit_data({'R': R, 'T': np.mean(temperatures)})
+        except:
+            print('ERROR', '-'*74)
+            traceback.print_exc()
+
+    def _step_i_v_u_curve(self, file_handle):
         self._device.arm()
         
         voltages = []
@@ -342,16 +259,10 @@ class SMUTempSweepIV(AbstractMeasurement):
                 file_handle.write("# error while collecting data\n")
                 print('ERROR', '-'*74)
                 traceback.print_exc()
+                self._invalidate_on_bus_error()
                 continue
                 
-            try:
-                T1 = self._temp.T1
-                T2 = self._temp.T2
-                T3 = self._temp.T3   
-            except:
-                T1 = self._temp.T1
-                T2 = self._temp.T2
-                T3 = self._temp.T3   
+            T1, T2, T3 = self._temperature_sampler.get_many(('T1', 'T2', 'T3'))
             
             voltages.append(voltage)
             currents.append(current)
@@ -359,8 +270,7 @@ class SMUTempSweepIV(AbstractMeasurement):
 
         
             timestamp = datetime.now()
-            file_handle.write("{} {} {} {} {} {}\n".format(timestamp.isoformat(), voltage, current, T1, T2, T3))
-            file_handle.flush()
+            file_handle.write_row(timestamp, voltage, current, T1, T2, T3)
         
         self._device.disarm()
         try:
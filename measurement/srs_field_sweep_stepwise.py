@@ -6,10 +6,15 @@ from typing.io import TextIO
 
 from visa import ResourceManager
 from scientificdevices.stanford_research_systems.sr830m import SR830m
+from instruments.locks import LockedDriver, visa_lock_key
+from instruments.state_cache import SR830_CACHE, CachedInstrument
+from instruments.sr830 import SnapReader
 
 from scientificdevices.oxford.ips120 import IPS120_10, ControlMode, CommunicationProtocol, SweepMode, SwitchHeaterMode
 from scientificdevices.oxford.itc503 import ITC
 
+from instruments.transport import get_gpib_device
+
 from datetime import datetime
 from time import sleep, time
 from threading import Event
@@ -17,125 +22,12 @@ from threading import Event
 import numpy as np
 from queue import Queue
 
-import gpib
-
 import traceback
 
 from enum import Enum
 
 from ast import literal_eval
 
-class GenericInstrument(object):
-    """ This is an abstract class for a generic instrument """
-    def __init__(self):
-        """ Initialises the generic instrument """
-        self.term_chars = '\n'
-
-    def ask(self, query):
-        """ ask will write a request and waits for an answer
-
-            Arguments:
-            query -- (string) the query which shall be sent
-
-            Result:
-            (string) -- answer from device
-        """
-        self.write(query)
-        return self.read()
-
-    def write(self, query):
-        """ writes a query to remote device
-
-            Arguments:
-            query -- (string) the query which shall be sent
-        """
-        pass
-
-    def read(self):
-        """ reads a message from remote device
-
-            Result:
-            (string) -- message from remote device
-        """
-        pass
-
-    def close(self):
-        """ closes connection to remote device """
-        pass
-
-class GpibInstrument(GenericInstrument):
-    """ Implementation of GenericInstrument to communicate with gpib devices """
-    def __init__(self, device):
-        """ initializes connection to gpib device
-
-            Arguments:
-            connection - (gpib.dev) a gpib object to speak to
-        """
-        GenericInstrument.__init__(self)
-        self.device = device
-        self.term_chars = '\n'
-
-    def write(self, query):
-        """ writes a query to remote device
-
-            Arguments:
-            query -- (string) the query which shall be sent
-        """
-        gpib.write(self.device, query + self.term_chars)
-
-    def read(self):
-        """ reads a message from remote device
-
-            Result:
-            (string) -- message from remote device
-        """
-        return gpib.read(self.device, 512).rstrip()
-
-    def close(self):
-        """ closes connection to remote device """
-        gpib.close(self.device)
-
-    def clear(self):
-        """ clears all communication buffers """
-        gpib.clear(self.device)
-
-def get_gpib_timeout(timeout):
-    """ returns the correct timeout object to a certain timeoutvalue
-        it will find the nearest match, e.g., 120us will be 100us
-
-        Arguments:
-        timeout -- (float) number of seconds to wait until timeout
-    """
-    gpib_timeout_list = [(0, gpib.TNONE), \
-                         (10e-6, gpib.T10us), \
-                         (30e-6, gpib.T30us), \
-                         (100e-6, gpib.T100us), \
-                         (300e-6, gpib.T300us), \
-                         (1e-3, gpib.T1ms), \
-                         (3e-3, gpib.T3ms), \
-                         (10e-3, gpib.T10ms), \
-                         (30e-3, gpib.T30ms), \
-                         (100e-3, gpib.T100ms), \
-                         (300e-3, gpib.T300ms), \
-                         (1, gpib.T1s), \
-                         (3, gpib.T3s), \
-                         (10, gpib.T10s), \
-                         (30, gpib.T30s), \
-                         (100, gpib.T100s), \
-                         (300, gpib.T300s), \
-                         (1000, gpib.T1000s)]
-
-    for val, res in gpib_timeout_list:
-        if timeout <= val:
-            return res
-    return gpib.T1000s
-
-def get_gpib_device(port: int, timeout=0.5):
-    device = gpib.dev(0, port)
-    gpib.timeout(device, get_gpib_timeout(timeout))
-    return GpibInstrument(device)
-
-
 @register('SRS830 Voltage vs. Field stepwise (blue)')
 class SRS830UvTBlue(AbstractMeasurement):
 
@@ -149,9 +41,23 @@ class SRS830UvTBlue(AbstractMeasurement):
                      
         super().__init__(signal_interface, path, contacts)
         self._comment = comment
-        self._device = SR830m(gpib)
-        self._mag = IPS120_10()
-        self._temp = ITC(get_gpib_device(24))
+        lock_in_lease = self._lease_instrument(('SR830m', gpib),
+                                               lambda: LockedDriver(SR830m(gpib), visa_lock_key(gpib)),
+                                               lock_key=visa_lock_key(gpib))
+        self._lock_in_lock = lock_in_lease.lock()
+        self._device = CachedInstrument(lock_in_lease.resource, **SR830_CACHE)
+        # X, Y, R and theta of a data point in one query:
+        self._snap = SnapReader(self._device, lock=self._lock_in_lock)
+        mag_lease = self._lease_instrument(('IPS120_10',), lambda: LockedDriver(IPS120_10(), ('IPS120_10',)))
+        self._mag = mag = mag_lease.resource
+        self._field_sampler = self._sampler(('IPS120_10',), {'field': lambda: mag.get_field()},
+                                            interval=0.5, lock=mag_lease.lock())
+        itc_lease = self._lease_instrument(('gpib', 0, 24), lambda: get_gpib_device(24))
+        self._temp = itc = itc_lease.driver('itc', ITC)
+        # Temperatures are polled in the background; data points take the latest values:
+        self._temperature_sampler = self._sampler(('itc', 0, 24),
+                                                  {'T1': lambda: itc.T1, 'T2': lambda: itc.T2, 'T3': lambda: itc.T3},
+                                                  interval=1.0, lock=itc_lease.lock())
         self._pre_resistance = R
         self._sweep_rate = sweep_rate
         self._number_of_measurements = number_of_measurements
@@ -193,7 +99,7 @@ class SRS830UvTBlue(AbstractMeasurement):
     @staticmethod
     def outputs() -> Dict[str, AbstractValue]:
         return {'U': FloatValue('Voltage[V]'),
-                'B': DatetimeValue('Field[T]')}
+                'B': FloatValue('Field[T]')}
 
     @property
     def recommended_plots(self) -> List[PlotRecommendation]:
@@ -217,6 +123,7 @@ class SRS830UvTBlue(AbstractMeasurement):
                 except: 
                     print('{} failed to acquire datapoint.'.format(datetime.now().isoformat()))
                     traceback.print_exc()
+                    self._invalidate_on_bus_error()
                 
 
         self.__deinitialize_device()
@@ -230,7 +137,7 @@ class SRS830UvTBlue(AbstractMeasurement):
         
         field_reached = False
         while not field_reached:
-            current_field = self._mag.get_field()
+            current_field = self._field_sampler.get('field', max_age=1.0)
             if abs(current_field - field) < 0.001:
                 field_reached = True
 
@@ -244,12 +151,10 @@ class SRS830UvTBlue(AbstractMeasurement):
     def _acquire_data_point(self, file_handle):
         x, y, r, t = self.__measure_data_point()
         sensitivity = self.__get_auxiliary_data()
-        T1, T2, T3 = self._temp.T1, self._temp.T2, self._temp.T3
-        field = self._mag.get_field()
+        T1, T2, T3 = self._temperature_sampler.get_many(('T1', 'T2', 'T3'))
+        field = self._field_sampler.get('field')
         
-        file_handle.write('{} {} {} {} {} {} {} {} {} {}\n'.format(datetime.now().isoformat(), field, 
-                                                             x, y, r, t,sensitivity, T1, T2, T3))
-        file_handle.flush()
+        file_handle.write_row(datetime.now(), field, x, y, r, t, sensitivity, T1, T2, T3)
         
         self._signal_interface.emit_data({'U': x, 'B': field})
      
@@ -283,7 +188,7 @@ class SRS830UvTBlue(AbstractMeasurement):
         file_handle.write("Datetime Field Real Imaginary Amplitude Theta Sensitivity T1 T2 T3\n")
 
     def __measure_data_point(self):
-        return (self._device.outpX, self._device.outpY, self._device.outpR, self._device.outpT)
+        return self._snap.read()
 
     def __get_auxiliary_data(self):
         return self._device.sens
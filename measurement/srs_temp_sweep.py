@@ -1,14 +1,19 @@
 from .measurement import register, AbstractMeasurement, Contacts, PlotRecommendation
 from .measurement import StringValue, FloatValue, IntegerValue, DatetimeValue, AbstractValue, SignalInterface, GPIBPathValue
 
-from typing import Dict, Tuple, List
+from typing import Dict, Tuple, List, Optional
 from typing.io import TextIO
 
 from visa import ResourceManager
 from scientificdevices.stanford_research_systems.sr830m import SR830m
+from instruments.locks import LockedDriver, visa_lock_key
+from instruments.state_cache import SR830_CACHE, CachedInstrument
+from instruments.sr830 import BUFFER_POLL_INTERVAL, BufferedReader, SnapReader
 
 from scientificdevices.oxford.itc503 import ITC
 
+from instruments.transport import get_gpib_device
+
 from datetime import datetime
 from time import sleep, time
 from threading import Event
@@ -16,123 +21,10 @@ from threading import Event
 import numpy as np
 from queue import Queue
 
-import gpib
-
 import traceback
 
 from ast import literal_eval
 
-class GenericInstrument(object):
-    """ This is an abstract class for a generic instrument """
-    def __init__(self):
-        """ Initialises the generic instrument """
-        self.term_chars = '\n'
-
-    def ask(self, query):
-        """ ask will write a request and waits for an answer
-
-            Arguments:
-            query -- (string) the query which shall be sent
-
-            Result:
-            (string) -- answer from device
-        """
-        self.write(query)
-        return self.read()
-
-    def write(self, query):
-        """ writes a query to remote device
-
-            Arguments:
-            query -- (string) the query which shall be sent
-        """
-        pass
-
-    def read(self):
-        """ reads a message from remote device
-
-            Result:
-            (string) -- message from remote device
-        """
-        pass
-
-    def close(self):
-        """ closes connection to remote device """
-        pass
-
-class GpibInstrument(GenericInstrument):
-    """ Implementation of GenericInstrument to communicate with gpib devices """
-    def __init__(self, device):
-        """ initializes connection to gpib device
-
-            Arguments:
-            connection - (gpib.dev) a gpib object to speak to
-        """
-        GenericInstrument.__init__(self)
-        self.device = device
-        self.term_chars = '\n'
-
-    def write(self, query):
-        """ writes a query to remote device
-
-            Arguments:
-            query -- (string) the query which shall be sent
-        """
-        gpib.write(self.device, query + self.term_chars)
-
-    def read(self):
-        """ reads a message from remote device
-
-            Result:
-            (string) -- message from remote device
-        """
-        return gpib.read(self.device, 512).rstrip()
-
-    def close(self):
-        """ closes connection to remote device """
-        gpib.close(self.device)
-
-    def clear(self):
-        """ clears all communication buffers """
-        gpib.clear(self.device)
-
-def get_gpib_timeout(timeout):
-    """ returns the correct timeout object to a certain timeoutvalue
-        it will find the nearest match, e.g., 120us will be 100us
-
-        Arguments:
-        timeout -- (float) number of seconds to wait until timeout
-    """
-    gpib_timeout_list = [(0, gpib.TNONE), \
-                         (10e-6, gpib.T10us), \
-                         (30e-6, gpib.T30us), \
-                         (100e-6, gpib.T100us), \
-                         (300e-6, gpib.T300us), \
-                         (1e-3, gpib.T1ms), \
-                         (3e-3, gpib.T3ms), \
-                         (10e-3, gpib.T10ms), \
-                         (30e-3, gpib.T30ms), \
-                         (100e-3, gpib.T100ms), \
-                         (300e-3, gpib.T300ms), \
-                         (1, gpib.T1s), \
-                         (3, gpib.T3s), \
-                         (10, gpib.T10s), \
-                         (30, gpib.T30s), \
-                         (100, gpib.T100s), \
-                         (300, gpib.T300s), \
-                         (1000, gpib.T1000s)]
-
-    for val, res in gpib_timeout_list:
-        if timeout <= val:
-            return res
-    return gpib.T1000s
-
-def get_gpib_device(port: int, timeout=0.5):
-    device = gpib.dev(0, port)
-    gpib.timeout(device, get_gpib_timeout(timeout))
-    return GpibInstrument(device)
-
-
 @register('SRS830 Resistance vs. Temp. (blue)')
 class SRS830RvTBlue(AbstractMeasurement):
 
@@ -141,12 +33,26 @@ class SRS830RvTBlue(AbstractMeasurement):
                  path: str, contacts: Tuple[str, str, str, str],
                  R: float = 9.99e6, comment: str = '', gpib: str='GPIB0::7::INSTR',
                  sweep_rate:float = 1.0,
-                 temperature_end: float = 2):
+                 temperature_end: float = 2, sample_rate: float = 0.0):
                      
         super().__init__(signal_interface, path, contacts)
         self._comment = comment
-        self._device = SR830m(gpib)
-        self._temp = ITC(get_gpib_device(24))
+        lock_in_lease = self._lease_instrument(('SR830m', gpib),
+                                               lambda: LockedDriver(SR830m(gpib), visa_lock_key(gpib)),
+                                               lock_key=visa_lock_key(gpib))
+        self._lock_in_lock = lock_in_lease.lock()
+        self._device = CachedInstrument(lock_in_lease.resource, **SR830_CACHE)
+        # X, Y, R and theta of a data point in one query:
+        self._snap = SnapReader(self._device, lock=self._lock_in_lock)
+        # Above zero, X and Y are recorded in the lock-in's buffers at this rate:
+        self._sample_rate = sample_rate
+        self._buffer = None  # type: Optional[BufferedReader]
+        itc_lease = self._lease_instrument(('gpib', 0, 24), lambda: get_gpib_device(24))
+        self._temp = itc = itc_lease.driver('itc', ITC)
+        # Temperatures are polled in the background; data points take the latest values:
+        self._temperature_sampler = self._sampler(('itc', 0, 24),
+                                                  {'T1': lambda: itc.T1, 'T2': lambda: itc.T2, 'T3': lambda: itc.T3},
+                                                  interval=1.0, lock=itc_lease.lock())
         self._pre_resistance = R
         self._sweep_rate = sweep_rate
             
@@ -177,12 +83,13 @@ class SRS830RvTBlue(AbstractMeasurement):
                 'comment': StringValue('Comment', default=''),
                 'sweep_rate': FloatValue('Sweep Rate', default = 1.0),
                 'gpib': GPIBPathValue('GPIB Address', default='GPIB0::7::INSTR'),
+                'sample_rate': FloatValue('Buffer Rate [Hz] (0: single points)', default=0.0),
                 }
 
     @staticmethod
     def outputs() -> Dict[str, AbstractValue]:
         return {'R': FloatValue('Resistance'),
-                'T': DatetimeValue('Temperature')}
+                'T': FloatValue('Temperature')}
 
     @property
     def recommended_plots(self) -> List[PlotRecommendation]:
@@ -193,20 +100,26 @@ class SRS830RvTBlue(AbstractMeasurement):
         sleep(0.5)
         
         self._start_sweep()
+        self.__start_buffer()
 
         while not self._should_stop.is_set():
             try:
-                self._acquire_data_point(file_handle)
+                if self._buffer is None:
+                    self._acquire_data_point(file_handle)
+                else:
+                    sleep(BUFFER_POLL_INTERVAL)
+                    self._acquire_buffered_data(file_handle)
             except:
                 print('{} failed to acquire datapoint.'.format(datetime.now().isoformat()))
                 traceback.print_exc()
+                self._invalidate_on_bus_error()
                 
             self._toggle_pid_if_necessary()
 
         self.__deinitialize_device()
 
     def _start_sweep(self):
-        current_temperature = self._temp.T1
+        current_temperature = self._temperature_sampler.get('T1')
         
         sweep_time = abs((current_temperature - self._temperature_end) / self._sweep_rate)
         
@@ -215,7 +128,7 @@ class SRS830RvTBlue(AbstractMeasurement):
         self._temp.start_temperature_sweep()
 
     def _toggle_pid_if_necessary(self):
-        current_temperature = self._temp.T1
+        current_temperature = self._temperature_sampler.get('T1')
         
         if 20 < current_temperature < 30 and time() - self._last_toggle > 100:
             self._temp.toggle_pid_auto(False)
@@ -226,11 +139,9 @@ class SRS830RvTBlue(AbstractMeasurement):
     def _acquire_data_point(self, file_handle):
         x, y, r, t = self.__measure_data_point()
         sensitivity = self.__get_auxiliary_data()
-        T1, T2, T3 = self._temp.T1, self._temp.T2, self._temp.T3
+        T1, T2, T3 = self._temperature_sampler.get_many(('T1', 'T2', 'T3'))
         
-        file_handle.write('{} {} {} {} {} {} {} {} {}\n'.format(datetime.now().isoformat(), 
-                                                             x, y, r, t,sensitivity, T1, T2, T3))
-        file_handle.flush()
+        file_handle.write_row(datetime.now(), x, y, r, t, sensitivity, T1, T2, T3)
         
         resistance = x / self._device.slvl * self._pre_resistance
         
@@ -238,8 +149,28 @@ class SRS830RvTBlue(AbstractMeasurement):
         
         
 
+    def _acquire_buffered_data(self, file_handle):
+        data = self._buffer.poll()
+        if data is None:
+            return
+        sensitivity = self.__get_auxiliary_data()
+        T1, T2, T3 = self._temperature_sampler.get_many(('T1', 'T2', 'T3'))
+
+        file_handle.write_rows(data.time, data.x, data.y, data.r, data.theta, sensitivity, T1, T2, T3)
+
+        resistance = data.x / self._device.slvl * self._pre_resistance
+
+        self._signal_interface.emit_data_batch({'R': resistance, 'T': np.full(len(data), T3)})
+
+    def __start_buffer(self) -> None:
+        if self._sample_rate > 0:
+            self._buffer = BufferedReader(self._device, self._sample_rate, lock=self._lock_in_lock)
+            self._buffer.start()
+
     def __deinitialize_device(self) -> None:
         self._temp.stop_temperature_sweep()
+        if self._buffer is not None:
+            self._buffer.stop()
 
     def __write_header(self, file_handle: TextIO) -> None:
         file_handle.write("# {0}\n".format(datetime.now().isoformat()))
@@ -252,7 +183,7 @@ class SRS830RvTBlue(AbstractMeasurement):
         file_handle.write("Datetime Real Imaginary Amplitude Theta Sensitivity T1 T2 T3\n")
 
     def __measure_data_point(self):
-        return (self._device.outpX, self._device.outpY, self._device.outpR, self._device.outpT)
+        return self._snap.read()
 
     def __get_auxiliary_data(self):
         return self._device.sens
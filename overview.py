@@ -1,7 +1,12 @@
 """Automatic generation of overview files for measurement data."""
+import atexit
 import csv
 import os
-from typing import List, Optional
+import shutil
+import sqlite3
+from datetime import datetime
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
 import warnings
 
 
@@ -16,16 +21,54 @@ class Overview:
     "overview_MEASUREMENTNAME.dat"
     where "MEASUREMENTNAME" is the name of the measurement method class.
 
+    Use 'Overview.open()' to get the overview of a measurement: the file is
+    opened, and its header checked, only once per session; afterwards
+    adding a row is a single buffered write. If the header of an existing
+    file lacks columns, they are appended to the header; older rows simply
+    end early and read as empty values.
+
+    Every row is mirrored into the table MEASUREMENTNAME of the SQLite
+    database "overview.sqlite" in the same directory, with columns typed by
+    their values, so that 'query()' can select values by contacts and date
+    without parsing the CSV file.
+
     Attributes:
         _target_directory
         _measurement_name
-        _column_names
+        _column_names: Columns of the file, i.e. the requested ones and any
+                       others which the existing file already had
+        _required_columns: Columns which every row must fill
         _comment_lines
     """
 
     COMMENT_CHAR = "#"  # The character signalling the beginning of a CSV comment
     CSV_SEPARATOR = " "
-    
+    DATABASE_FILE_NAME = "overview.sqlite"
+    DATETIME_COLUMN = "Datetime"
+    CONTACTS_COLUMN = "Contacts"
+
+    _instances = dict()  # type: Dict[Tuple[str, str], Overview]
+    _instances_lock = Lock()
+
+    @classmethod
+    def open(cls, target_directory: str, measurement_name: str, column_names: List[str],
+             comment_lines: List[str] = []) -> 'Overview':
+        """Return the open overview of a measurement, creating it on first use.
+
+        The arguments are the same as for the constructor. If an open
+        overview does not have all of 'column_names' yet, its schema is
+        extended.
+        """
+        key = (os.path.abspath(target_directory), measurement_name)
+        with cls._instances_lock:
+            overview = cls._instances.get(key)
+            if overview is None:
+                overview = cls(target_directory, measurement_name, column_names, comment_lines)
+                cls._instances[key] = overview
+            else:
+                overview._require_columns(column_names)
+            return overview
+
     def __init__(self, target_directory: str,
                  measurement_name: str, column_names: List[str],
                  comment_lines: List[str] = []) -> None:
@@ -37,13 +80,28 @@ class Overview:
         """
         self._target_directory = target_directory
         self._measurement_name = measurement_name
-        self._column_names = column_names
+        self._column_names = list(column_names)
+        self._required_columns = list(column_names)
         self._comment_lines = comment_lines
 
+        self._lock = Lock()
+        self._file = None
+        self._writer = None  # type: Optional[csv.DictWriter]
+
         existing_file = self._find_existing()
         if existing_file is None:
             self._create_new()
-    
+        else:
+            self._validate_header()
+        self._open_for_append()
+
+        self._database = _OverviewDatabase(
+            os.path.join(self._target_directory, self.DATABASE_FILE_NAME),
+            self._measurement_name)
+        if not self._database.has_table():
+            self._database.import_csv(self._file_path, self.COMMENT_CHAR, self.CSV_SEPARATOR)
+
+        atexit.register(self.close)
 
     def add_measurement(self, **data) -> None:
         """Add a row to the overview file which contains the values of 'data'.
@@ -52,24 +110,52 @@ class Overview:
                      All column names of this overview must be in the keys.
 
         """
-        if (set(self._column_names) - data.keys()) != set():
+        if (set(self._required_columns) - data.keys()) != set():
             raise RuntimeError(
                 "Not all columns of the overview were filled with values.\n"
-                "Expected columns: {}\nReceived columns: {}".format(self._column_names,
-                                                                    list(data.keys))
+                "Expected columns: {}\nReceived columns: {}".format(self._required_columns,
+                                                                    list(data.keys()))
             )
-        for key in data.keys():
+        for key in list(data.keys()):
             if key not in self._column_names:
                 warnings.warn(
                     "Unexpected column {} will not be appended to the overview file.".format(key)
                 )
                 data.pop(key)
 
-        with open(self._file_path, "a") as outfile:
-            # Filter out lines that are comments:
-            writer = csv.DictWriter(outfile, self._column_names,
-                                    delimiter=self.CSV_SEPARATOR)
-            writer.writerow(data)
+        with self._lock:
+            self._writer.writerow(data)
+            self._file.flush()
+
+        self._database.insert(data)
+
+    def query(self, column: str, contacts: Optional[str] = None,
+              start: Optional[datetime] = None,
+              end: Optional[datetime] = None) -> List[Tuple[Optional[datetime], Any]]:
+        """Return the values of one column, e.g. all 'Resistance' of some contacts in a time range.
+
+        :param column: Name of the column to return
+        :param contacts: Only rows of these contacts, in the format of the
+                         "Contacts" column (e.g. "I-7 I-8")
+        :param start: Only rows at or after this time
+        :param end: Only rows at or before this time
+        :return: Pairs of the row's datetime (or 'None' if it has none) and the
+                 value, ordered by datetime
+        """
+        return self._database.query(column, contacts, start, end)
+
+    def close(self) -> None:
+        """Close the file and the database; 'open()' opens them again."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        self._database.close()
+        atexit.unregister(self.close)
+        with self._instances_lock:
+            key = (os.path.abspath(self._target_directory), self._measurement_name)
+            if self._instances.get(key) is self:
+                del self._instances[key]
 
     @property
     def _file_path(self) -> str:
@@ -79,7 +165,7 @@ class Overview:
 
     def _find_existing(self) -> Optional[str]:
         """Returns the path of an existing overview file or 'None' if none exists."""
-        
+
         if os.path.isfile(self._file_path):
             return self._file_path
         else:
@@ -88,23 +174,233 @@ class Overview:
     def _create_new(self) -> None:
         """Create a new overview file and write its header."""
 
-        with open(self._file_path, "w") as outfile:
+        with open(self._file_path, "w", newline="") as outfile:
             for comment in self._comment_lines:
                 outfile.write("{} {}\n".format(self.COMMENT_CHAR, comment))
 
             writer = csv.DictWriter(outfile, fieldnames=self._column_names, delimiter=self.CSV_SEPARATOR)
             writer.writeheader()
 
-            
+    def _read_header(self) -> Optional[List[str]]:
+        """Return the column names of the existing file, or 'None' if it has no header line."""
+        with open(self._file_path, newline="") as infile:
+            for line in infile:
+                if line.startswith(self.COMMENT_CHAR):
+                    continue
+                if line.strip():
+                    return next(csv.reader([line], delimiter=self.CSV_SEPARATOR))
+        return None
+
+    def _validate_header(self) -> None:
+        existing_columns = self._read_header()
+        if existing_columns is None:
+            self._create_new()
+            return
+
+        missing = [name for name in self._column_names if name not in existing_columns]
+        self._column_names = existing_columns + missing
+        if missing:
+            print('DEBUG', 'Adding columns {} to {}'.format(missing, self._file_path))
+            self._rewrite_header()
+
+    def _require_columns(self, column_names: List[str]) -> None:
+        """Make sure the file has all of 'column_names' and require them from now on."""
+        with self._lock:
+            self._required_columns = list(column_names)
+            missing = [name for name in column_names if name not in self._column_names]
+            if not missing:
+                return
+            print('DEBUG', 'Adding columns {} to {}'.format(missing, self._file_path))
+            self._column_names += missing
+            self._file.close()
+            self._rewrite_header()
+            self._open_for_append()
+
+    def _rewrite_header(self) -> None:
+        """Replace the header line with '_column_names'; the rows are copied unchanged."""
+        temporary_path = self._file_path + ".tmp"
+        with open(self._file_path, newline="") as infile, \
+                open(temporary_path, "w", newline="") as outfile:
+            for line in infile:
+                if line.startswith(self.COMMENT_CHAR) or not line.strip():
+                    outfile.write(line)
+                    continue
+                csv.writer(outfile, delimiter=self.CSV_SEPARATOR).writerow(self._column_names)
+                break
+            shutil.copyfileobj(infile, outfile)
+        os.replace(temporary_path, self._file_path)
+
+    def _open_for_append(self) -> None:
+        self._file = open(self._file_path, "a", newline="")
+        self._writer = csv.DictWriter(self._file, self._column_names, restval="",
+                                      delimiter=self.CSV_SEPARATOR)
+
+
+class _OverviewDatabase:
+    """SQLite table mirroring an overview file; column types follow the first value stored.
+
+    Errors are reported and otherwise ignored: the CSV file stays the primary record.
+    """
+
+    def __init__(self, file_path: str, table: str) -> None:
+        self._table = table
+        self._lock = Lock()
+        self._columns = dict()  # type: Dict[str, str]
+        try:
+            # The connection is used by the measurement threads and by the UI:
+            self._connection = sqlite3.connect(file_path, check_same_thread=False)
+            self._load_columns()
+        except sqlite3.Error as error:
+            self._report(error)
+            self._connection = None
+
+    @staticmethod
+    def _quote(name: str) -> str:
+        return '"{}"'.format(name.replace('"', '""'))
+
+    @staticmethod
+    def _type_of(value: Any) -> str:
+        if isinstance(value, (bool, int)):
+            return 'INTEGER'
+        elif isinstance(value, float):
+            return 'REAL'
+        return 'TEXT'
+
+    @staticmethod
+    def _parse(value: str) -> Any:
+        """Convert a value read from the CSV file back into a number where possible."""
+        if value in ('True', 'False'):
+            return value == 'True'
+        for convert in (int, float):
+            try:
+                return convert(value)
+            except ValueError:
+                pass
+        return value
+
+    def _report(self, error: Exception) -> None:
+        print('WARNING', 'Overview database for {}: {}'.format(self._table, error))
+
+    def _load_columns(self) -> None:
+        rows = self._connection.execute('PRAGMA table_info({})'.format(self._quote(self._table)))
+        self._columns = {row[1]: row[2] for row in rows}
+
+    def has_table(self) -> bool:
+        return self._connection is None or bool(self._columns)
+
+    def _ensure_columns(self, row: Dict[str, Any]) -> None:
+        new_columns = [(name, self._type_of(value)) for name, value in row.items()
+                       if name not in self._columns]
+        if not new_columns:
+            return
+
+        table = self._quote(self._table)
+        if not self._columns:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS {} ({})'.format(
+                table, ', '.join('{} {}'.format(self._quote(name), column_type)
+                                 for name, column_type in new_columns)))
+        else:
+            for name, column_type in new_columns:
+                self._connection.execute('ALTER TABLE {} ADD COLUMN {} {}'.format(
+                    table, self._quote(name), column_type))
+
+        columns = set(self._columns) | {name for name, _ in new_columns}
+        for name in (Overview.CONTACTS_COLUMN, Overview.DATETIME_COLUMN):
+            if name in columns:
+                self._connection.execute('CREATE INDEX IF NOT EXISTS {} ON {} ({})'.format(
+                    self._quote('{}_{}'.format(self._table, name)), table, self._quote(name)))
+        self._load_columns()
+
+    def _insert_rows(self, rows: List[Dict[str, Any]]) -> None:
+        for row in rows:
+            self._ensure_columns(row)
+            names = list(row.keys())
+            self._connection.execute('INSERT INTO {} ({}) VALUES ({})'.format(
+                self._quote(self._table), ', '.join(map(self._quote, names)),
+                ', '.join('?' * len(names))), [row[name] for name in names])
+
+    def insert(self, row: Dict[str, Any]) -> None:
+        if self._connection is None:
+            return
+        with self._lock:
+            try:
+                with self._connection:
+                    self._insert_rows([row])
+            except sqlite3.Error as error:
+                self._report(error)
+
+    def import_csv(self, file_path: str, comment_char: str, separator: str) -> None:
+        """Fill a new table with the rows of an existing overview file."""
+        if self._connection is None:
+            return
+        with self._lock, open(file_path, newline="") as infile:
+            lines = (line for line in infile if not line.startswith(comment_char))
+            rows = [{name: self._parse(value) for name, value in row.items()
+                     if name is not None and value not in (None, '')}
+                    for row in csv.DictReader(lines, delimiter=separator)]
+            try:
+                with self._connection:
+                    self._insert_rows([row for row in rows if row])
+            except sqlite3.Error as error:
+                self._report(error)
+
+    def query(self, column: str, contacts: Optional[str], start: Optional[datetime],
+              end: Optional[datetime]) -> List[Tuple[Optional[datetime], Any]]:
+        if self._connection is None:
+            return []
+
+        with self._lock:
+            if column not in self._columns:
+                return []
+            has_datetime = Overview.DATETIME_COLUMN in self._columns
+            if (start is not None or end is not None) and not has_datetime:
+                return []
+            if contacts is not None and Overview.CONTACTS_COLUMN not in self._columns:
+                return []
+
+            datetime_column = self._quote(Overview.DATETIME_COLUMN)
+            conditions, parameters = [], []  # type: List[str], List[Any]
+            if contacts is not None:
+                conditions.append('{} = ?'.format(self._quote(Overview.CONTACTS_COLUMN)))
+                parameters.append(contacts)
+            # ISO timestamps compare correctly as text:
+            if start is not None:
+                conditions.append('{} >= ?'.format(datetime_column))
+                parameters.append(start.isoformat())
+            if end is not None:
+                conditions.append('{} <= ?'.format(datetime_column))
+                parameters.append(end.isoformat())
+
+            statement = 'SELECT {}, {} FROM {}'.format(
+                datetime_column if has_datetime else 'NULL', self._quote(column),
+                self._quote(self._table))
+            if conditions:
+                statement += ' WHERE ' + ' AND '.join(conditions)
+            if has_datetime:
+                statement += ' ORDER BY {}'.format(datetime_column)
+
+            try:
+                rows = self._connection.execute(statement, parameters).fetchall()
+            except sqlite3.Error as error:
+                self._report(error)
+                return []
+
+        return [(datetime.fromisoformat(timestamp) if timestamp else None, value)
+                for timestamp, value in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
 if __name__ == "__main__":
-    from datetime import datetime
-    
     measurement_class_name = "MyTestMethod"
     columns = ["Datetime", "Resistance", "Temperature"]
     comment_lines = ["This is a test overview file", "Nothing to see here"]
 
-    overview = Overview("/tmp", measurement_class_name, columns, comment_lines)
+    overview = Overview.open("/tmp", measurement_class_name, columns, comment_lines)
     overview.add_measurement(Datetime=datetime.now().isoformat(), Resistance=1.23,
                              Temperature=1.234)
-
-    
+    print(overview.query("Resistance", start=datetime(2000, 1, 1)))
@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from data_writer import AsyncDataWriter, BinaryColumnSink, TextSink  # noqa: E402
+
+
+class FailingSink(TextSink):
+    """Fails on the first data row."""
+
+    def write_row(self, values):
+        raise OSError('disk full')
+
+
+def test_write_rows_repeats_scalar_columns(tmp_path):
+    path = tmp_path / 'data.dat'
+    with AsyncDataWriter([TextSink(str(path))]) as writer:
+        writer.write('Voltage Current T\n')
+        writer.write_rows(np.array([1.0, 2.0]), [0.5, 0.25], 4.2)
+    assert path.read_text().splitlines() == ['Voltage Current T', '1.0 0.5 4.2', '2.0 0.25 4.2']
+
+
+def test_sync_writes_everything_queued(tmp_path):
+    path = tmp_path / 'data.dat'
+    writer = AsyncDataWriter([TextSink(str(path))], flush_interval=60.0)
+    try:
+        writer.write_row(1, 2)
+        writer.sync()
+        assert path.read_text() == '1 2\n'
+    finally:
+        writer.close()
+
+
+def test_writer_error_is_raised_on_exit(tmp_path):
+    with pytest.raises(OSError, match='disk full'):
+        with AsyncDataWriter([FailingSink(str(tmp_path / 'data.dat'))]) as writer:
+            writer.write_row(1, 2)
+
+
+def test_exception_of_the_block_is_kept(tmp_path, capsys):
+    with pytest.raises(RuntimeError, match='instrument'):
+        with AsyncDataWriter([FailingSink(str(tmp_path / 'data.dat'))]) as writer:
+            writer.write_row(1, 2)
+            raise RuntimeError('instrument')
+    assert 'disk full' in capsys.readouterr().out
+
+
+def _load_chunk(directory, index=0):
+    with np.load(str(directory / BinaryColumnSink.CHUNK_FILE_NAME.format(index))) as chunk:
+        return {name: chunk[name] for name in chunk.files}
+
+
+def test_binary_columns_widen_instead_of_failing(tmp_path):
+    directory = tmp_path / 'data.chunks'
+    sink = BinaryColumnSink(str(directory))
+    sink.write_text('# comment\nValue Flag\n')
+    sink.write_row((1.5, True))
+    sink.write_row(('overload', None))
+    sink.close()
+
+    chunk = _load_chunk(directory)
+    assert chunk['Value'].tolist() == ['1.5', 'overload']
+    assert chunk['Flag'][0] == 1.0 and np.isnan(chunk['Flag'][1])
+    header = json.loads((directory / BinaryColumnSink.HEADER_FILE_NAME).read_text())
+    assert header['comments'] == ['comment']
+    assert header['rows'] == 2
+
+
+def test_binary_chunks_are_readable_after_each_flush(tmp_path):
+    directory = tmp_path / 'data.chunks'
+    sink = BinaryColumnSink(str(directory), chunk_rows=3)
+    sink.write_text('a b\n')
+    sink.write_rows([(1.0, 2.0), (3.0, 4.0)])
+    sink.flush()
+    assert _load_chunk(directory)['a'].tolist() == [1.0, 3.0]
+
+    sink.write_rows([(5.0, 6.0), (7.0, 8.0)])
+    sink.close()
+    assert _load_chunk(directory, 0)['b'].tolist() == [2.0, 4.0, 6.0]
+    assert _load_chunk(directory, 1)['b'].tolist() == [8.0]
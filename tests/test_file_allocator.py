@@ -0,0 +1,74 @@
+import json
+import os
+from threading import Thread
+
+from file_allocator import FileAllocator
+
+
+def test_numbers_follow_each_other(tmp_path):
+    allocator = FileAllocator(str(tmp_path))
+    first = allocator.allocate('run_')
+    second = allocator.allocate('run_')
+    assert os.path.basename(first) == 'run_001.dat'
+    assert os.path.basename(second) == 'run_002.dat'
+    assert os.path.exists(first) and os.path.exists(second)
+
+
+def test_stale_index_is_rescanned(tmp_path):
+    allocator = FileAllocator(str(tmp_path))
+    allocator.allocate('run_')
+    # Copied in by hand, the index does not know them:
+    (tmp_path / 'run_002.dat').touch()
+    (tmp_path / 'run_003.dat').touch()
+    assert os.path.basename(allocator.allocate('run_')) == 'run_004.dat'
+
+
+def test_unreadable_index_is_rebuilt(tmp_path):
+    (tmp_path / 'run_007.dat').touch()
+    (tmp_path / FileAllocator.INDEX_FILE_NAME).write_text('not json')
+    allocator = FileAllocator(str(tmp_path))
+    assert os.path.basename(allocator.allocate('run_')) == 'run_008.dat'
+    index = json.loads((tmp_path / FileAllocator.INDEX_FILE_NAME).read_text())
+    assert index['counters'] == {'run_|.dat': 8}
+
+
+def test_rescan_forgets_the_index(tmp_path):
+    allocator = FileAllocator(str(tmp_path))
+    allocator.allocate('run_')
+    os.remove(allocator.allocate('run_'))
+    allocator.rescan()
+    assert os.path.basename(allocator.allocate('run_')) == 'run_002.dat'
+
+
+def test_reserved_suffixes_share_the_numbers(tmp_path):
+    (tmp_path / 'run_001.chunks').mkdir()
+    allocator = FileAllocator(str(tmp_path))
+    assert os.path.basename(allocator.allocate('run_', reserved_suffixes=('.chunks',))) == 'run_002.dat'
+
+
+def test_reserved_number_without_file(tmp_path):
+    allocator = FileAllocator(str(tmp_path))
+    first = allocator.allocate('plot_', '.pdf', create=False)
+    second = allocator.allocate('plot_', '.pdf', create=False)
+    assert os.path.basename(first) == 'plot_001.pdf'
+    assert os.path.basename(second) == 'plot_002.pdf'
+    assert not os.path.exists(first) and not os.path.exists(second)
+
+
+def test_concurrent_claims_get_different_files(tmp_path):
+    # Separate allocators stand in for separate processes sharing the directory:
+    allocators = [FileAllocator(str(tmp_path)) for _ in range(4)]
+    paths = []
+
+    def allocate(allocator):
+        for _ in range(25):
+            paths.append(allocator.allocate('run_'))
+
+    threads = [Thread(target=allocate, args=(allocator,)) for allocator in allocators]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(paths)) == 100
+    assert sorted(os.path.basename(path) for path in paths) == ['run_{:03d}.dat'.format(n) for n in range(1, 101)]
@@ -0,0 +1,26 @@
+from instruments.transport import Instrument, SimulatedBackend
+
+
+def test_reply_of_exactly_chunk_size_bytes():
+    # 15 characters and the termination fill one chunk exactly:
+    instrument = Instrument(SimulatedBackend({'Q?': 'x' * 15}), chunk_size=16)
+    assert instrument.ask('Q?') == b'x' * 15
+
+
+def test_reply_of_several_chunks():
+    instrument = Instrument(SimulatedBackend({'Q?': 'y' * 40}), chunk_size=16)
+    assert instrument.ask('Q?') == b'y' * 40
+
+
+def test_replies_stay_separate_messages():
+    backend = SimulatedBackend({'A?': '1', 'B?': '2'})
+    instrument = Instrument(backend, chunk_size=16)
+    instrument.write('A?')
+    instrument.write('B?')
+    assert instrument.read() == b'1'
+    assert instrument.read() == b'2'
+
+
+def test_pipeline_returns_text():
+    instrument = Instrument(SimulatedBackend({'A?;B?': '1;2'}))
+    assert instrument.pipeline(['A?', 'B?']) == ['1', '2']
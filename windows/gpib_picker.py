@@ -1,13 +1,88 @@
 from PyQt5.QtWidgets import QWidget, QComboBox, QPushButton, QAction, QHBoxLayout
 from PyQt5.QtGui import QPixmap, QIcon
+from PyQt5.QtCore import QObject, pyqtSignal
 
 from base64 import b64decode
-
-from visa import ResourceManager
+from threading import Lock, Thread
+from time import monotonic
+from typing import List, Optional
 
 REFRESH_ICON = 'iVBORw0KGgoAAAANSUhEUgAAAQAAAAEACAMAAABrrFhUAAADAFBMVEUAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAADMAAGYAAJkAAMwAAP8AMwAAMzMAM2YAM5kAM8wAM/8AZgAAZjMAZmYAZpkAZswAZv8AmQAAmTMAmWYAmZkAmcwAmf8AzAAAzDMAzGYAzJkAzMwAzP8A/wAA/zMA/2YA/5kA/8wA//8zAAAzADMzAGYzAJkzAMwzAP8zMwAzMzMzM2YzM5kzM8wzM/8zZgAzZjMzZmYzZpkzZswzZv8zmQAzmTMzmWYzmZkzmcwzmf8zzAAzzDMzzGYzzJkzzMwzzP8z/wAz/zMz/2Yz/5kz/8wz//9mAABmADNmAGZmAJlmAMxmAP9mMwBmMzNmM2ZmM5lmM8xmM/9mZgBmZjNmZmZmZplmZsxmZv9mmQBmmTNmmWZmmZlmmcxmmf9mzABmzDNmzGZmzJlmzMxmzP9m/wBm/zNm/2Zm/5lm/8xm//+ZAACZADOZAGaZAJmZAMyZAP+ZMwCZMzOZM2aZM5mZM8yZM/+ZZgCZZjOZZmaZZpmZZsyZZv+ZmQCZmTOZmWaZmZmZmcyZmf+ZzACZzDOZzGaZzJmZzMyZzP+Z/wCZ/zOZ/2aZ/5mZ/8yZ///MAADMADPMAGbMAJnMAMzMAP/MMwDMMzPMM2bMM5nMM8zMM//MZgDMZjPMZmbMZpnMZszMZv/MmQDMmTPMmWbMmZnMmczMmf/MzADMzDPMzGbMzJnMzMzMzP/M/wDM/zPM/2bM/5nM/8zM////AAD/ADP/AGb/AJn/AMz/AP//MwD/MzP/M2b/M5n/M8z/M///ZgD/ZjP/Zmb/Zpn/Zsz/Zv//mQD/mTP/mWb/mZn/mcz/mf//zAD/zDP/zGb/zJn/zMz/zP///wD//zP//2b//5n//8z///+vVk0cAAAAAXRSTlMAQObYZgAAAAFiS0dEAIgFHUgAAAAJcEhZcwAADsMAAA7DAcdvqGQAAAAHdElNRQfiBhQNCxLf9h6RAAADrklEQVR42u2d7Y7aQAxFTRwtEqmigIJ4/zetun8qVe0Stti+43v9AOBz4plxPiYxqwv/HZNRhf8ZzOxM/O7E+P6vuFDTUxx+d2p+bnx3an7n5n+Gv/XGvz7jn6mPfvfyJ+d38TPzu/jFz8vv4hf/s7iS8/ctgJ2c38V/JM7k/C5+8XeMRQUgfmYB4he/BIifVoD4JeBg3FUA3PwXFQA3f0sBJxUAt4A7uwDxS4D4JYBXgApAAjQCDseqAuDmlwAJEL8EMPNLgEaABGgESIAEiF8CJCAwoyuxgPRKcywBW/pYAxPg5AIKpltY/iwDSAIqllxHFjCTCShqOmAE1LRdOAKKGk90ARONgOrWu1oAQOtZKqBs5b1hCDgDLb0lApxcAFjz8VXsNUn0ngMhV180Ad5YgJMLAG5AUtLAXoDjs3igr8DRSYT+uRdFWIpj4L+SaGj9Ob6B0OIaQMASOrzc4Q1854fPjQSAzS/pAuBm2EH4jxuY6vjPsccHvwSCk+vQCYI2WoPwHzcwN+XHngZS0nrgGkhKCnYaSEsJ1EBiQvQCVkQDqekADoLkZOAMpKcCZuCSf4KGJaAgEagSKEkDyEBREjAGylI4KuCjq4AfGCVQmADEICj9ewAD+PpjkzjwPPPFEQxsPQvA/VRbAmMswqWtCEQbVtiMgjTiMclMdVMPxonhSOeiRZckgC7HlFyUgrogV3BZEuyS7GdcuwpInwhHvCuRfHPKvbGBUW/NZt6hd1wDTQvghU+/NOVPGwQdHtZvyp8yDazQAhIM9NitEPq48oc3NtBkt8Kv2L/z6w94AS98DT5M7xgFELhtaRT+uI1rwwgI27o4Cn/tW6Wj4d6ehHUUULmBHUNA4SsMQAQczOPGLsD6Cih7kQ2MABtgBYoVYOgLULgAe9sJ1guxjCMg5j9XJAEG3IDkCDDU5TeLv+C1pmgCbuwCDK/7SBZgYM1HvgBDWnpLBJgEoLQef4mcb+9gdB5lBWCpnznBFGCo/GkCVnYBVt16/89d2ffE5xP+ixnnFGCWP9lIAKWATQUgARIgAcT8JxWABFDzS4BGgApAApj5TQXw5i06KgAJEL8ENBWgAlABSID4JaBV3FUA3PymAlABiF8CxP88ZhWA+JkFiL9lbOT8GgAqAPGLn5ffxC9+Zv4bOf+xAtjJ+RdyfhM/M/9Ezm/c/DM5v3Hz7+T8xs1v3PzGzS98Yv5ze/wH9cH/8vCfjJrfmPGNJKjhs19Hh82/mEKhUFTFT7Bm7Bd9Kgv4AAAAAElFTkSuQmCC'
 
 
+class ResourceDiscovery(QObject):
+    """Lists the GPIB resources on a worker thread and shares the result with all pickers.
+
+    The result of a scan is cached for 'TTL' seconds; 'request_scan()' within
+    that time returns without touching the bus. Scans never run on the GUI
+    thread and never in parallel. The signals are emitted from the worker
+    thread and therefore reach the widgets as queued events.
+    """
+
+    devices_changed = pyqtSignal(list)
+    scanning_changed = pyqtSignal(bool)
+
+    TTL = 30.0  # seconds
+
+    _instance = None  # type: Optional[ResourceDiscovery]
+
+    @classmethod
+    def instance(cls) -> 'ResourceDiscovery':
+        """Return the discovery service shared by all pickers."""
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._lock = Lock()
+        self._devices = []  # type: List[str]
+        self._scanned_at = None  # type: Optional[float]
+        self._scanning = False
+
+    @property
+    def devices(self) -> List[str]:
+        """The GPIB resources found by the last scan."""
+        return list(self._devices)
+
+    @property
+    def scanning(self) -> bool:
+        return self._scanning
+
+    def request_scan(self, force: bool = False) -> None:
+        """Start a scan unless one is running or, without 'force', the last one is recent."""
+        with self._lock:
+            if self._scanning:
+                return
+            if not force and self._scanned_at is not None and monotonic() - self._scanned_at < self.TTL:
+                return
+            self._scanning = True
+
+        self.scanning_changed.emit(True)
+        Thread(target=self._scan, name='GPIB discovery', daemon=True).start()
+
+    def _scan(self) -> None:
+        devices = []
+        try:
+            from visa import ResourceManager
+
+            rm = ResourceManager('@py')
+            try:
+                devices = [x for x in rm.list_resources() if 'GPIB' in x]
+            finally:
+                rm.close()
+        except Exception as error:
+            print('WARNING', 'GPIB scan failed: {}'.format(error))
+
+        with self._lock:
+            self._devices = devices
+            self._scanned_at = monotonic()
+            self._scanning = False
+
+        self.devices_changed.emit(list(devices))
+        self.scanning_changed.emit(False)
+
+
 class GPIBPicker(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -21,14 +96,22 @@ class GPIBPicker(QWidget):
         pm.loadFromData(b64decode(REFRESH_ICON))
         icon = QIcon(pm)
 
-        button = QPushButton(self)
-        button.setIcon(icon)
+        self._button = QPushButton(self)
+        self._button.setIcon(icon)
 
-        button.clicked.connect(self.update_devices)
+        self._discovery = ResourceDiscovery.instance()
+        self._button.clicked.connect(lambda: self._discovery.request_scan(force=True))
 
-        layout.addWidget(button)
+        layout.addWidget(self._button)
 
         self._resources = []
+        # Shown even before (or without) a scan finding it, e.g. the default of an input:
+        self._preferred_address = None  # type: Optional[str]
+
+        self._discovery.devices_changed.connect(self._set_devices)
+        self._discovery.scanning_changed.connect(self._set_scanning)
+        self._set_scanning(self._discovery.scanning)
+        self._set_devices(self._discovery.devices)
 
         self.update_devices()
 
@@ -37,27 +120,34 @@ class GPIBPicker(QWidget):
         return self._combobox.currentText()
 
     def update_devices(self):
-        rm = ResourceManager('@py')
+        """Ask for a new scan; returns at once and the list is updated when the scan is done."""
+        self._discovery.request_scan()
 
-        try:
-            self._resources = [ x for x in rm.list_resources() if 'GPIB' in x]
-        except:
-            self._resources = []
+    def _set_scanning(self, scanning: bool) -> None:
+        self._button.setEnabled(not scanning)
+
+    def _set_devices(self, devices: List[str]) -> None:
+        current = self._combobox.currentText() or self._preferred_address
+
+        self._resources = list(devices)
+        if self._preferred_address and self._preferred_address not in self._resources:
+            self._resources.insert(0, self._preferred_address)
 
         self._combobox.clear()
 
         for item in self._resources:
             self._combobox.addItem(item)
 
-        rm.close()
+        if current in self._resources:
+            self._combobox.setCurrentIndex(self._resources.index(current))
 
     def select_device(self, address):
+        self._preferred_address = address
+        if address not in self._resources:
+            self._set_devices(self._discovery.devices)
         if address in self._resources:
             index = self._resources.index(address)
             self._combobox.setCurrentIndex(index)
 
     def text(self):
         return self._combobox.currentText()
-
-
-
@@ -7,18 +7,32 @@ import matplotlib
 matplotlib.use('Qt5Agg')
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
+from matplotlib.dates import date2num
 
-from pandas import DataFrame
-from typing import List, Tuple
+import numpy as np
+from typing import List, Optional, Tuple
 
 from measurement.measurement import PlotRecommendation
 
 
 class PlotWidget(FigureCanvas):
+    """Live plot of a growing data set.
+
+    The data is kept in one Line2D artist whose data is replaced with
+    'set_data()'. As long as new points fall into the current axis limits,
+    only the new points are drawn on top of a cached background and blitted
+    to the screen, so the cost of an update does not depend on the number of
+    points already shown. The limits grow in steps with some headroom; only
+    then a full redraw is done.
+    """
+
+    # Headroom added to the data range when the axis limits have to grow:
+    LIMIT_MARGIN = 0.25
+
     def __init__(self, recommendation, parent=None, width: int = 5,
                  height: int = 4, dpi: int = 72,
                  x_axis_label: str = '', y_axis_label: str = '',
-                 title_suffix: str = "") -> None:
+                 title_suffix: str = "", style: str = 'x') -> None:
         self._figure = Figure(figsize=(width, height), dpi=dpi)
         self._axes = self._figure.add_subplot(111)
 
@@ -27,31 +41,142 @@ class PlotWidget(FigureCanvas):
         self._y_axis_label = y_axis_label
         self._title_suffix = title_suffix
 
+        self._axes.set_title("{} {}".format(self._recommendation.title, self._title_suffix))
+        self._axes.set_xlabel(self._x_axis_label)
+        self._axes.set_ylabel(self._y_axis_label)
+
+        self._data_line, = self._axes.plot([], [], style)
+        # Only holds the points added since the last frame:
+        self._tail_line, = self._axes.plot([], [], style, animated=True,
+                                           color=self._data_line.get_color())
+        self._fit_line, = self._axes.plot([], [], '-', animated=True)
+        self._fit_text = self._axes.text(0.2, 0.9, '', horizontalalignment='center',
+                                         verticalalignment='center',
+                                         transform=self._axes.transAxes, animated=True)
+
+        self._background = None
+        self._view_limits = None  # type: Optional[Tuple[float, float, float, float]]
+        self._data_limits = None  # type: Optional[Tuple[float, float, float, float]]
+        self._number_of_points = 0
+        self._dates_enabled = False
+
         super().__init__(self._figure)
         self.setParent(parent)
 
         super().setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
         super().updateGeometry()
 
-    def update_figure(self, x_data: List[float], y_data: List[float]) -> None:
-        self._axes.cla()
-        self._axes.set_title("{} {}".format(self._recommendation.title, self._title_suffix))
-        self._axes.set_xlabel(self._x_axis_label)
-        self._axes.set_ylabel(self._y_axis_label)
-        self.add_figure(x_data, y_data)
+        self.mpl_connect('draw_event', self._on_draw)
+
+    def update_figure(self, x_data: np.ndarray, y_data: np.ndarray) -> None:
+        """Show 'x_data' and 'y_data', which extend the data of the last call."""
+        x_data = np.asarray(x_data)
+        y_data = np.asarray(y_data)
+
+        if len(x_data) < self._number_of_points:
+            # Not a continuation of the current data set: start over.
+            self._number_of_points = 0
+            self._data_limits = None
+
+        if np.issubdtype(x_data.dtype, np.datetime64) and not self._dates_enabled:
+            self._axes.xaxis_date()
+            self._dates_enabled = True
+
+        start = max(self._number_of_points - 1, 0)
+        new_x, new_y = x_data[start:], y_data[start:]
+        self._number_of_points = len(x_data)
+
+        self._data_line.set_data(x_data, y_data)
+        self._tail_line.set_data(new_x, new_y)
+
+        self._include_in_data_limits(new_x, new_y)
+
+        if self._background is None or self._limits_exceeded():
+            self._expand_view_limits()
+            self.draw()
+        else:
+            self._blit_tail()
 
-    def add_figure(self, x_data: List[float], y_data: List[float], style='x') -> None:
-        self._axes.plot(x_data, y_data, style)
-        self.draw()
+    def set_fit(self, x_data: np.ndarray, y_data: np.ndarray, text: str = '') -> None:
+        """Set the fit line and its annotation; shown with the next update."""
+        self._fit_line.set_data(x_data, y_data)
+        self._fit_text.set_text(text)
 
-    def add_text(self, text: str, x: float = 0.2, y: float = 0.9) -> None:
-        self._axes.text(x, y, text, horizontalalignment='center',
-                        verticalalignment='center', transform=self._axes.transAxes)
-        self.draw()
+    def _include_in_data_limits(self, x_data: np.ndarray, y_data: np.ndarray) -> None:
+        x_values = self._to_numbers(x_data)
+        y_values = self._to_numbers(y_data)
+        finite = np.isfinite(x_values) & np.isfinite(y_values)
+        if not finite.any():
+            return
+
+        x_values, y_values = x_values[finite], y_values[finite]
+        limits = (x_values.min(), x_values.max(), y_values.min(), y_values.max())
+        if self._data_limits is not None:
+            limits = (min(limits[0], self._data_limits[0]), max(limits[1], self._data_limits[1]),
+                      min(limits[2], self._data_limits[2]), max(limits[3], self._data_limits[3]))
+        self._data_limits = limits
+
+    @staticmethod
+    def _to_numbers(data: np.ndarray) -> np.ndarray:
+        if np.issubdtype(data.dtype, np.datetime64):
+            return date2num(data)
+        return np.asarray(data, dtype=float)
+
+    def _limits_exceeded(self) -> bool:
+        if self._data_limits is None:
+            return False
+        if self._view_limits is None:
+            return True
+
+        x_min, x_max, y_min, y_max = self._data_limits
+        view_x_min, view_x_max, view_y_min, view_y_max = self._view_limits
+        return x_min < view_x_min or x_max > view_x_max or y_min < view_y_min or y_max > view_y_max
+
+    def _expand_view_limits(self) -> None:
+        if self._data_limits is None:
+            return
+
+        def padded(low: float, high: float) -> Tuple[float, float]:
+            span = high - low
+            if span == 0:
+                span = abs(high) if high != 0 else 1.0
+            return low - self.LIMIT_MARGIN * span, high + self.LIMIT_MARGIN * span
+
+        x_min, x_max, y_min, y_max = self._data_limits
+        self._view_limits = padded(x_min, x_max) + padded(y_min, y_max)
+        self._axes.set_xlim(self._view_limits[0], self._view_limits[1])
+        self._axes.set_ylim(self._view_limits[2], self._view_limits[3])
+
+    def _on_draw(self, event) -> None:
+        """Cache the freshly drawn background and draw the animated artists on top."""
+        self._background = self.copy_from_bbox(self._axes.bbox)
+        self._draw_overlay()
+
+    def _blit_tail(self) -> None:
+        """Draw only the newest points onto the cached background."""
+        self.restore_region(self._background)
+        self._axes.draw_artist(self._tail_line)
+        # The new points become part of the background for the next frame:
+        self._background = self.copy_from_bbox(self._axes.bbox)
+        self._draw_overlay()
+        self.blit(self._axes.bbox)
+
+    def _draw_overlay(self) -> None:
+        self._axes.draw_artist(self._fit_line)
+        self._axes.draw_artist(self._fit_text)
 
     def save_figure(self, plot_path: str) -> None:
         """Save plot to 'plot_path' as PDF."""
-        self._figure.savefig(plot_path)
+        # Animated artists are skipped by a regular draw:
+        overlay = [self._fit_line, self._fit_text]
+        for artist in overlay:
+            artist.set_animated(False)
+        try:
+            self._figure.savefig(plot_path)
+        finally:
+            for artist in overlay:
+                artist.set_animated(True)
+            self.draw()
 
 
 class PlotWindow(QMdiSubWindow):
@@ -76,17 +201,15 @@ class PlotWindow(QMdiSubWindow):
         window_icon_pixmap.fill(Qt.transparent)
         self.setWindowIcon(QIcon(window_icon_pixmap))
 
-    def update_data(self, data: DataFrame) -> None:
+    def update_data(self, x_data: np.ndarray, y_data: np.ndarray) -> None:
         """
         Updates the plot view with new data :)
-        :param data: A Pandas DataFrame with the containing data
+        :param x_data: column view of the x values
+        :param y_data: column view of the y values
         :return:
         """
-        if data.columns.size > 1:
-            x_data = list(data.ix[:, 0])
-            y_data = list(data.ix[:, 1])
-            self._plot_widget.update_figure(x_data, y_data)
-            if self._recommendation.show_fit:
+        if len(x_data) > 0:
+            if self._recommendation.show_fit and len(x_data) > 1:
                 param_dict, fit_data = self._recommendation.fit(x_data, y_data)
                 show_text_lines = []
                 for param, value in param_dict.items():
@@ -94,10 +217,51 @@ class PlotWindow(QMdiSubWindow):
 
                 show_text = '\n'.join(show_text_lines)
 
-                self._plot_widget.add_figure(fit_data[:, 0], fit_data[:, 1], '-')
-                self._plot_widget.add_text(show_text)
+                self._plot_widget.set_fit(fit_data[:, 0], fit_data[:, 1], show_text)
+            self._plot_widget.update_figure(x_data, y_data)
 
     def save_plot(self, file_path: str) -> None:
         """Save this plot to file as PDF."""
         self._plot_widget.save_figure(file_path)
-        
+
+
+if __name__ == '__main__':
+    # Benchmark: time per update while the number of points grows.
+    import os
+    import sys
+    from time import perf_counter
+    from PyQt5.QtWidgets import QApplication
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    app = QApplication(sys.argv)
+
+    recommendation = PlotRecommendation('Benchmark', x_label='x', y_label='y')
+    widget = PlotWidget(recommendation, x_axis_label='x', y_axis_label='y')
+    widget.resize(640, 480)
+    widget.show()
+    app.processEvents()
+
+    total = 100000
+    batch = 100
+    x = np.arange(total, dtype=float)
+    y = np.sin(x / 1000) + np.random.normal(scale=0.1, size=total)
+
+    checkpoints = {1000, 10000, 50000, 100000}
+    frame_times = []
+    for end in range(batch, total + 1, batch):
+        start_time = perf_counter()
+        widget.update_figure(x[:end], y[:end])
+        frame_times.append(perf_counter() - start_time)
+        if end in checkpoints:
+            recent = frame_times[-10:]
+            print('{:>7d} points: {:7.3f} ms per update (median of last 10), '
+                  'slowest update so far {:7.1f} ms'.format(end, 1000 * np.median(recent),
+                                                            1000 * max(frame_times)))
+
+    # Reference: what the old cla() + plot() + draw() update cost at the end.
+    axes = widget._axes
+    start_time = perf_counter()
+    axes.cla()
+    axes.plot(x, y, 'x')
+    widget.draw()
+    print('full replot of {} points: {:7.3f} ms'.format(total, 1000 * (perf_counter() - start_time)))
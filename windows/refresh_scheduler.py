@@ -0,0 +1,75 @@
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from time import monotonic
+
+
+class RefreshScheduler(QObject):
+    """Coalesces incoming data into view refreshes at a capped frame rate.
+
+    Data sources call 'mark_dirty()' as often as they like; the 'refresh'
+    signal is emitted at most 'max_rate' times per second and only if
+    something changed since the last refresh. If a refresh takes longer than
+    a frame, the following frames are dropped so that the event loop stays
+    responsive.
+    """
+
+    refresh = pyqtSignal()
+
+    DEFAULT_MAX_RATE = 20.0  # Hz
+
+    def __init__(self, max_rate: float = DEFAULT_MAX_RATE, parent: QObject = None) -> None:
+        """
+        :param max_rate: Maximum number of refreshes per second
+        """
+        super().__init__(parent)
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self._tick)
+
+        self._dirty = False
+        self._next_frame = 0.0
+        self._interval = 1.0
+        self.dropped_frames = 0
+
+        self.max_rate = max_rate
+
+    @property
+    def max_rate(self) -> float:
+        return 1.0 / self._interval
+
+    @max_rate.setter
+    def max_rate(self, rate: float) -> None:
+        if rate <= 0:
+            raise ValueError('Refresh rate must be positive, got {}.'.format(rate))
+        self._interval = 1.0 / rate
+        self._timer.setInterval(int(round(1000 * self._interval)))
+
+    def mark_dirty(self) -> None:
+        """Request a refresh with the next frame."""
+        self._dirty = True
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def flush(self) -> None:
+        """Refresh immediately if there is anything new, e.g. at the end of a measurement."""
+        if self._dirty:
+            self._render()
+
+    def _tick(self) -> None:
+        if not self._dirty:
+            # Nothing came in during the last frame; sleep until the next 'mark_dirty()':
+            self._timer.stop()
+            return
+
+        if monotonic() < self._next_frame:
+            self.dropped_frames += 1
+            return
+
+        self._render()
+
+    def _render(self) -> None:
+        self._dirty = False
+        start = monotonic()
+        self.refresh.emit()
+        duration = monotonic() - start
+        # Leave at least as much time to the event loop as rendering took:
+        self._next_frame = start + max(self._interval, 2 * duration)
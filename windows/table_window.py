@@ -1,41 +1,103 @@
-from PyQt5.QtWidgets import QMdiSubWindow, QTableView
+from PyQt5.QtWidgets import QMdiSubWindow, QTableView, QHeaderView
 from PyQt5.QtCore import QAbstractTableModel, Qt, QVariant, QModelIndex
 
-import pandas
+from collections import OrderedDict
+from typing import Optional, Tuple
 
-class PandasTableDataModel(QAbstractTableModel):
-    """This helps to display pandas DataFrames in a TableView"""
-    def __init__(self, data: pandas.DataFrame) -> None:
-        """Makes a pandas DataFrame readable to a Qt TableView
-        :param data: the pandas DataFrame you want to show
+from data_store import DataStore
+
+
+class DataStoreTableModel(QAbstractTableModel):
+    """This helps to display a growing DataStore in a TableView
+
+    The model is append-only: new rows of the store are announced to the view
+    with 'rows_appended()' instead of rebuilding the model. Cells are only
+    formatted when the view asks for them, i.e. when they become visible, and
+    the formatted rows are kept in a bounded cache.
+    """
+
+    MAX_CACHED_ROWS = 4096
+
+    def __init__(self, data: Optional[DataStore] = None) -> None:
+        """Makes a DataStore readable to a Qt TableView
+        :param data: the DataStore you want to show
         """
         super().__init__()
         self.__data = data
+        self.__column_names = data.column_names if data is not None else []
+        self.__row_count = len(data) if data is not None else 0
+        self.__row_cache = OrderedDict()  # type: OrderedDict[int, Tuple[str, ...]]
+
+    @property
+    def store(self) -> Optional[DataStore]:
+        return self.__data
+
+    def set_store(self, data: DataStore) -> None:
+        """Show a different DataStore, e.g. the one of a new measurement."""
+        self.beginResetModel()
+        self.__data = data
+        self.__column_names = data.column_names
+        self.__row_count = len(data)
+        self.__row_cache.clear()
+        self.endResetModel()
+
+    def rows_appended(self) -> None:
+        """Announce rows (and columns) which were appended to the store since the last call."""
+        if self.__data is None:
+            return
+
+        column_names = self.__data.column_names
+        if len(column_names) > len(self.__column_names):
+            self.beginInsertColumns(QModelIndex(), len(self.__column_names), len(column_names) - 1)
+            self.__column_names = column_names
+            self.__row_cache.clear()
+            self.endInsertColumns()
+
+        row_count = len(self.__data)
+        if row_count > self.__row_count:
+            self.beginInsertRows(QModelIndex(), self.__row_count, row_count - 1)
+            self.__row_count = row_count
+            self.endInsertRows()
 
     def rowCount(self, parent: QModelIndex = None, *args, **kwargs) -> int:
-        """returns the row count of the DataFrame
+        """returns the row count of the DataStore
         :return: row count
         """
-        return len(self.__data)
+        return self.__row_count
 
     def columnCount(self, parent: QModelIndex = None, *args, **kwargs) -> int:
-        """returns the column count of the DataFrame
+        """returns the column count of the DataStore
         :return: column count
         """
-        return self.__data.columns.size
+        return len(self.__column_names)
 
     def data(self, index: QModelIndex, role: int = Qt.DisplayRole) -> QVariant:
-        """return a value of the DataFrame at a certain index
+        """return a value of the DataStore at a certain index
         :param index: the index where the data should be
         :param role: some Qt specific stuff
-        :return: value in DataFrame
+        :return: value in DataStore
         """
         if index.isValid():
             if role == Qt.DisplayRole:
-                value = self.__data.values[index.row()][index.column()]
-                return QVariant(str(value))
+                return QVariant(self.__formatted_row(index.row())[index.column()])
         return QVariant()
 
+    def __formatted_row(self, row: int) -> Tuple[str, ...]:
+        """Return the cell strings of a row, formatting and caching them on first use."""
+        try:
+            self.__row_cache.move_to_end(row)
+            return self.__row_cache[row]
+        except KeyError:
+            pass
+
+        formatted = tuple(str(self.__data.column(name)[row]) for name in self.__column_names)
+
+        self.__row_cache[row] = formatted
+        if len(self.__row_cache) > self.MAX_CACHED_ROWS:
+            self.__row_cache.popitem(last=False)
+
+        return formatted
+
     def headerData(self, index: QModelIndex, orientation: Qt.Orientation = Qt.Horizontal,
                    role: int = Qt.DisplayRole) -> QVariant:
         """returns column and row header labels
@@ -45,7 +107,7 @@ class PandasTableDataModel(QAbstractTableModel):
         :return: column or row name
         """
         if orientation == Qt.Horizontal and role == Qt.DisplayRole:
-            return QVariant(str(self.__data.columns[index]))
+            return QVariant(str(self.__column_names[index]))
         elif orientation == Qt.Vertical and role == Qt.DisplayRole:
             return QVariant(str(index))
         return QVariant()
@@ -60,21 +122,35 @@ class TableWindow(QMdiSubWindow):
         self.setWindowFlags(Qt.WindowTitleHint | Qt.CustomizeWindowHint)
 
         self.__table = QTableView()
+        self.__model = DataStoreTableModel()
+        self.__table.setModel(self.__model)
+
+        # Fixed row heights keep Qt from measuring every row of large tables:
+        vertical_header = self.__table.verticalHeader()
+        vertical_header.setSectionResizeMode(QHeaderView.Fixed)
+        vertical_header.setDefaultSectionSize(self.__table.fontMetrics().height() + 6)
 
         self.setWidget(self.__table)
         self.setWindowTitle('Table')
 
-    def update_data(self, data: pandas.DataFrame) -> None:
+    def update_data(self, data: DataStore) -> None:
         """
         Updates the table view with new data
-        :param data: A Pandas DataFrame with the containing Data
+        :param data: The DataStore containing the data
         :return:
         """
-        model = PandasTableDataModel(data)
-        self.__table.setModel(model)
-        self.__table.scrollToBottom()
+        scroll_bar = self.__table.verticalScrollBar()
+        follow = scroll_bar.value() == scroll_bar.maximum()
+
+        if data is not self.__model.store:
+            self.__model.set_store(data)
+        else:
+            self.__model.rows_appended()
+
+        # Only follow new rows if the user has not scrolled away from the end:
+        if follow:
+            self.__table.scrollToBottom()
 
     @property
     def selected_columns(self) -> int:
         return 0
-